@@ -1,13 +1,27 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for, session
+from flask import Flask, Response, g, request, jsonify, render_template, redirect, url_for, session
 import pandas as pd
 import numpy as np
+import io
 import os
 import logging
+import time
 from datetime import datetime
-import joblib
-from sklearn.preprocessing import StandardScaler, LabelEncoder
-from tensorflow.keras.models import load_model
+import json
 import traceback
+import signal
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from matching import SimilarityEngine, ExactMatchIndex
+from dataset_cache import load_dataset as load_cached_dataset
+from inference import load_serving_model, FeatureEncoder, TreeStudent
+from pipeline import score_batch, stream_scored_csv, top_k_classes, ranking_entries
+from batching import MicroBatcher
+from cache import RecommendationCache
+from registry import ArtifactRegistry
+from grid import RecommendationGrid, model_digest, GRID_DIR, GRID_META
+from history import HistoryStore
+from metrics import MetricsRegistry, SamplingProfiler
+from carbon import CarbonEngine, read_plots, comparison_entries, RESULT_COLS
+from metadata import DatasetMetadata
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -16,43 +30,272 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__, static_folder='static', template_folder='templates')
 app.secret_key = 'agromart_secret_key_2024'  # Change this in production
 
-# Global variables for model and data
-df = None
-model = None
-preprocessor = None
-fertilizer_encoder = None
+# Fields every prediction payload must carry
+REQUIRED_FIELDS = ['Temperature', 'Humidity', 'Moisture', 'Nitrogen',
+                   'Phosphorus', 'Potassium', 'Soil Type', 'Crop Type']
 
-def load_data_and_model():
-    """Load dataset and ML model if available"""
-    global df, model, preprocessor, fertilizer_encoder
+# Largest number of samples accepted by /predict/batch
+MAX_BATCH_ROWS = 10000
+# Most plots accepted by one /api/carbon-footprint call
+MAX_CARBON_PLOTS = 200000
+# Fertilizers ranked for a fused footprint (footprint=1) unless top_k is given
+FOOTPRINT_TOP_K = 3
+# Seconds between progress log lines while /predict/csv streams
+CSV_PROGRESS_INTERVAL = 5.0
+
+# Micro-batching of concurrent single-row model calls (AGROSMART_MICROBATCH=0 disables it)
+MICROBATCH_ENABLED = os.environ.get('AGROSMART_MICROBATCH', '1') != '0'
+MICROBATCH_MAX_SIZE = int(os.environ.get('AGROSMART_MICROBATCH_MAX_SIZE', '64'))
+MICROBATCH_MAX_WAIT_MS = float(os.environ.get('AGROSMART_MICROBATCH_MAX_WAIT_MS', '2'))
+
+# Recommendation cache for repeated /predict inputs (AGROSMART_CACHE_SIZE=0 disables it)
+CACHE_SIZE = int(os.environ.get('AGROSMART_CACHE_SIZE', '10000'))
+CACHE_TTL_SECONDS = float(os.environ.get('AGROSMART_CACHE_TTL_SECONDS', '3600'))
+
+# Load artifacts in the background so the app starts serving immediately
+# (AGROSMART_BACKGROUND_LOAD=1); /predict uses the dataset fallbacks until the model is ready
+BACKGROUND_LOAD = os.environ.get('AGROSMART_BACKGROUND_LOAD', '0') == '1'
+
+# SQLite file holding every user's recommendation history (empty disables it)
+HISTORY_DB = os.environ.get('AGROSMART_HISTORY_DB', 'agrosmart_history.db')
+# Page size limits for /api/history
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+
+# Hot reload: poll the artifact files every N seconds and swap in changed versions
+# (AGROSMART_WATCH_INTERVAL=0 disables it; POST /api/admin/reload works either way)
+WATCH_INTERVAL = float(os.environ.get('AGROSMART_WATCH_INTERVAL', '0'))
+# Optional token required by /api/admin/reload in the X-Admin-Token header
+ADMIN_TOKEN = os.environ.get('AGROSMART_ADMIN_TOKEN')
+# Dataset rows run through a new artifact version before it takes traffic
+WARMUP_ROWS = 8
+
+# Tiered ML serving: the distilled tree student (python model.py distill) answers
+# when its confidence reaches this percentage, otherwise the request escalates to
+# the network. AGROSMART_TIERED=0 always uses the network.
+TIERED_ENABLED = os.environ.get('AGROSMART_TIERED', '1') != '0'
+STUDENT_MIN_CONFIDENCE = float(os.environ.get('AGROSMART_STUDENT_MIN_CONFIDENCE', '90'))
+# Answer inputs inside uniform cells of the precomputed grid (python grid.py build)
+# without a model call (AGROSMART_GRID=0 disables it)
+GRID_ENABLED = os.environ.get('AGROSMART_GRID', '1') != '0'
+
+# Per-request latency budget for the ML model in milliseconds. The dataset fallbacks
+# run concurrently with it, and a model that misses the deadline is answered for by
+# the best fallback (0 runs the stages strictly in sequence)
+PREDICT_DEADLINE_MS = float(os.environ.get('AGROSMART_PREDICT_DEADLINE_MS', '0'))
+# Threads racing the model and the fallbacks (each path has its own pool, so a stuck
+# model cannot starve the fallbacks)
+RACE_POOL_WORKERS = int(os.environ.get('AGROSMART_RACE_POOL_WORKERS', '16'))
+
+# Set by serve.py in its master process, which loads the artifacts once and forks the
+# workers: threads do not survive fork(), so the master starts none and each worker
+# starts its own in init_worker()
+PREFORK = os.environ.get('AGROSMART_PREFORK', '0') == '1'
+
+# Prometheus text-format metrics on /metrics (AGROSMART_METRICS=0 disables the endpoint)
+METRICS_ENABLED = os.environ.get('AGROSMART_METRICS', '1') != '0'
+# Start the sampling profiler at boot with this interval in milliseconds (0 leaves it
+# off; it can be started and stopped at runtime through /api/admin/profiler)
+PROFILER_INTERVAL_MS = float(os.environ.get('AGROSMART_PROFILER_INTERVAL_MS', '0'))
+
+DATASET_PATH = "Fertilizer_Prediction_gpt(1).csv"
+MODEL_PATH = "best_fertilizer_model.h5"
+NPZ_MODEL_PATH = "best_fertilizer_model.npz"
+PREPROCESSOR_PATH = "preprocessor.pkl"
+FERTILIZER_ENCODER_PATH = "fertilizer_encoder.pkl"
+STUDENT_PATH = "student_model.pkl"
+
+# Components of an artifact set (see registry.ArtifactSet)
+ARTIFACT_COMPONENTS = ('df', 'matcher', 'exact_index', 'model', 'batcher', 'preprocessor',
+                       'feature_encoder', 'fertilizer_encoder', 'class_names', 'student', 'grid', 'metadata')
+
+recommendation_cache = RecommendationCache(CACHE_SIZE, CACHE_TTL_SECONDS)
+history_store = HistoryStore(HISTORY_DB) if HISTORY_DB and not PREFORK else None
+# False in the serve.py master until a forked worker calls init_worker()
+threads_allowed = not PREFORK
+carbon_engine = CarbonEngine()
+# Served while no dataset is loaded
+EMPTY_METADATA = DatasetMetadata()
+
+metrics = MetricsRegistry()
+profiler = SamplingProfiler()
+HTTP_SECONDS = metrics.histogram('agrosmart_http_request_seconds', 'Request latency by endpoint', ['endpoint'])
+HTTP_RESPONSES = metrics.counter('agrosmart_http_responses_total', 'Responses by endpoint and status code',
+                                 ['endpoint', 'status'])
+STAGE_SECONDS = metrics.histogram('agrosmart_stage_seconds', 'Time spent in each /predict stage', ['stage'])
+ML_TIER_SECONDS = metrics.histogram('agrosmart_ml_tier_seconds',
+                                    'ML model latency by the tier that answered (grid, student, teacher)', ['tier'])
+PREDICTIONS = metrics.counter('agrosmart_predictions_total', '/predict recommendations by the method that served them',
+                              ['method', 'cached'])
+FALLBACKS = metrics.counter('agrosmart_fallbacks_total',
+                            'Requests a stage did not answer, passing them on to the next stage', ['stage'])
+STAGE_ERRORS = metrics.counter('agrosmart_stage_errors_total', 'Exceptions raised inside a stage', ['stage'])
+DEADLINE_MISSES = metrics.counter('agrosmart_deadline_misses_total',
+                                  'Requests whose ML model missed the latency budget, by the path that answered',
+                                  ['method'])
+
+ml_pool = ThreadPoolExecutor(RACE_POOL_WORKERS, thread_name_prefix='race-ml') if PREDICT_DEADLINE_MS > 0 else None
+fallback_pool = ThreadPoolExecutor(RACE_POOL_WORKERS, thread_name_prefix='race-fallback') if PREDICT_DEADLINE_MS > 0 else None
+
+def batched_model_fn(serving_model):
+    """Model call the micro-batcher runs on stacked feature rows"""
+    return lambda rows: serving_model.predict(rows.reshape((len(rows), 1, rows.shape[-1])), verbose=0)
+
+def load_dataset():
+    """Load the CSV and build the dataset match indexes"""
+    if not os.path.exists(DATASET_PATH):
+        logger.error("Dataset file not found")
+        return None
     
+    # Memory-mapped columnar copy of the CSV, rebuilt when the CSV changes
+    dataset = load_cached_dataset(DATASET_PATH)
+    logger.info(f"Dataset loaded successfully with {len(dataset)} records")
+    return {
+        'df': dataset,
+        'matcher': SimilarityEngine(dataset),
+        'exact_index': ExactMatchIndex(dataset),
+        'metadata': DatasetMetadata(dataset)
+    }
+
+def load_ml_model():
+    """Load ML model weights into the NumPy runtime (exported from the .h5 on first use)"""
     try:
-        # Load dataset
-        if os.path.exists("Fertilizer_Prediction_gpt(1).csv"):
-            df = pd.read_csv("Fertilizer_Prediction_gpt(1).csv")
-            logger.info(f"Dataset loaded successfully with {len(df)} records")
-        else:
-            logger.error("Dataset file not found")
-            
-        # Load ML model if exists
-        if os.path.exists("best_fertilizer_model.h5"):
-            model = load_model("best_fertilizer_model.h5")
-            logger.info("ML model loaded successfully")
-            
-        # Load preprocessor and encoder
-        if os.path.exists("preprocessor.pkl"):
-            preprocessor = joblib.load("preprocessor.pkl")
-            logger.info("Preprocessor loaded successfully")
-            
-        if os.path.exists("fertilizer_encoder.pkl"):
-            fertilizer_encoder = joblib.load("fertilizer_encoder.pkl")
-            logger.info("Fertilizer encoder loaded successfully")
-            
-    except Exception as e:
-        logger.error(f"Error loading data/model: {str(e)}")
+        serving_model = load_serving_model(MODEL_PATH, NPZ_MODEL_PATH)
+    except ImportError:
+        # h5py is unavailable to export the weights; fall back to Keras, imported only now
+        from tensorflow.keras.models import load_model
+        serving_model = load_model(MODEL_PATH) if os.path.exists(MODEL_PATH) else None
+    if serving_model is None:
+        return None
+    
+    batcher = None
+    if MICROBATCH_ENABLED and threads_allowed:
+        batcher = MicroBatcher(batched_model_fn(serving_model), MICROBATCH_MAX_SIZE, MICROBATCH_MAX_WAIT_MS)
+    logger.info("ML model loaded successfully")
+    return {'model': serving_model, 'batcher': batcher}
+
+def load_preprocessor():
+    """Load the fitted preprocessor and compile it into the fast encoder"""
+    if not os.path.exists(PREPROCESSOR_PATH):
+        return None
+    
+    import joblib
+    loaded = joblib.load(PREPROCESSOR_PATH)
+    feature_encoder = None
+    try:
+        feature_encoder = FeatureEncoder.from_preprocessor(loaded)
+    except ValueError as e:
+        logger.warning(f"Using sklearn preprocessor, could not compile encoder: {str(e)}")
+    logger.info("Preprocessor loaded successfully")
+    return {'preprocessor': loaded, 'feature_encoder': feature_encoder}
+
+def load_fertilizer_encoder():
+    """Load the fertilizer label encoder"""
+    if not os.path.exists(FERTILIZER_ENCODER_PATH):
+        return None
+    
+    import joblib
+    fertilizer_encoder = joblib.load(FERTILIZER_ENCODER_PATH)
+    logger.info("Fertilizer encoder loaded successfully")
+    # Class index -> name lookups index this array instead of calling inverse_transform
+    class_names = np.array([str(name) for name in fertilizer_encoder.classes_], dtype=object)
+    return {'fertilizer_encoder': fertilizer_encoder, 'class_names': class_names}
+
+def load_student():
+    """Load the distilled student if it was distilled from the current model, preprocessor and encoder"""
+    if not TIERED_ENABLED or not os.path.exists(STUDENT_PATH):
+        return None
+    
+    student = TreeStudent.load(STUDENT_PATH)
+    if os.path.exists(MODEL_PATH) and student.teacher != model_digest(MODEL_PATH, PREPROCESSOR_PATH, FERTILIZER_ENCODER_PATH):
+        logger.warning("Ignoring the student model, it was distilled from another version of the ML model")
+        return None
+    logger.info(f"Student model loaded successfully ({student.report.get('agreement', 0):.2%} agreement)")
+    return {'student': student}
+
+def load_grid():
+    """Memory-map the recommendation grid if it was built from the current model"""
+    if not GRID_ENABLED:
+        return None
+    
+    grid = RecommendationGrid.load(GRID_DIR)
+    if grid is None:
+        return None
+    if grid.model_digest != model_digest(MODEL_PATH, PREPROCESSOR_PATH, FERTILIZER_ENCODER_PATH):
+        logger.warning("Ignoring the recommendation grid, it was built from another version of the model; "
+                       "run python grid.py build")
+        return None
+    logger.info(f"Recommendation grid loaded successfully ({grid.meta['uniform_share']:.1%} of cells uniform)")
+    return {'grid': grid}
+
+ARTIFACT_LOADERS = {
+    'dataset': load_dataset,
+    'model': load_ml_model,
+    'preprocessor': load_preprocessor,
+    'fertilizer_encoder': load_fertilizer_encoder,
+    'student': load_student,
+    'grid': load_grid,
+}
+
+def warm_up(artifacts):
+    """Run a few dataset rows through a new artifact version before it takes traffic.
+    
+    Raises when the ML model cannot serve them, so a broken version is rejected.
+    """
+    if artifacts.df is None:
+        return
+    
+    samples = artifacts.df.head(WARMUP_ROWS)[REQUIRED_FIELDS].to_dict('records')
+    for sample in samples:
+        input_row = parse_input_row(sample)
+        if artifacts.ml_ready and predict_with_ml_model(input_row, artifacts) is None:
+            raise RuntimeError('ML model failed on the warm-up samples')
+        predict_with_dataset(input_row, artifacts)
+        find_closest_match(input_row, artifacts)
+    logger.info(f"Warmed up artifact version {artifacts.version} with {len(samples)} samples")
+
+def close_artifacts(artifacts):
+    """Stop the micro-batcher of a retired artifact version"""
+    if artifacts.batcher is not None:
+        artifacts.batcher.close()
+
+def artifacts_swapped(artifacts):
+    # Cached answers came from the previous version or the loading-time fallbacks
+    recommendation_cache.clear()
+
+registry = ArtifactRegistry(
+    ARTIFACT_LOADERS,
+    watch_paths=[DATASET_PATH, MODEL_PATH, PREPROCESSOR_PATH, FERTILIZER_ENCODER_PATH, STUDENT_PATH,
+                 os.path.join(GRID_DIR, GRID_META)],
+    components=ARTIFACT_COMPONENTS,
+    warmup=warm_up,
+    cleanup=close_artifacts,
+    on_swap=artifacts_swapped
+)
 
-# Load data and model on startup
-load_data_and_model()
+def last_load_seconds():
+    started, finished = registry.load_started_at, registry.load_finished_at
+    return finished - started if started and finished else None
+
+metrics.gauge('agrosmart_artifact_load_seconds', 'Duration of the latest complete artifact load', last_load_seconds)
+metrics.gauge('agrosmart_artifact_loader_seconds', 'Duration of each artifact loader in the latest load',
+              lambda: {(name,): seconds for name, seconds in registry.loader_seconds.items()}, ['artifact'])
+metrics.gauge('agrosmart_artifact_reloads', 'Artifact reloads since startup by result',
+              lambda: {('swapped',): registry.reloads, ('rejected',): registry.failed_reloads}, ['result'])
+metrics.gauge('agrosmart_artifact_info', 'Artifact version being served',
+              lambda: {(registry.current.version or 'none',): 1}, ['version'])
+metrics.gauge('agrosmart_cache_requests', 'Recommendation cache lookups by result',
+              lambda: {('hit',): recommendation_cache.hits, ('miss',): recommendation_cache.misses}, ['result'])
+metrics.gauge('agrosmart_history_queue_depth', 'History entries waiting to be written',
+              lambda: history_store.stats()['queue_depth'] if history_store is not None else None)
+
+def load_data_and_model(background=False):
+    """Load dataset and ML model if available.
+    
+    The artifacts load concurrently. With background=True this returns at once
+    and registry.ready is set when everything has finished.
+    """
+    registry.load(background=background)
 
 @app.route('/')
 def index():
@@ -96,10 +339,11 @@ def home():
     if not session.get('logged_in'):
         return redirect(url_for('login'))
     
+    artifacts = registry.current
     stats = {
-        'total_records': len(df) if df is not None else 0,
-        'model_available': model is not None,
-        'dataset_available': df is not None
+        'total_records': dataset_metadata(artifacts).records,
+        'model_available': artifacts.model is not None,
+        'dataset_available': artifacts.df is not None
     }
     
     return render_template('home.html', stats=stats)
@@ -110,24 +354,49 @@ def recommend():
     if not session.get('logged_in'):
         return redirect(url_for('login'))
     
-    # Get unique values for dropdowns from dataset
-    soil_types = []
-    crop_types = []
-    
-    if df is not None:
-        soil_types = sorted(df['Soil Type'].unique().tolist())
-        crop_types = sorted(df['Crop Type'].unique().tolist())
-    
+    # Dropdown values from the dataset snapshot built at load time
+    vocabularies = dataset_metadata(registry.current).vocabularies
     return render_template('recommendation.html', 
-                         soil_types=soil_types, 
-                         crop_types=crop_types)
+                         soil_types=vocabularies['soil_types'], 
+                         crop_types=vocabularies['crop_types'])
 
 @app.route('/carbon-footprint')
 def carbon_footprint():
     """Carbon footprint calculation page"""
     if not session.get('logged_in'):
         return redirect(url_for('login'))
-    return render_template('carbon_footprint.html')
+    return render_template('carbon_footprint.html', fertilizers=carbon_engine.names.tolist())
+
+@app.route('/api/carbon-footprint', methods=['GET', 'POST'])
+def api_carbon_footprint():
+    """Carbon footprint of one field or many plots (GET returns the emission factors)"""
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    if request.method == 'GET':
+        return jsonify({'factors': carbon_engine.factors()})
+    
+    data = request.get_json(silent=True)
+    try:
+        columns, columnar = read_plots(data)
+        n_plots = len(columns['fertilizer'])
+        if n_plots > MAX_CARBON_PLOTS:
+            return jsonify({'error': f'Too many plots: at most {MAX_CARBON_PLOTS} per call'}), 413
+        if not n_plots:
+            return jsonify({'error': 'No plots provided'}), 400
+        codes, result = carbon_engine.assess(columns)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid carbon footprint payload: {str(e)}'}), 400
+    
+    body = {'summary': carbon_engine.summarize(codes, result)}
+    # Per-plot results come back in the shape they were sent: columns or plot objects
+    if data.get('details', True):
+        if columnar:
+            body['columns'] = {col: result[col].tolist() for col in RESULT_COLS}
+        else:
+            body['plots'] = [dict(zip(RESULT_COLS, values))
+                             for values in zip(*(result[col].tolist() for col in RESULT_COLS))]
+    logger.info(f"Carbon footprint of {n_plots} plots for user {session.get('username')}")
+    return jsonify(body)
 
 @app.route('/history')
 def history():
@@ -156,51 +425,39 @@ def predict():
         if not data:
             return jsonify({'error': 'No data provided'}), 400
         
-        # Validate required fields
-        required_fields = ['Temperature', 'Humidity', 'Moisture', 'Nitrogen', 
-                          'Phosphorus', 'Potassium', 'Soil Type', 'Crop Type']
-        
-        for field in required_fields:
-            if field not in data:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
-        
-        # Convert numeric fields
         try:
-            input_row = {
-                'Temperature': float(data['Temperature']),
-                'Humidity': float(data['Humidity']),
-                'Moisture': float(data['Moisture']),
-                'Nitrogen': float(data['Nitrogen']),
-                'Phosphorus': float(data['Phosphorus']),
-                'Potassium': float(data['Potassium']),
-                'Soil Type': str(data['Soil Type']),
-                'Crop Type': str(data['Crop Type'])
-            }
-        except (ValueError, TypeError) as e:
-            return jsonify({'error': f'Invalid numeric value: {str(e)}'}), 400
+            input_row = parse_input_row(data)
+            footprint = parse_footprint_options(data) if data.get('footprint') else None
+            top_k = parse_top_k(data.get('top_k'), footprint is not None)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # Try ML model prediction first
-        if model and preprocessor and fertilizer_encoder:
-            try:
-                recommendation = predict_with_ml_model(input_row)
-                if recommendation:
-                    logger.info(f"ML prediction successful for user {session.get('username')}")
-                    return jsonify(recommendation)
-            except Exception as e:
-                logger.warning(f"ML prediction failed: {str(e)}")
+        if top_k:
+            return predict_ranked(input_row, top_k, footprint)
         
-        # Fallback to dataset lookup
-        if df is not None:
-            recommendation = predict_with_dataset(input_row)
-            if recommendation:
-                logger.info(f"Dataset lookup successful for user {session.get('username')}")
-                return jsonify(recommendation)
+        # Serve repeated inputs from the cache
+        start = time.perf_counter()
+        cache_key = RecommendationCache.key(input_row)
+        cache_generation = recommendation_cache.generation
+        recommendation = recommendation_cache.get(cache_key)
+        STAGE_SECONDS.observe(time.perf_counter() - start, 'cache')
+        if recommendation is not None:
+            logger.info(f"Cached recommendation for user {session.get('username')}")
+            PREDICTIONS.inc(recommendation['method'], 'true')
+            record_history(input_row, recommendation)
+            return jsonify(recommendation)
         
-        # If no exact match, find closest match
-        closest_match = find_closest_match(input_row)
-        if closest_match:
-            logger.info(f"Closest match prediction for user {session.get('username')}")
-            return jsonify(closest_match)
+        # The whole request runs on one artifact version, even if a reload swaps in another
+        with registry.acquire() as artifacts:
+            recommendation = run_recommendation_stages(input_row, artifacts)
+        if recommendation:
+            PREDICTIONS.inc(recommendation['method'], 'false')
+            recommendation['model_version'] = artifacts.version
+            # A fallback standing in for a late model is not cached over the model's answer
+            if not recommendation.get('deadline_exceeded'):
+                recommendation_cache.put(cache_key, recommendation, cache_generation)
+            record_history(input_row, recommendation)
+            return jsonify(recommendation)
         
         return jsonify({'error': 'No suitable fertilizer recommendation found'}), 404
         
@@ -208,109 +465,512 @@ def predict():
         logger.error(f"Prediction error: {str(e)}\n{traceback.format_exc()}")
         return jsonify({'error': 'Internal server error during prediction'}), 500
 
-def predict_with_ml_model(input_row):
-    """Use ML model for prediction"""
+def predict_ranked(input_row, top_k, footprint=None):
+    """/predict answer with the top-k ranking, and each candidate's footprint when asked.
+    
+    The ranking needs the model's probabilities, so these requests skip the
+    cache and the grid.
+    """
+    with registry.acquire() as artifacts:
+        recommendation = run_recommendation_stages(input_row, artifacts, top_k=top_k)
+    if not recommendation:
+        return jsonify({'error': 'No suitable fertilizer recommendation found'}), 404
+    
+    # Dataset matches have no probabilities and rank their recommendation alone
+    names, probabilities = recommendation.pop('ranking', None) or (
+        np.array([[recommendation['recommendation']]], dtype=object), np.array([[np.nan]]))
+    recommendation['top_k'] = ranking_entries(names, probabilities)[0]
+    if footprint is not None:
+        comparison = carbon_engine.compare(names, probabilities, area=footprint['area'],
+                                           rate=footprint['fertilizer_amount'])
+        recommendation['footprint'] = comparison_entries(comparison)[0]
+    recommendation['model_version'] = artifacts.version
+    PREDICTIONS.inc(recommendation['method'], 'false')
+    record_history(input_row, recommendation)
+    return jsonify(recommendation)
+
+def parse_top_k(value, footprint=False):
+    """Number of ranked fertilizers requested, 0 for none (FOOTPRINT_TOP_K with a footprint).
+    
+    Raises ValueError with the message returned to the client.
+    """
+    if value is None:
+        return FOOTPRINT_TOP_K if footprint else 0
+    try:
+        top_k = int(value)
+    except (ValueError, TypeError):
+        raise ValueError('top_k must be an integer')
+    if top_k < 1:
+        raise ValueError('top_k must be at least 1')
+    return top_k
+
+def parse_footprint_options(data):
+    """Area and fertilizer amount of a fused footprint request.
+    
+    Raises ValueError with the message returned to the client.
+    """
+    try:
+        area = float(data.get('area', 1.0))
+        amount = data.get('fertilizer_amount')
+        amount = float('nan') if amount is None else float(amount)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f'Invalid footprint option: {str(e)}')
+    if not np.isfinite(area) or area < 0 or amount < 0 or np.isinf(amount):
+        raise ValueError('area and fertilizer_amount must be non-negative numbers')
+    return {'area': area, 'fertilizer_amount': amount}
+
+def record_history(input_row, recommendation):
+    """Queue the answered request for the history store (written in the background)"""
+    if history_store is not None:
+        history_store.record(session.get('username'), input_row, recommendation)
+
+def run_recommendation_stages(input_row, artifacts, top_k=0):
+    """Run the ML model, exact match and closest match stages in order.
+    
+    top_k adds the model's top-k (names, probabilities) ranking to ML answers as 'ranking'.
+    """
+    if ml_pool is not None and artifacts.ml_ready:
+        return recommend_within_deadline(input_row, artifacts, PREDICT_DEADLINE_MS / 1000, top_k)
+    
+    # Try ML model prediction first
+    if artifacts.ml_ready:
+        try:
+            recommendation = run_stage('ml_model', predict_with_ml_model, input_row, artifacts, top_k)
+            if recommendation:
+                logger.info(f"ML prediction successful for user {session.get('username')}")
+                return recommendation
+        except Exception as e:
+            STAGE_ERRORS.inc('ml_model')
+            logger.warning(f"ML prediction failed: {str(e)}")
+    
+    # Fallback to dataset lookup
+    if artifacts.df is not None:
+        recommendation = run_stage('exact_match', predict_with_dataset, input_row, artifacts)
+        if recommendation:
+            logger.info(f"Dataset lookup successful for user {session.get('username')}")
+            return recommendation
+    
+    # If no exact match, find closest match
+    closest_match = run_stage('closest_match', find_closest_match, input_row, artifacts)
+    if closest_match:
+        logger.info(f"Closest match prediction for user {session.get('username')}")
+        return closest_match
+    
+    return None
+
+def recommend_within_deadline(input_row, artifacts, budget, top_k=0):
+    """Race the ML model against the dataset fallbacks within a latency budget.
+    
+    The model answers when it finishes within the budget. Otherwise the first of the
+    two paths to finish answers, marked with 'deadline_exceeded'.
+    """
+    start = time.perf_counter()
+    deadline = start + budget
+    # A grid lookup cannot stall, so it answers without the race
+    recommendation = None
+    try:
+        if not top_k:
+            recommendation = grid_recommendation(input_row, artifacts, start)
+    except Exception as e:
+        STAGE_ERRORS.inc('ml_model')
+        logger.warning(f"Grid lookup failed: {str(e)}")
+    if recommendation:
+        STAGE_SECONDS.observe(time.perf_counter() - start, 'ml_model')
+        logger.info(f"ML prediction successful for user {session.get('username')}")
+        return recommendation
+    
+    # The model may outlive this request, so its job holds its own pin on the artifacts
+    artifacts.pin()
+    ml_future = ml_pool.submit(pinned_stage, 'ml_model', predict_with_ml_model, input_row, artifacts, top_k)
+    fallback_future = fallback_pool.submit(dataset_fallback, input_row, artifacts)
+    
+    if not wait([ml_future], timeout=max(deadline - time.perf_counter(), 0)).done:
+        wait([ml_future, fallback_future], return_when=FIRST_COMPLETED)
+    
+    if ml_future.done():
+        recommendation = future_result(ml_future, 'ml_model')
+        if recommendation:
+            fallback_future.cancel()
+            logger.info(f"ML prediction successful for user {session.get('username')}")
+            return recommendation
+    
+    recommendation = future_result(fallback_future, 'fallback')
+    if recommendation:
+        if not ml_future.done():
+            recommendation['deadline_exceeded'] = True
+            DEADLINE_MISSES.inc(recommendation['method'])
+            logger.warning(f"ML model missed the {budget * 1000:g} ms deadline for user "
+                           f"{session.get('username')}, answered by {recommendation['method']}")
+        else:
+            logger.info(f"{recommendation['method']} prediction for user {session.get('username')}")
+    return recommendation
+
+def pinned_stage(stage, function, input_row, artifacts, *args):
+    """run_stage on a pool thread, releasing the pin taken by the submitting request"""
+    try:
+        return run_stage(stage, function, input_row, artifacts, *args)
+    finally:
+        artifacts.release()
+
+def dataset_fallback(input_row, artifacts):
+    """The exact match stage, then the closest match stage"""
+    if artifacts.df is not None:
+        recommendation = run_stage('exact_match', predict_with_dataset, input_row, artifacts)
+        if recommendation:
+            return recommendation
+    return run_stage('closest_match', find_closest_match, input_row, artifacts)
+
+def future_result(future, stage):
+    """Result of a raced stage, None if it raised"""
+    try:
+        return future.result()
+    except Exception as e:
+        STAGE_ERRORS.inc(stage)
+        logger.warning(f"Raced {stage} stage failed: {str(e)}")
+        return None
+
+def run_stage(stage, function, input_row, artifacts, *args):
+    """Run one recommendation stage, recording its latency and whether it answered"""
+    start = time.perf_counter()
+    recommendation = function(input_row, artifacts, *args)
+    STAGE_SECONDS.observe(time.perf_counter() - start, stage)
+    if not recommendation:
+        FALLBACKS.inc(stage)
+    return recommendation
+
+def parse_input_row(data):
+    """Validate a prediction payload and build the normalized input row.
+    
+    Raises ValueError with the message returned to the client.
+    """
+    if not isinstance(data, dict):
+        raise ValueError('Each sample must be a JSON object')
+    
+    for field in REQUIRED_FIELDS:
+        if field not in data:
+            raise ValueError(f'Missing required field: {field}')
+    
+    # Convert numeric fields
+    try:
+        return {
+            'Temperature': float(data['Temperature']),
+            'Humidity': float(data['Humidity']),
+            'Moisture': float(data['Moisture']),
+            'Nitrogen': float(data['Nitrogen']),
+            'Phosphorus': float(data['Phosphorus']),
+            'Potassium': float(data['Potassium']),
+            'Soil Type': str(data['Soil Type']),
+            'Crop Type': str(data['Crop Type'])
+        }
+    except (ValueError, TypeError) as e:
+        raise ValueError(f'Invalid numeric value: {str(e)}')
+
+def read_batch_payload():
+    """Read a JSON array or NDJSON request body into a list of samples"""
+    if request.mimetype in ('application/x-ndjson', 'application/ndjson'):
+        lines = request.get_data(as_text=True).splitlines()
+        return [json.loads(line) for line in lines if line.strip()]
+    
+    data = request.get_json(silent=True)
+    if isinstance(data, dict) and 'samples' in data:
+        data = data['samples']
+    if not isinstance(data, list):
+        raise ValueError('Expected a JSON array of samples or an NDJSON body')
+    return data
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """Get fertilizer recommendations for many samples in one call"""
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    try:
+        try:
+            samples = read_batch_payload()
+        except ValueError as e:
+            return jsonify({'error': f'Invalid batch payload: {str(e)}'}), 400
+        
+        if not samples:
+            return jsonify({'error': 'No data provided'}), 400
+        if len(samples) > MAX_BATCH_ROWS:
+            return jsonify({'error': f'Batch too large: at most {MAX_BATCH_ROWS} samples per call'}), 413
+        
+        try:
+            top_k, footprint = bulk_ranking_options()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # Validate with the same rules as /predict, reporting errors per sample
+        results = [None] * len(samples)
+        valid_rows = []
+        valid_indices = []
+        footprint_options = []
+        for i, sample in enumerate(samples):
+            try:
+                input_row = parse_input_row(sample)
+                options = parse_footprint_options(sample) if footprint else None
+            except ValueError as e:
+                results[i] = {'error': str(e)}
+                continue
+            valid_rows.append(input_row)
+            footprint_options.append(options)
+            valid_indices.append(i)
+        
+        artifacts = registry.current
+        if valid_rows:
+            frame = pd.DataFrame(valid_rows, columns=REQUIRED_FIELDS)
+            with registry.acquire() as artifacts:
+                scored = score_batch(frame, top_k=top_k, **batch_stages(artifacts))
+            recommendations, confidences, methods = scored[:3]
+            for i, recommendation, confidence, method in zip(valid_indices, recommendations, confidences, methods):
+                if recommendation is None:
+                    results[i] = {'error': 'No suitable fertilizer recommendation found'}
+                else:
+                    results[i] = {
+                        'recommendation': recommendation,
+                        'confidence': float(confidence),
+                        'method': method
+                    }
+            if top_k:
+                add_batch_rankings(results, valid_indices, recommendations, scored[3],
+                                   footprint_options if footprint else None)
+        
+        logger.info(f"Batch prediction of {len(samples)} samples for user {session.get('username')}")
+        return jsonify({'count': len(results), 'results': results, 'model_version': artifacts.version})
+        
+    except Exception as e:
+        logger.error(f"Batch prediction error: {str(e)}\n{traceback.format_exc()}")
+        return jsonify({'error': 'Internal server error during prediction'}), 500
+
+def bulk_ranking_options():
+    """(top_k, footprint) of the ?top_k=N and ?footprint=1 options of the bulk endpoints"""
+    footprint = request.args.get('footprint', '0').lower() not in ('0', 'false', '')
+    return parse_top_k(request.args.get('top_k'), footprint), footprint
+
+def add_batch_rankings(results, indices, recommendations, ranking, footprint_options=None):
+    """Add the top-k ranking, and the fused footprint when asked, to every answered batch result"""
+    answered = np.flatnonzero(pd.notna(recommendations))
+    if not len(answered):
+        return
+    names, probabilities = ranking[0][answered], ranking[1][answered]
+    for row, entry in zip(answered, ranking_entries(names, probabilities)):
+        results[indices[row]]['top_k'] = entry
+    if footprint_options is not None:
+        comparison = carbon_engine.compare(
+            names, probabilities,
+            area=[footprint_options[row]['area'] for row in answered],
+            rate=[footprint_options[row]['fertilizer_amount'] for row in answered])
+        for row, entry in zip(answered, comparison_entries(comparison)):
+            results[indices[row]]['footprint'] = entry
+
+def batch_stages(artifacts):
+    """score_batch keyword arguments for one artifact version"""
+    ml_ready = artifacts.ml_ready
+    return {
+        'model': artifacts.model if ml_ready else None,
+        'encoder': artifacts.feature_encoder if artifacts.feature_encoder is not None else artifacts.preprocessor,
+        'class_names': artifacts.class_names if ml_ready else None,
+        'exact_index': artifacts.exact_index,
+        'matcher': artifacts.matcher
+    }
+
+@app.route('/predict/csv', methods=['POST'])
+def predict_csv():
+    """Score an uploaded CSV of soil tests, streaming the scored CSV back"""
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    # A multipart upload is spooled to disk by Werkzeug; a raw text/csv body is read as it arrives
+    upload = request.files.get('file')
+    if upload is not None:
+        source, filename = upload.stream, upload.filename or 'upload.csv'
+        # Take the spooled file over: the request closes its files as soon as this view returns
+        upload.stream = io.BytesIO()
+    elif request.mimetype == 'text/csv':
+        source, filename = request.stream, 'upload.csv'
+    else:
+        return jsonify({'error': 'Send the CSV as a "file" form field or as a text/csv body'}), 400
+    
+    try:
+        top_k, footprint = bulk_ranking_options()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    username = session.get('username')
+    chunks = scored_csv_chunks(source, username, top_k, footprint)
+    try:
+        # The first chunk is scored before responding, so a bad header is still a 400
+        first = next(chunks, '')
+    except ValueError as e:
+        source.close()
+        return jsonify({'error': f'Invalid CSV: {str(e)}'}), 400
+    
+    def stream():
+        try:
+            yield first
+            yield from chunks
+        finally:
+            chunks.close()
+            source.close()
+    
+    scored_name = os.path.splitext(os.path.basename(filename))[0] + '_scored.csv'
+    return Response(stream(), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename="{scored_name}"'})
+
+def scored_csv_chunks(source, username, top_k=0, footprint=False):
+    """Scored CSV text of source, chunk by chunk, on one artifact version"""
+    state = {'rows': 0, 'seconds': 0.0, 'logged_at': 0.0}
+    
+    def progress(rows, seconds):
+        state['rows'], state['seconds'] = rows, seconds
+        if seconds - state['logged_at'] >= CSV_PROGRESS_INTERVAL:
+            state['logged_at'] = seconds
+            logger.info(f"CSV scoring for user {username}: {rows} rows, {rows / seconds:.0f} rows/s")
+    
+    with registry.acquire() as artifacts:
+        try:
+            yield from stream_scored_csv(source, progress=progress, top_k=top_k,
+                                         carbon_engine=carbon_engine if footprint else None,
+                                         **batch_stages(artifacts))
+        except ValueError:
+            if state['rows'] == 0:
+                raise
+            # Headers are already sent; end the stream early and log where it broke
+            logger.error(f"CSV scoring for user {username} stopped after {state['rows']} rows: "
+                         f"{traceback.format_exc()}")
+            return
+    
+    rows, seconds = state['rows'], state['seconds']
+    logger.info(f"CSV scoring for user {username} finished: {rows} rows in {seconds:.2f}s "
+                f"({rows / seconds if seconds else 0:.0f} rows/s)")
+
+def predict_with_ml_model(input_row, artifacts, top_k=0):
+    """Use ML model for prediction (top_k keeps the ranking of the top-k classes)"""
     try:
-        # Prepare input data
-        input_df = pd.DataFrame([input_row])
+        start = time.perf_counter()
+        # Inputs inside a uniform cell of the precomputed grid need no model call,
+        # but the grid stores no probabilities
+        if not top_k:
+            recommendation = grid_recommendation(input_row, artifacts, start)
+            if recommendation:
+                return recommendation
         
-        # Preprocess
-        input_processed = preprocessor.transform(input_df)
-        input_reshaped = input_processed.reshape((1, 1, input_processed.shape[1]))
+        # Preprocess with the compiled encoder, falling back to the sklearn transformer
+        if artifacts.feature_encoder is not None:
+            input_processed = artifacts.feature_encoder.transform_row(input_row)
+        else:
+            input_processed = artifacts.preprocessor.transform(pd.DataFrame([input_row]))
         
-        # Predict
-        prediction = model.predict(input_reshaped, verbose=0)
-        predicted_class = np.argmax(prediction)
-        confidence = float(np.max(prediction) * 100)
+        tier = 'teacher'
+        prediction = None
+        # Tiered mode: the distilled student answers when it is confident enough
+        if artifacts.student is not None:
+            prediction = artifacts.student.predict_row(input_processed[0])
+            if np.max(prediction) * 100 >= STUDENT_MIN_CONFIDENCE:
+                tier = 'student'
+            else:
+                prediction = None
         
-        # Get fertilizer name
-        fertilizer_name = fertilizer_encoder.inverse_transform([predicted_class])[0]
+        # Predict, sharing a forward pass with concurrent requests when micro-batching is on.
+        # The caller blocks until its row is served, so the encoder buffer stays intact.
+        if prediction is None and artifacts.batcher is not None:
+            prediction = artifacts.batcher.predict(input_processed[0])
+        elif prediction is None:
+            input_reshaped = input_processed.reshape((1, 1, input_processed.shape[1]))
+            prediction = artifacts.model.predict(input_reshaped, verbose=0)
+        # Shared top-k stage; the name comes from the precomputed class-name array
+        names, probabilities = top_k_classes(np.reshape(prediction, (1, -1)), artifacts.class_names, top_k or 1)
+        record_tier(tier, time.perf_counter() - start)
         
-        return {
-            'recommendation': fertilizer_name,
-            'confidence': confidence,
-            'method': 'ML Model'
+        recommendation = {
+            'recommendation': names[0, 0],
+            'confidence': float(probabilities[0, 0] * 100),
+            'method': 'ML Model',
+            'tier': tier
         }
+        if top_k:
+            recommendation['ranking'] = (names, probabilities)
+        return recommendation
     except Exception as e:
+        STAGE_ERRORS.inc('ml_model')
         logger.error(f"ML model prediction error: {str(e)}")
         return None
 
-def predict_with_dataset(input_row):
+def grid_recommendation(input_row, artifacts, start):
+    """The precomputed grid's answer, None outside its uniform cells"""
+    hit = artifacts.grid.lookup(input_row) if artifacts.grid is not None else None
+    if hit is None:
+        return None
+    record_tier('grid', time.perf_counter() - start)
+    # The lowest whole-percent confidence at the cell's corners, not the network's
+    # confidence for this input
+    return {
+        'recommendation': hit[0],
+        'confidence': hit[1],
+        'confidence_source': 'grid_corner_min',
+        'method': 'ML Model',
+        'tier': 'grid'
+    }
+
+def record_tier(tier, seconds):
+    ML_TIER_SECONDS.observe(seconds, tier)
+
+def tier_summary(artifacts):
+    """Per-tier request counts and mean model latency for /api/stats"""
+    counts = {tier: ML_TIER_SECONDS.totals(tier) for tier in ('grid', 'student', 'teacher')}
+    total = sum(count for count, _ in counts.values())
+    student = artifacts.student
+    return {
+        'student_loaded': student is not None,
+        'student_min_confidence': STUDENT_MIN_CONFIDENCE,
+        'student_agreement': student.report.get('agreement') if student is not None else None,
+        'grid': artifacts.grid.stats() if artifacts.grid is not None else None,
+        'tiers': {tier: {
+            'requests': count,
+            'share': round(count / total, 4) if total else 0.0,
+            'mean_latency_ms': round(seconds / count * 1000, 4) if count else None,
+        } for tier, (count, seconds) in counts.items()},
+    }
+
+def predict_with_dataset(input_row, artifacts):
     """Use dataset lookup for prediction"""
     try:
-        # Exact match
-        matched = df[
-            (df['Temperature'] == input_row['Temperature']) &
-            (df['Humidity'] == input_row['Humidity']) &
-            (df['Moisture'] == input_row['Moisture']) &
-            (df['Nitrogen'] == input_row['Nitrogen']) &
-            (df['Phosphorus'] == input_row['Phosphorus']) &
-            (df['Potassium'] == input_row['Potassium']) &
-            (df['Soil Type'] == input_row['Soil Type']) &
-            (df['Crop Type'] == input_row['Crop Type'])
-        ]
+        # Exact match through the hash index built at load time
+        exact_index = artifacts.exact_index
+        position = exact_index.lookup(input_row) if exact_index is not None else None
         
-        if not matched.empty:
-            fertilizer_name = matched.iloc[0]['Fertilizer Name']
+        if position is not None:
+            fertilizer_name = exact_index.labels[position]
             return {
                 'recommendation': fertilizer_name,
                 'confidence': 100.0,
                 'method': 'Exact Match'
             }
     except Exception as e:
+        STAGE_ERRORS.inc('exact_match')
         logger.error(f"Dataset prediction error: {str(e)}")
     
     return None
 
-def find_closest_match(input_row):
+def find_closest_match(input_row, artifacts):
     """Find closest match using similarity scoring"""
     try:
-        if df is None or df.empty:
+        matcher = artifacts.matcher
+        if artifacts.df is None or artifacts.df.empty or matcher is None:
             return None
         
-        # Filter by soil and crop type first
-        filtered_df = df[
-            (df['Soil Type'] == input_row['Soil Type']) &
-            (df['Crop Type'] == input_row['Crop Type'])
-        ]
-        
-        if filtered_df.empty:
-            # If no exact soil/crop match, just filter by crop type
-            filtered_df = df[df['Crop Type'] == input_row['Crop Type']]
-        
-        if filtered_df.empty:
-            # If still no match, use all data
-            filtered_df = df
-        
-        # Calculate similarity based on numeric parameters
-        numeric_cols = ['Temperature', 'Humidity', 'Moisture', 'Nitrogen', 'Phosphorus', 'Potassium']
-        
-        scores = []
-        for _, row in filtered_df.iterrows():
-            score = 0
-            for col in numeric_cols:
-                # Calculate normalized difference
-                diff = abs(row[col] - input_row[col])
-                max_val = df[col].max()
-                min_val = df[col].min()
-                range_val = max_val - min_val if max_val != min_val else 1
-                normalized_diff = diff / range_val
-                score += (1 - normalized_diff)
-            
-            scores.append(score / len(numeric_cols))
-        
-        # Get best match
-        best_idx = np.argmax(scores)
-        best_match = filtered_df.iloc[best_idx]
-        confidence = scores[best_idx] * 100
+        # Score every candidate row in one vectorized pass
+        best_idx, score = matcher.closest(input_row)
+        confidence = score * 100
         
         return {
-            'recommendation': best_match['Fertilizer Name'],
+            'recommendation': matcher.labels[best_idx],
             'confidence': min(confidence, 95.0),  # Cap confidence for fuzzy matches
             'method': 'Closest Match'
         }
         
     except Exception as e:
+        STAGE_ERRORS.inc('closest_match')
         logger.error(f"Closest match error: {str(e)}")
         return None
 
@@ -320,15 +980,128 @@ def api_stats():
     if not session.get('logged_in'):
         return jsonify({'error': 'Unauthorized'}), 401
     
+    artifacts = registry.current
+    metadata = dataset_metadata(artifacts)
+    counts = metadata.summary['counts']
     stats = {
-        'dataset_records': len(df) if df is not None else 0,
-        'ml_model_available': model is not None,
-        'unique_fertilizers': len(df['Fertilizer Name'].unique()) if df is not None else 0,
-        'unique_crops': len(df['Crop Type'].unique()) if df is not None else 0,
-        'unique_soil_types': len(df['Soil Type'].unique()) if df is not None else 0
+        'dataset_records': metadata.records,
+        'dataset_version': metadata.etag,
+        'ml_model_available': artifacts.model is not None,
+        'unique_fertilizers': counts['fertilizers'],
+        'unique_crops': counts['crop_types'],
+        'unique_soil_types': counts['soil_types'],
+        'model_version': artifacts.version,
+        'artifact_registry': registry.stats(),
+        'inference_batching': artifacts.batcher.stats() if artifacts.batcher is not None else None,
+        'ml_tiers': tier_summary(artifacts),
+        'recommendation_cache': recommendation_cache.stats(),
+        'history': history_store.stats() if history_store is not None else None
+    }
+    
+    # The live counters change between polls, so the ETag is taken over the body
+    response = jsonify(stats)
+    response.add_etag()
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+@app.route('/api/dataset')
+def api_dataset():
+    """Counts, vocabularies, column ranges and class distribution of the served dataset"""
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    return snapshot_response(dataset_metadata(registry.current), 'dataset')
+
+def dataset_metadata(artifacts):
+    return artifacts.metadata if artifacts.metadata is not None else EMPTY_METADATA
+
+def snapshot_response(metadata, view):
+    """Precomputed JSON view of the dataset snapshot, or 304 when the client's ETag matches"""
+    body, etag = metadata.view(view)
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    # Clients may keep the body but must revalidate it, as a reload can change the dataset
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.route('/api/ready')
+def api_ready():
+    """Readiness probe reporting the artifact loading state"""
+    ready = registry.ready.is_set()
+    artifacts = registry.current
+    started = registry.load_started_at
+    finished = registry.load_finished_at or time.time()
+    status = {
+        'ready': ready,
+        'state': ('reloading' if registry.loading else 'ready') if ready else 'loading',
+        'model_version': artifacts.version,
+        'artifacts': dict(registry.status),
+        'ml_model_available': artifacts.ml_ready,
+        'load_seconds': round(finished - started, 3) if started else None
     }
+    return jsonify(status), 200 if ready else 503
+
+@app.route('/api/admin/reload', methods=['POST'])
+def api_admin_reload():
+    """Load changed artifacts in the background and swap them in without a restart"""
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    if ADMIN_TOKEN and request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    if PREFORK:
+        # Workers share the master's artifacts; it reloads them and replaces the
+        # workers, so every worker serves the new version and shares it again
+        os.kill(os.getppid(), signal.SIGHUP)
+        logger.info(f"Artifact reload requested by user {session.get('username')}: signalled the serve.py master")
+        return jsonify({'result': 'started', 'model_version': registry.current.version, 'error': None}), 202
+    
+    force = request.args.get('force') == '1'
+    if request.args.get('wait') == '1':
+        result = registry.load(force=force)
+    else:
+        result = registry.load(background=True, force=force)
+    logger.info(f"Artifact reload requested by user {session.get('username')}: {result}")
+    
+    status_codes = {'started': 202, 'swapped': 200, 'unchanged': 200, 'busy': 409, 'rejected': 500}
+    body = {
+        'result': result,
+        'model_version': registry.current.version,
+        'error': registry.last_error if result == 'rejected' else None
+    }
+    return jsonify(body), status_codes[result]
+
+@app.route('/api/history', methods=['GET', 'DELETE'])
+def api_history():
+    """Page through the user's recommendation history, newest first"""
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    if history_store is None:
+        return jsonify({'error': 'History is disabled'}), 404
+    
+    username = session.get('username')
+    if request.method == 'DELETE':
+        deleted = history_store.delete_user(username)
+        logger.info(f"Cleared {deleted} history entries for user {username}")
+        return jsonify({'deleted': deleted})
+    
+    try:
+        limit = int(request.args.get('limit', HISTORY_PAGE_SIZE))
+        if not 1 <= limit <= HISTORY_MAX_PAGE_SIZE:
+            raise ValueError(f'limit must be between 1 and {HISTORY_MAX_PAGE_SIZE}')
+        entries, next_cursor = history_store.page(
+            username,
+            limit=limit,
+            cursor=request.args.get('cursor'),
+            crop_type=request.args.get('crop')
+        )
+    except ValueError as e:
+        return jsonify({'error': f'Invalid history query: {str(e)}'}), 400
     
-    return jsonify(stats)
+    return jsonify({'items': entries, 'next_cursor': next_cursor})
 
 @app.route('/api/fertilizers')
 def api_fertilizers():
@@ -336,11 +1109,89 @@ def api_fertilizers():
     if not session.get('logged_in'):
         return jsonify({'error': 'Unauthorized'}), 401
     
-    if df is not None:
-        fertilizers = sorted(df['Fertilizer Name'].unique().tolist())
-        return jsonify(fertilizers)
+    return snapshot_response(dataset_metadata(registry.current), 'fertilizers')
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text-format metrics of this process"""
+    if not METRICS_ENABLED:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/admin/profiler', methods=['GET', 'POST'])
+def api_admin_profiler():
+    """Start or stop the sampling profiler, or download its collapsed stacks"""
+    if not session.get('logged_in'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    if ADMIN_TOKEN and request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    if request.method == 'GET':
+        if request.args.get('format') == 'json':
+            return jsonify(profiler.stats())
+        limit = request.args.get('limit', type=int)
+        return Response(profiler.collapsed(limit), mimetype='text/plain')
     
-    return jsonify([])
+    action = request.args.get('action')
+    if action == 'start':
+        interval_ms = request.args.get('interval_ms', 10.0, type=float)
+        if not 1 <= interval_ms <= 1000:
+            return jsonify({'error': 'interval_ms must be between 1 and 1000'}), 400
+        changed = profiler.start(interval_ms)
+    elif action == 'stop':
+        changed = profiler.stop()
+    else:
+        return jsonify({'error': 'action must be start or stop'}), 400
+    logger.info(f"Profiler {action} requested by user {session.get('username')}")
+    return jsonify(dict(profiler.stats(), changed=changed))
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is not None:
+        # Unrouted paths share one label so scanners cannot blow up the series count
+        endpoint = request.endpoint or 'unmatched'
+        HTTP_SECONDS.observe(time.perf_counter() - started, endpoint)
+        HTTP_RESPONSES.inc(endpoint, str(response.status_code))
+    return response
+
+def start_background_threads():
+    # Under serve.py the master watches the artifact files for every worker
+    if WATCH_INTERVAL > 0 and not PREFORK:
+        registry.watch(WATCH_INTERVAL)
+    if PROFILER_INTERVAL_MS > 0:
+        profiler.start(PROFILER_INTERVAL_MS)
+
+def init_worker():
+    """Start the threads of a worker process forked by serve.py"""
+    global threads_allowed, history_store
+    threads_allowed = True
+    artifacts = registry.current
+    if MICROBATCH_ENABLED and artifacts.model is not None:
+        # Replaces the master's set, so a later reload in this worker closes the batcher
+        batcher = MicroBatcher(batched_model_fn(artifacts.model), MICROBATCH_MAX_SIZE, MICROBATCH_MAX_WAIT_MS)
+        registry.current = artifacts.derive(partial=False, batcher=batcher)
+    if HISTORY_DB:
+        history_store = HistoryStore(HISTORY_DB)
+    start_background_threads()
+
+def close_worker():
+    """Stop the worker's threads once its last request has finished"""
+    registry.stop()
+    profiler.stop()
+    if history_store is not None:
+        history_store.close()
+    close_artifacts(registry.current)
+
+# Load data and model on startup; under serve.py the master loads them in the
+# foreground, before forking the workers
+load_data_and_model(background=BACKGROUND_LOAD and not PREFORK)
+if not PREFORK:
+    start_background_threads()
 
 @app.errorhandler(404)
 def not_found(error):
@@ -1,10 +1,10 @@
 from flask import Flask, request, jsonify, render_template, redirect, url_for, session
-import pandas as pd
-import numpy as np
 import os
 import logging
 from datetime import datetime
 import traceback
+from matching import SimilarityEngine, ExactMatchIndex
+from dataset_cache import load_dataset as load_cached_dataset
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -15,15 +15,20 @@ app.secret_key = 'agromart_secret_key_2024'  # Change this in production
 
 # Global variables for data
 df = None
+matcher = None
+exact_index = None
 
 def load_data():
     """Load dataset"""
-    global df
+    global df, matcher, exact_index
     
     try:
         # Load dataset
         if os.path.exists("Fertilizer_Prediction_gpt(1).csv"):
-            df = pd.read_csv("Fertilizer_Prediction_gpt(1).csv")
+            # Memory-mapped columnar copy of the CSV, rebuilt when the CSV changes
+            df = load_cached_dataset("Fertilizer_Prediction_gpt(1).csv")
+            matcher = SimilarityEngine(df)
+            exact_index = ExactMatchIndex(df)
             logger.info(f"Dataset loaded successfully with {len(df)} records")
         else:
             logger.error("Dataset file not found")
@@ -181,20 +186,11 @@ def predict():
 def predict_with_dataset(input_row):
     """Use dataset lookup for prediction"""
     try:
-        # Exact match
-        matched = df[
-            (df['Temperature'] == input_row['Temperature']) &
-            (df['Humidity'] == input_row['Humidity']) &
-            (df['Moisture'] == input_row['Moisture']) &
-            (df['Nitrogen'] == input_row['Nitrogen']) &
-            (df['Phosphorus'] == input_row['Phosphorus']) &
-            (df['Potassium'] == input_row['Potassium']) &
-            (df['Soil Type'] == input_row['Soil Type']) &
-            (df['Crop Type'] == input_row['Crop Type'])
-        ]
+        # Exact match through the hash index built at load time
+        position = exact_index.lookup(input_row) if exact_index is not None else None
         
-        if not matched.empty:
-            fertilizer_name = matched.iloc[0]['Fertilizer Name']
+        if position is not None:
+            fertilizer_name = exact_index.labels[position]
             return {
                 'recommendation': fertilizer_name,
                 'confidence': 100.0,
@@ -208,47 +204,15 @@ def predict_with_dataset(input_row):
 def find_closest_match(input_row):
     """Find closest match using similarity scoring"""
     try:
-        if df is None or df.empty:
+        if df is None or df.empty or matcher is None:
             return None
         
-        # Filter by soil and crop type first
-        filtered_df = df[
-            (df['Soil Type'] == input_row['Soil Type']) &
-            (df['Crop Type'] == input_row['Crop Type'])
-        ]
-        
-        if filtered_df.empty:
-            # If no exact soil/crop match, just filter by crop type
-            filtered_df = df[df['Crop Type'] == input_row['Crop Type']]
-        
-        if filtered_df.empty:
-            # If still no match, use all data
-            filtered_df = df
-        
-        # Calculate similarity based on numeric parameters
-        numeric_cols = ['Temperature', 'Humidity', 'Moisture', 'Nitrogen', 'Phosphorus', 'Potassium']
-        
-        scores = []
-        for _, row in filtered_df.iterrows():
-            score = 0
-            for col in numeric_cols:
-                # Calculate normalized difference
-                diff = abs(row[col] - input_row[col])
-                max_val = df[col].max()
-                min_val = df[col].min()
-                range_val = max_val - min_val if max_val != min_val else 1
-                normalized_diff = diff / range_val
-                score += (1 - normalized_diff)
-            
-            scores.append(score / len(numeric_cols))
-        
-        # Get best match
-        best_idx = np.argmax(scores)
-        best_match = filtered_df.iloc[best_idx]
-        confidence = scores[best_idx] * 100
+        # Score every candidate row in one vectorized pass
+        best_idx, score = matcher.closest(input_row)
+        confidence = score * 100
         
         return {
-            'recommendation': best_match['Fertilizer Name'],
+            'recommendation': matcher.labels[best_idx],
             'confidence': min(confidence, 95.0),  # Cap confidence for fuzzy matches
             'method': 'Closest Match'
         }
@@ -0,0 +1,138 @@
+"""Dynamic micro-batching of single-row model calls.
+
+Concurrent /predict requests each need one forward pass on one row. MicroBatcher
+queues those rows and a background thread runs them through the model together,
+handing each request back its own row of the output.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class MicroBatcher:
+    """Collects single-row inference requests into batched model calls.
+
+    A batch is dispatched when it reaches max_batch_size, when max_wait_ms has
+    passed since its first row, or as soon as it holds every request currently
+    waiting, so a lone request is never held back for the full wait.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=64, max_wait_ms=2.0):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._closed = False
+
+        # Metrics
+        self.batches = 0
+        self.rows = 0
+        self.max_queue_depth = 0
+        self.batch_size_buckets = [2 ** i for i in range(max_batch_size.bit_length())]
+        if self.batch_size_buckets[-1] < max_batch_size:
+            self.batch_size_buckets.append(max_batch_size)
+        self.batch_size_counts = [0] * len(self.batch_size_buckets)
+
+        self._worker = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._worker.start()
+
+    def submit(self, features):
+        """Queue one feature row; the Future resolves to that row's model output"""
+        if self._closed:
+            raise RuntimeError('MicroBatcher is closed')
+        future = Future()
+        with self._lock:
+            self._inflight += 1
+        self._queue.put((features, future))
+        depth = self._queue.qsize()
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+        return future
+
+    def predict(self, features, timeout=None):
+        """Run one feature row through the batched model and wait for its output"""
+        return self.submit(features).result(timeout)
+
+    def close(self):
+        """Stop the worker after the queued requests are served"""
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join()
+
+    def stats(self):
+        """Queue depth and batch-size histogram for monitoring"""
+        return {
+            'queue_depth': self._queue.qsize(),
+            'max_queue_depth': self.max_queue_depth,
+            'inflight': self._inflight,
+            'batches': self.batches,
+            'rows': self.rows,
+            'mean_batch_size': self.rows / self.batches if self.batches else 0.0,
+            # Cumulative counts of batches with size <= bucket
+            'batch_size_histogram': {
+                f"le_{bucket}": int(count)
+                for bucket, count in zip(self.batch_size_buckets, np.cumsum(self.batch_size_counts))
+            },
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+        }
+
+    def _collect(self, first):
+        """Gather rows behind the first one until the batch is full or the wait expires"""
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if len(batch) >= self._inflight and self._queue.empty():
+                # Every waiting request is already in this batch
+                break
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            futures = [future for _, future in batch]
+            outputs = error = None
+            try:
+                outputs = self.predict_fn(np.stack([features for features, _ in batch]))
+            except Exception as e:
+                error = e
+
+            # Settle the counters before waking the callers so their next requests
+            # are not mistaken for rows still waiting on this batch
+            with self._lock:
+                self._inflight -= len(batch)
+            self._record(len(batch))
+
+            for i, future in enumerate(futures):
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(outputs[i])
+
+    def _record(self, size):
+        self.batches += 1
+        self.rows += size
+        for i, bucket in enumerate(self.batch_size_buckets):
+            if size <= bucket:
+                self.batch_size_counts[i] += 1
+                break
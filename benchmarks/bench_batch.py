@@ -0,0 +1,67 @@
+"""Throughput of /predict/batch vs. one /predict call per sample (Flask test client).
+
+Usage:
+    python benchmarks/bench_batch.py [--samples 2000] [--batch-size 1000] [--no-ml]
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from datasets import synthetic_queries  # noqa: E402
+
+import app as agrosmart  # noqa: E402
+
+
+def logged_in_client():
+    client = agrosmart.app.test_client()
+    client.post('/login', data={'username': 'farmer', 'password': '12345'})
+    return client
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--samples', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--single-samples', type=int, default=500,
+                        help='samples sent through the single-row endpoint')
+    parser.add_argument('--no-ml', action='store_true', help='benchmark the dataset fallbacks only')
+    args = parser.parse_args()
+
+    agrosmart.logger.disabled = True
+    if args.no_ml:
+        agrosmart.registry.current = agrosmart.registry.current.derive(model=None)
+
+    queries = synthetic_queries(args.samples)
+    client = logged_in_client()
+
+    start = time.perf_counter()
+    single = [client.post('/predict', json=q).get_json() for q in queries[:args.single_samples]]
+    single_rate = len(single) / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    batched = []
+    for i in range(0, len(queries), args.batch_size):
+        response = client.post('/predict/batch', json=queries[i:i + args.batch_size])
+        batched.extend(response.get_json()['results'])
+    batch_rate = len(batched) / (time.perf_counter() - start)
+
+    mismatches = sum(
+        (a['recommendation'], a['method']) != (b['recommendation'], b['method'])
+        or abs(a['confidence'] - b['confidence']) > 1e-3
+        for a, b in zip(single, batched)
+    )
+    methods = sorted({r['method'] for r in batched})
+    print(f"methods: {', '.join(methods)}")
+    print(f"/predict        {single_rate:>10.0f} rows/s")
+    print(f"/predict/batch  {batch_rate:>10.0f} rows/s  ({batch_rate / single_rate:.0f}x, "
+          f"batch size {args.batch_size})")
+    print(f"mismatches vs single-row endpoint: {mismatches}/{len(single)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""Carbon footprint engine: per-stage time for many plots, and the original JS formula.
+
+Usage:
+    python benchmarks/bench_carbon.py [--plots 1 1000 100000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from carbon import CarbonEngine, read_plots  # noqa: E402
+
+
+def legacy_footprint(plot):
+    """calculateCarbonFootprint from static/js/script.js, kept as the baseline"""
+    fertilizer_amount = (plot['area'] or 1) * 0.1
+    return fertilizer_amount * 2.5
+
+
+def best_ms(function, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, (time.perf_counter() - start) * 1000)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--plots', type=int, nargs='+', default=[1, 1000, 100000])
+    parser.add_argument('--repeats', type=int, default=10)
+    args = parser.parse_args()
+
+    engine = CarbonEngine()
+    rng = np.random.default_rng(42)
+    print(f"{'plots':>8} {'parse ms':>9} {'assess ms':>10} {'summary ms':>11} {'total ms':>9} "
+          f"{'kg CO2e':>14} {'JS formula':>12}")
+    for n_plots in args.plots:
+        columns = {
+            'fertilizer': rng.choice(engine.names, n_plots).tolist(),
+            'area': rng.uniform(0.5, 20, n_plots).round(2).tolist(),
+            'fertilizer_amount': rng.uniform(50, 300, n_plots).round(1).tolist(),
+            'machinery_hours': rng.uniform(0, 200, n_plots).round(1).tolist(),
+        }
+        parse_ms, (plots, _) = best_ms(lambda: read_plots({'columns': columns}), args.repeats)
+        assess_ms, (codes, result) = best_ms(lambda: engine.assess(plots), args.repeats)
+        summary_ms, summary = best_ms(lambda: engine.summarize(codes, result), args.repeats)
+        legacy = sum(legacy_footprint({'area': area}) for area in columns['area'])
+        print(f"{n_plots:>8} {parse_ms:>9.3f} {assess_ms:>10.3f} {summary_ms:>11.3f} "
+              f"{parse_ms + assess_ms + summary_ms:>9.3f} {summary['total_kg_co2e']:>14.1f} {legacy:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
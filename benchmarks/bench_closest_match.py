@@ -0,0 +1,95 @@
+"""Closest-match latency: original iterrows loop vs. SimilarityEngine.
+
+Usage:
+    python benchmarks/bench_closest_match.py [--sizes 1200 10000 100000 1000000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datasets import load_seed, synthetic_dataset, synthetic_queries  # noqa: E402
+from matching import SimilarityEngine  # noqa: E402
+
+
+def legacy_closest_match(df, input_row):
+    """The original find_closest_match loop, kept as the baseline"""
+    filtered_df = df[
+        (df['Soil Type'] == input_row['Soil Type']) &
+        (df['Crop Type'] == input_row['Crop Type'])
+    ]
+    if filtered_df.empty:
+        filtered_df = df[df['Crop Type'] == input_row['Crop Type']]
+    if filtered_df.empty:
+        filtered_df = df
+
+    numeric_cols = ['Temperature', 'Humidity', 'Moisture', 'Nitrogen', 'Phosphorus', 'Potassium']
+    scores = []
+    for _, row in filtered_df.iterrows():
+        score = 0
+        for col in numeric_cols:
+            diff = abs(row[col] - input_row[col])
+            max_val = df[col].max()
+            min_val = df[col].min()
+            range_val = max_val - min_val if max_val != min_val else 1
+            score += (1 - diff / range_val)
+        scores.append(score / len(numeric_cols))
+
+    best_idx = np.argmax(scores)
+    return filtered_df.iloc[best_idx]['Fertilizer Name'], scores[best_idx]
+
+
+def time_calls(fn, queries):
+    """Per-call latencies in milliseconds"""
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1200, 10000, 100000, 1000000])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--legacy-queries', type=int, default=5,
+                        help='queries timed against the original loop (it is very slow)')
+    parser.add_argument('--legacy-max-rows', type=int, default=10000,
+                        help='skip the original loop above this dataset size')
+    args = parser.parse_args()
+
+    template = load_seed()
+    print(f"{'rows':>9} {'build ms':>9} {'new p50':>9} {'new p99':>9} "
+          f"{'old p50':>10} {'old p99':>10} {'p50 gain':>9}")
+
+    for size in args.sizes:
+        df = template if size == len(template) else synthetic_dataset(size, template=template)
+        queries = synthetic_queries(args.queries, template=template)
+
+        start = time.perf_counter()
+        engine = SimilarityEngine(df)
+        build_ms = (time.perf_counter() - start) * 1000
+        new = time_calls(engine.closest, queries)
+
+        old_p50 = old_p99 = gain = float('nan')
+        if size <= args.legacy_max_rows:
+            legacy_queries = queries[:args.legacy_queries]
+            old = time_calls(lambda q: legacy_closest_match(df, q), legacy_queries)
+            for query in legacy_queries:
+                expected = legacy_closest_match(df, query)
+                position, score = engine.closest(query)
+                assert (engine.labels[position], score) == expected, query
+            old_p50, old_p99 = np.percentile(old, 50), np.percentile(old, 99)
+            gain = old_p50 / np.percentile(new, 50)
+
+        print(f"{size:>9} {build_ms:>9.1f} {np.percentile(new, 50):>9.3f} {np.percentile(new, 99):>9.3f} "
+              f"{old_p50:>10.1f} {old_p99:>10.1f} {gain:>8.0f}x")
+
+
+if __name__ == '__main__':
+    main()
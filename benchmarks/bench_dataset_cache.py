@@ -0,0 +1,105 @@
+"""Cold-start time and per-worker memory: pd.read_csv vs. the memory-mapped cache.
+
+Writes a synthetic CSV, then starts N fresh worker processes per mode that each
+load the dataset, touch every column, and report load time, RSS and PSS (PSS
+splits shared pages between the processes mapping them).
+
+Usage:
+    python benchmarks/bench_dataset_cache.py [--rows 1000000] [--workers 4]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def memory_kb():
+    """(RSS, PSS) of this process in kB from /proc/self/smaps_rollup"""
+    values = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Pss:'):
+                values[parts[0][:-1]] = int(parts[1])
+    return values['Rss'], values['Pss']
+
+
+def worker(mode, csv_path, cache_dir, barrier, results):
+    import pandas as pd
+    import dataset_cache
+
+    baseline_rss, baseline_pss = memory_kb()
+    start = time.perf_counter()
+    if mode == 'csv':
+        frame = pd.read_csv(csv_path)
+    else:
+        frame = dataset_cache.load_dataset(csv_path, cache_dir)
+    elapsed = time.perf_counter() - start
+
+    # Touch every column so mapped pages are actually resident
+    for name in frame.columns:
+        column = frame[name]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            int(np.asarray(column.cat.codes).sum())
+        elif pd.api.types.is_numeric_dtype(column):
+            float(np.asarray(column).sum())
+        else:
+            column.nunique()
+
+    barrier.wait()
+    rss, pss = memory_kb()
+    results.put((elapsed, rss - baseline_rss, pss - baseline_pss))
+    barrier.wait()
+
+
+def run_mode(mode, csv_path, cache_dir, workers):
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(mode, csv_path, cache_dir, barrier, results))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    rows = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    from datasets import synthetic_dataset
+    import dataset_cache
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'dataset.csv')
+        cache_dir = os.path.join(tmp, 'cache')
+        synthetic_dataset(args.rows).to_csv(csv_path, index=False)
+
+        start = time.perf_counter()
+        dataset_cache.build_cache(csv_path, cache_dir, dataset_cache.current_digest(csv_path, cache_dir))
+        build_s = time.perf_counter() - start
+
+        print(f"{args.rows} rows, {os.path.getsize(csv_path) / 1e6:.0f} MB CSV, "
+              f"{args.workers} workers, cache build {build_s:.2f} s")
+        print(f"{'mode':<6} {'load s':>8} {'RSS MB':>8} {'PSS MB':>8}   (mean per worker, dataset only)")
+        for mode in ('csv', 'cache'):
+            rows = np.array(run_mode(mode, csv_path, cache_dir, args.workers))
+            load_s, rss_kb, pss_kb = rows.mean(axis=0)
+            print(f"{mode:<6} {load_s:>8.3f} {rss_kb / 1024:>8.1f} {pss_kb / 1024:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
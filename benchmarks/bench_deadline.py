@@ -0,0 +1,107 @@
+"""/predict stage latency: sequential stages vs. the deadline race.
+
+Runs app.run_recommendation_stages() in process on the same queries twice: with
+the stages in sequence (AGROSMART_PREDICT_DEADLINE_MS=0) and with the model raced
+against the dataset fallbacks under a latency budget. The "stalls" scenario sends every
+request to the network and pauses one model call in --stall-every for
+--stall-ms (a first-call graph trace or a GC pause). The "tiered" scenario uses
+the served artifacts unchanged, to show what the race costs when nothing stalls.
+
+Usage:
+    python benchmarks/bench_deadline.py [--queries 2000] [--deadline-ms 10] [--stall-every 50] [--stall-ms 100]
+"""
+import argparse
+import itertools
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('AGROSMART_CACHE_SIZE', '0')
+os.environ.setdefault('AGROSMART_HISTORY_DB', '')
+os.environ['AGROSMART_PREDICT_DEADLINE_MS'] = '0'
+
+from datasets import synthetic_queries  # noqa: E402
+import app as agrosmart  # noqa: E402
+
+
+class StallingModel:
+    """Wraps the serving model, pausing one call in every `every`"""
+
+    def __init__(self, model, every, stall_seconds):
+        self.model = model
+        self.every = every
+        self.stall_seconds = stall_seconds
+        self._calls = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def predict(self, inputs, verbose=0):
+        with self._lock:
+            call = next(self._calls)
+        if call % self.every == 0:
+            time.sleep(self.stall_seconds)
+        return self.model.predict(inputs, verbose=verbose)
+
+
+def set_deadline(deadline_ms):
+    """Switch app.run_recommendation_stages() between the sequential stages and the race"""
+    agrosmart.PREDICT_DEADLINE_MS = deadline_ms
+    if deadline_ms > 0 and agrosmart.ml_pool is None:
+        agrosmart.ml_pool = ThreadPoolExecutor(agrosmart.RACE_POOL_WORKERS, thread_name_prefix='race-ml')
+        agrosmart.fallback_pool = ThreadPoolExecutor(agrosmart.RACE_POOL_WORKERS,
+                                                     thread_name_prefix='race-fallback')
+    elif deadline_ms <= 0:
+        agrosmart.ml_pool = agrosmart.fallback_pool = None
+
+
+def run(artifacts, queries):
+    """Per-call latencies in milliseconds and the share each method answered"""
+    latencies, methods = [], {}
+    with agrosmart.app.test_request_context():
+        for query in queries[:20]:
+            agrosmart.run_recommendation_stages(dict(query), artifacts)
+        for query in queries:
+            start = time.perf_counter()
+            recommendation = agrosmart.run_recommendation_stages(dict(query), artifacts)
+            latencies.append((time.perf_counter() - start) * 1000)
+            method = recommendation['method'] + (' (late model)' if recommendation.get('deadline_exceeded') else '')
+            methods[method] = methods.get(method, 0) + 1
+    return np.array(latencies), {method: count / len(queries) for method, count in sorted(methods.items())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--deadline-ms', type=float, default=10.0)
+    parser.add_argument('--stall-every', type=int, default=50)
+    parser.add_argument('--stall-ms', type=float, default=100.0)
+    args = parser.parse_args()
+
+    agrosmart.registry.ready.wait()
+    served = agrosmart.registry.current
+    if not served.ml_ready:
+        sys.exit('The benchmark needs the trained model artifacts')
+    queries = synthetic_queries(args.queries)
+    scenarios = {
+        'stalls': served.derive(model=StallingModel(served.model, args.stall_every, args.stall_ms / 1000),
+                                batcher=None, student=None, grid=None),
+        'tiered': served,
+    }
+
+    print(f"{'scenario':<8} {'mode':<14} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}  answered by")
+    for name, artifacts in scenarios.items():
+        for label, deadline_ms in (('sequential', 0), (f"race {args.deadline_ms:g} ms", args.deadline_ms)):
+            set_deadline(deadline_ms)
+            latencies, methods = run(artifacts, queries)
+            shares = ', '.join(f"{method} {share:.1%}" for method, share in methods.items())
+            print(f"{name:<8} {label:<14} {np.percentile(latencies, 50):>8.3f} "
+                  f"{np.percentile(latencies, 99):>8.3f} {latencies.max():>8.1f}  {shares}")
+    set_deadline(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Cold-start benchmark: `python -X importtime` plus time until /api/ready.
+
+Runs app.py in fresh interpreters in eager and background loading modes and
+writes a report (default: benchmarks/results/startup.txt).
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 3] [--out benchmarks/results/startup.txt]
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+first = app.app.test_client().get('/api/ready').status_code
+app.registry.ready.wait()
+ready = time.perf_counter()
+print('RESULT ' + json.dumps({'import_s': imported - start, 'ready_s': ready - start,
+                              'ready_status_at_import': first, 'artifacts': app.registry.status}))
+"""
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def run_probe(background, importtime=False):
+    """Start the app in a fresh interpreter; returns (result dict, stderr)"""
+    env = dict(os.environ, AGROSMART_BACKGROUND_LOAD='1' if background else '0')
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', PROBE]
+    completed = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    line = next(l for l in completed.stdout.splitlines() if l.startswith('RESULT '))
+    return json.loads(line[len('RESULT '):]), completed.stderr
+
+
+# Modules worth tracking on the startup path
+TRACKED_MODULES = ['app', 'flask', 'pandas', 'numpy', 'sklearn', 'sklearn.neighbors', 'joblib',
+                   'h5py', 'tensorflow']
+
+
+def module_import_times(stderr):
+    """Cumulative import seconds per tracked module from -X importtime output.
+
+    Loader threads import concurrently, which scrambles the nesting indentation,
+    so modules are matched by name rather than by depth.
+    """
+    times = {}
+    for match in IMPORTTIME_LINE.finditer(stderr):
+        _, cumulative, _, name = match.groups()
+        if name in TRACKED_MODULES:
+            times[name] = max(times.get(name, 0), int(cumulative) / 1e6)
+    return times
+
+
+def tensorflow_import_cost():
+    """Cumulative import time of tensorflow.keras.models, which app.py used to import eagerly"""
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import tensorflow.keras.models'],
+                               cwd=ROOT, capture_output=True, text=True)
+    if completed.returncode != 0:
+        return None
+    return module_import_times(completed.stderr).get('tensorflow')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--out', default=os.path.join(ROOT, 'benchmarks', 'results', 'startup.txt'))
+    args = parser.parse_args()
+
+    lines = [f"python {sys.version.split()[0]}, {os.cpu_count()} CPU(s)", ""]
+    lines.append(f"{'mode':<11} {'import s':>9} {'ready s':>8}  (best of {args.runs})")
+    for background in (False, True):
+        results = [run_probe(background)[0] for _ in range(args.runs)]
+        best_import = min(r['import_s'] for r in results)
+        best_ready = min(r['ready_s'] for r in results)
+        mode = 'background' if background else 'eager'
+        lines.append(f"{mode:<11} {best_import:>9.3f} {best_ready:>8.3f}")
+
+    lines += ["", "Cumulative import seconds (-X importtime); '-' means not imported:"]
+    lines.append(f"  {'module':<18} {'eager':>7} {'background':>11}")
+    eager = module_import_times(run_probe(False, importtime=True)[1])
+    background = module_import_times(run_probe(True, importtime=True)[1])
+    for name in TRACKED_MODULES:
+        cells = [f"{t[name]:.3f}" if name in t else '-' for t in (eager, background)]
+        lines.append(f"  {name:<18} {cells[0]:>7} {cells[1]:>11}")
+
+    tf_cost = tensorflow_import_cost()
+    if tf_cost is not None:
+        lines += ["", f"tensorflow.keras.models import (no longer on the startup path): {tf_cost:.3f} s"]
+
+    report = "\n".join(lines) + "\n"
+    os.makedirs(os.path.dirname(args.out), exist_ok=True)
+    with open(args.out, 'w') as f:
+        f.write(report)
+    print(report, end='')
+
+
+if __name__ == '__main__':
+    main()
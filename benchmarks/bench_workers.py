@@ -0,0 +1,83 @@
+"""/predict throughput against the number of serve.py workers.
+
+Starts serve.py with each worker count (and the threaded development server for
+comparison), drives /predict from concurrent keep-alive clients as load_test.py
+does, and reports requests/s, latency and the memory the workers share with the
+master (Rss against Pss from /proc/<pid>/smaps_rollup, Linux only).
+
+The clients run on the same machine, so on a box with C cores the curve flattens
+once workers + client threads saturate them.
+
+Usage:
+    python benchmarks/bench_workers.py [--workers 1 2 4 8] [--clients 64] [--duration 10]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from datasets import synthetic_queries  # noqa: E402
+from load_test import start_server, login, run_clients  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def memory_kb(pid):
+    """Rss and Pss of one process in kB, None where smaps_rollup is unavailable"""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            fields = dict(line.split()[:2] for line in f if line.split()[0] in ('Rss:', 'Pss:'))
+        return int(fields['Rss:']), int(fields['Pss:'])
+    except OSError:
+        return None
+
+
+def worker_memory(master_pid):
+    """Summed Rss and Pss (MB) of the master and its workers"""
+    children = subprocess.run(['pgrep', '-P', str(master_pid)], capture_output=True, text=True).stdout.split()
+    usage = [memory_kb(pid) for pid in [master_pid] + children]
+    if None in usage:
+        return None, None
+    return sum(rss for rss, _ in usage) / 1024, sum(pss for _, pss in usage) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--clients', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--port', type=int, default=5078)
+    parser.add_argument('--no-dev-server', action='store_true', help='skip the app.run() baseline')
+    args = parser.parse_args()
+
+    queries = synthetic_queries(1000)
+    # The history writer and the recommendation cache would measure SQLite and dict hits
+    env = {'AGROSMART_HISTORY_DB': '', 'AGROSMART_CACHE_SIZE': '0'}
+    modes = [] if args.no_dev_server else [('app.run', None)]
+    modes += [(f"{workers} workers", [sys.executable, 'serve.py', '--workers', str(workers),
+                                      '--bind', f"127.0.0.1:{args.port}", '--log-level', 'warning',
+                                      '--no-access-log'])
+              for workers in args.workers]
+
+    print(f"{os.cpu_count()} CPU(s), {args.clients} clients, {args.duration:g}s per run")
+    print(f"{'server':<12} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7} {'Rss MB':>8} {'Pss MB':>8}")
+    for name, command in modes:
+        server = start_server(args.port, env, command)
+        try:
+            cookie = login(args.port)
+            rate, latencies, errors = run_clients(args.port, cookie, args.clients, args.duration, queries)
+            rss, pss = worker_memory(server.pid)
+            memory = f"{rss:>8.0f} {pss:>8.0f}" if rss is not None else f"{'-':>8} {'-':>8}"
+            print(f"{name:<12} {rate:>8.0f} {np.percentile(latencies, 50):>8.1f} "
+                  f"{np.percentile(latencies, 99):>8.1f} {errors:>7} {memory}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Synthetic datasets shaped like Fertilizer_Prediction_gpt(1).csv"""
+import os
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATASET_PATH = os.path.join(ROOT, "Fertilizer_Prediction_gpt(1).csv")
+
+NUMERIC_COLS = ['Temperature', 'Humidity', 'Moisture', 'Nitrogen', 'Phosphorus', 'Potassium']
+INTEGER_COLS = ['Nitrogen', 'Phosphorus', 'Potassium']
+
+
+def load_seed():
+    """Load the shipped dataset used as the sampling template"""
+    return pd.read_csv(DATASET_PATH)
+
+
+def synthetic_dataset(n_rows, seed=0, template=None):
+    """Resample the shipped dataset to n_rows with small numeric jitter.
+
+    Categorical columns and labels keep their joint distribution; numeric
+    columns keep the dataset's rounding (integers for NPK, one decimal otherwise).
+    """
+    template = load_seed() if template is None else template
+    rng = np.random.default_rng(seed)
+    sampled = template.iloc[rng.integers(0, len(template), n_rows)].reset_index(drop=True)
+
+    for col in NUMERIC_COLS:
+        spread = (template[col].max() - template[col].min()) * 0.02
+        jitter = rng.normal(0, spread, n_rows)
+        values = sampled[col].to_numpy(dtype=np.float64) + jitter
+        if col in INTEGER_COLS:
+            sampled[col] = np.round(values).astype(np.int64)
+        else:
+            sampled[col] = np.round(values, 1)
+    return sampled
+
+
+def synthetic_queries(n_queries, seed=1, template=None):
+    """Input rows in the shape built by the /predict endpoint"""
+    frame = synthetic_dataset(n_queries, seed=seed, template=template)
+    rows = []
+    for record in frame.to_dict('records'):
+        row = {col: float(record[col]) for col in NUMERIC_COLS}
+        row['Soil Type'] = record['Soil Type']
+        row['Crop Type'] = record['Crop Type']
+        rows.append(row)
+    return rows
+
+
+def write_synthetic_csv(path, n_rows, seed=0, chunk_rows=1000000, template=None):
+    """Write an n_rows synthetic dataset to path chunk by chunk, so 10M rows fit in memory.
+
+    Returns path; an existing file with the right row count is reused.
+    """
+    if os.path.exists(path):
+        with open(path) as f:
+            if sum(1 for _ in f) - 1 == n_rows:
+                return path
+
+    template = load_seed() if template is None else template
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', newline='') as f:
+        for chunk, start in enumerate(range(0, n_rows, chunk_rows)):
+            frame = synthetic_dataset(min(chunk_rows, n_rows - start), seed=seed + chunk, template=template)
+            frame.to_csv(f, index=False, header=chunk == 0)
+    os.replace(tmp_path, path)
+    return path
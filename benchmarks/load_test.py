@@ -0,0 +1,130 @@
+"""Concurrent load test of /predict against a local threaded server.
+
+Starts app.py in a subprocess (so the client threads do not share its GIL),
+logs in once and hammers /predict from N concurrent keep-alive clients.
+
+Usage:
+    python benchmarks/load_test.py [--clients 50 100 200 500] [--duration 5] [--compare-microbatch]
+"""
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from datasets import synthetic_queries  # noqa: E402
+
+SERVER_CODE = (
+    "import logging, app; logging.getLogger('werkzeug').disabled = True; "
+    "app.logger.disabled = True; app.app.run(host='127.0.0.1', port={port}, threaded=True)"
+)
+
+
+def start_server(port, env_overrides, command=None):
+    """Launch the app in a subprocess and wait until it answers"""
+    env = dict(os.environ, **env_overrides)
+    command = command or [sys.executable, '-c', SERVER_CODE.format(port=port)]
+    process = subprocess.Popen(command, cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/login", timeout=1)
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError('server did not start')
+
+
+def login(port):
+    """Log in once and return the session cookie header"""
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    body = urllib.parse.urlencode({'username': 'farmer', 'password': '12345'})
+    connection.request('POST', '/login', body, {'Content-Type': 'application/x-www-form-urlencoded'})
+    response = connection.getresponse()
+    response.read()
+    return response.getheader('Set-Cookie').split(';')[0]
+
+
+def run_clients(port, cookie, clients, duration, queries, path='/predict'):
+    """Drive path from concurrent clients; returns (requests/s, latencies ms, errors)"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop = time.perf_counter() + duration
+    bodies = [json.dumps(q) for q in queries]
+    headers = {'Content-Type': 'application/json', 'Cookie': cookie}
+
+    def client(offset):
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local = []
+        i = offset
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            try:
+                connection.request('POST', path, bodies[i % len(bodies)], headers)
+                response = connection.getresponse()
+                response.read()
+                if response.status != 200:
+                    raise RuntimeError(response.status)
+                local.append((time.perf_counter() - start) * 1000)
+            except Exception:
+                with lock:
+                    errors[0] += 1
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            i += 1
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return len(latencies) / elapsed, np.array(latencies), errors[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, nargs='+', default=[50, 100, 200, 500])
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--port', type=int, default=5077)
+    parser.add_argument('--compare-microbatch', action='store_true',
+                        help='also run with AGROSMART_MICROBATCH=0 for comparison')
+    args = parser.parse_args()
+
+    queries = synthetic_queries(1000)
+    modes = [('microbatch', {'AGROSMART_MICROBATCH': '1'})]
+    if args.compare_microbatch:
+        modes.append(('no batching', {'AGROSMART_MICROBATCH': '0'}))
+
+    print(f"{'mode':<12} {'clients':>7} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for name, env in modes:
+        server = start_server(args.port, env)
+        try:
+            cookie = login(args.port)
+            for clients in args.clients:
+                rate, latencies, errors = run_clients(args.port, cookie, clients, args.duration, queries)
+                print(f"{name:<12} {clients:>7} {rate:>9.0f} {np.percentile(latencies, 50):>8.1f} "
+                      f"{np.percentile(latencies, 99):>8.1f} {errors:>7}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
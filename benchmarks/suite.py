@@ -0,0 +1,342 @@
+"""Reproducible benchmark suite for the prediction service.
+
+Generates synthetic datasets shaped like the shipped CSV (1k to 10M rows, cached
+under benchmarks/data/), micro-benchmarks the serving stages on them and
+load-tests /predict through the Flask test client and a local threaded WSGI
+server. Every run is written as JSON with its environment. `compare` (or
+`run --baseline`) exits with status 1 when any metric got worse than the
+threshold allows.
+
+The recommendation cache and history store are switched off, so repeated
+queries measure the pipeline rather than cache hits.
+
+Usage:
+    python benchmarks/suite.py run [--sizes 1000 10000 100000 1000000 10000000] [--quick]
+                                   [--out FILE] [--baseline FILE] [--threshold 0.25]
+    python benchmarks/suite.py compare BASELINE CURRENT [--threshold 0.25]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+os.environ.setdefault('AGROSMART_CACHE_SIZE', '0')
+os.environ.setdefault('AGROSMART_HISTORY_DB', '')
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+DATA_DIR = os.path.join(BENCH_DIR, 'data')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+from datasets import synthetic_queries, write_synthetic_csv  # noqa: E402
+from load_test import start_server, login, run_clients  # noqa: E402
+
+SIZES = [1000, 10000, 100000, 1000000, 10000000]
+QUICK_SIZES = [1000, 10000]
+# Calls timed per micro-benchmark, and the seconds after which a slow one stops early
+MICRO_CALLS = 2000
+MICRO_BUDGET_SECONDS = 5.0
+MIN_CALLS = 50
+# Untimed calls first, so one-off costs (caches, lazy imports, allocator growth) are excluded
+WARMUP_CALLS = 20
+# Rows per call in the batch micro-benchmarks
+BATCH_ROWS = 1000
+BATCH_REPEATS = 50
+TEST_CLIENT_REQUESTS = 2000
+SERVER_CLIENTS = [1, 8, 32]
+SERVER_DURATION = 5.0
+SERVER_PORT = 5079
+THRESHOLD = 0.25
+# Changes smaller than this are timer noise and never count as regressions
+MIN_ABSOLUTE_CHANGE = {'s': 0.05, 'ms': 0.5, 'us': 2.0, 'req/s': 0.0}
+
+
+def time_calls(fn, items, budget=MICRO_BUDGET_SECONDS):
+    """Per-call latencies in microseconds, stopping early once budget seconds have passed"""
+    for item in items[:WARMUP_CALLS]:
+        fn(item)
+    latencies = []
+    deadline = time.perf_counter() + budget
+    for item in items:
+        start = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - start)
+        if start > deadline and len(latencies) >= MIN_CALLS:
+            break
+    return np.array(latencies) * 1e6
+
+
+def record(results, name, value, unit, better='lower', gate=True):
+    """Store one metric; gate=False reports it without checking it for regressions"""
+    results[name] = {'value': round(float(value), 3), 'unit': unit, 'better': better, 'gate': gate}
+
+
+def record_latency(results, name, latencies_us):
+    record(results, f"{name}.p50_us", np.percentile(latencies_us, 50), 'us')
+    # Tail latency on a shared machine is too noisy to gate on
+    record(results, f"{name}.p99_us", np.percentile(latencies_us, 99), 'us', gate=False)
+    print(f"  {name:<42} p50 {np.percentile(latencies_us, 50):>10.1f} µs   "
+          f"p99 {np.percentile(latencies_us, 99):>10.1f} µs   ({len(latencies_us)} calls)")
+
+
+def model_benchmarks(app, results, calls):
+    """Encoder, network, student, grid and the tiered predict_with_ml_model"""
+    artifacts = app.registry.current
+    if not artifacts.ml_ready or artifacts.feature_encoder is None:
+        print("  ML artifacts not available, skipping the model benchmarks")
+        return
+
+    queries = synthetic_queries(calls, seed=11)
+    encoder, model = artifacts.feature_encoder, artifacts.model
+    features = encoder.transform_batch(pd.DataFrame(queries))
+    batches = [pd.DataFrame(synthetic_queries(BATCH_ROWS, seed=15))] * BATCH_REPEATS
+
+    record_latency(results, 'micro.encoder.transform_row', time_calls(encoder.transform_row, queries))
+    record_latency(results, f'micro.encoder.transform_batch_{BATCH_ROWS}',
+                   time_calls(encoder.transform_batch, batches))
+    record_latency(results, 'micro.model.predict_row',
+                   time_calls(lambda row: model.predict(row.reshape((1, 1, -1))), features))
+    record_latency(results, f'micro.model.predict_batch_{BATCH_ROWS}',
+                   time_calls(lambda batch: model.predict(encoder.transform_batch(batch)), batches))
+    if artifacts.student is not None:
+        record_latency(results, 'micro.student.predict_row', time_calls(artifacts.student.predict_row, features))
+    if artifacts.grid is not None:
+        record_latency(results, 'micro.grid.lookup', time_calls(artifacts.grid.lookup, queries))
+    record_latency(results, 'micro.predict_with_ml_model',
+                   time_calls(lambda row: app.predict_with_ml_model(row, artifacts), queries))
+
+
+def dataset_benchmarks(size, calls):
+    """Index build time, predict_with_dataset and find_closest_match on an n-row dataset.
+
+    Runs in a child process (see run_dataset_benchmarks) and returns its results.
+    """
+    import app
+    from dataset_cache import load_dataset
+    from matching import SimilarityEngine, ExactMatchIndex
+
+    app.registry.ready.wait()
+    results = {}
+    start = time.perf_counter()
+    path = write_synthetic_csv(os.path.join(DATA_DIR, f"synthetic_{size}.csv"), size)
+    generate_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    df = load_dataset(path, cache_dir=os.path.join(DATA_DIR, 'cache'))
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    exact_index = ExactMatchIndex(df)
+    exact_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    matcher = SimilarityEngine(df)
+    matcher_seconds = time.perf_counter() - start
+    print(f"  {size} rows: generated in {generate_seconds:.1f}s, loaded in {load_seconds:.1f}s, "
+          f"exact index {exact_seconds:.2f}s, similarity engine {matcher_seconds:.2f}s")
+    record(results, f'micro.dataset.{size}.load_s', load_seconds, 's')
+    record(results, f'micro.dataset.{size}.exact_index_build_s', exact_seconds, 's')
+    record(results, f'micro.dataset.{size}.matcher_build_s', matcher_seconds, 's')
+
+    artifacts = app.registry.current.derive(df=df, exact_index=exact_index, matcher=matcher)
+    # Half the queries are dataset rows (exact hits), half jittered rows (mostly misses)
+    rows = df.iloc[np.random.default_rng(3).integers(0, len(df), calls // 2)]
+    hits = [app.parse_input_row(row) for row in rows[app.REQUIRED_FIELDS].to_dict('records')]
+    queries = [query for pair in zip(hits, synthetic_queries(calls // 2, seed=12)) for query in pair]
+    record_latency(results, f'micro.predict_with_dataset.{size}',
+                   time_calls(lambda row: app.predict_with_dataset(row, artifacts), queries))
+    record_latency(results, f'micro.find_closest_match.{size}',
+                   time_calls(lambda row: app.find_closest_match(row, artifacts), queries))
+    return results
+
+
+def run_dataset_benchmarks(results, size, calls):
+    """Benchmark one dataset size in a fresh process; returns False if it died (e.g. out of memory)"""
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(1, mp_context=context) as pool:
+        try:
+            results.update(pool.submit(dataset_benchmarks, size, calls).result())
+            return True
+        except BrokenProcessPool:
+            print(f"  {size} rows: benchmark process died (out of memory?), skipping this size")
+            return False
+
+
+def test_client_benchmark(app, results, requests):
+    """Sequential /predict requests through the Flask test client"""
+    client = app.app.test_client()
+    with client.session_transaction() as session:
+        session['logged_in'] = True
+        session['username'] = 'benchmark'
+
+    queries = synthetic_queries(requests, seed=13)
+    def post(query):
+        response = client.post('/predict', json=query)
+        if response.status_code != 200:
+            raise RuntimeError(f"/predict returned {response.status_code}")
+
+    start = time.perf_counter()
+    latencies = time_calls(post, queries, budget=float('inf'))
+    elapsed = time.perf_counter() - start
+    record_latency(results, 'e2e.test_client.predict', latencies)
+    record(results, 'e2e.test_client.predict.requests_per_s', len(latencies) / elapsed, 'req/s', 'higher')
+
+
+def server_benchmark(results, clients_list, duration, port):
+    """Concurrent keep-alive clients against app.py served by the threaded WSGI server"""
+    env = {'AGROSMART_CACHE_SIZE': os.environ['AGROSMART_CACHE_SIZE'],
+           'AGROSMART_HISTORY_DB': os.environ['AGROSMART_HISTORY_DB']}
+    server = start_server(port, env)
+    try:
+        cookie = login(port)
+        queries = synthetic_queries(1000, seed=14)
+        for clients in clients_list:
+            rate, latencies, errors = run_clients(port, cookie, clients, duration, queries)
+            name = f'e2e.server.predict.{clients}_clients'
+            record(results, f'{name}.requests_per_s', rate, 'req/s', 'higher')
+            record(results, f'{name}.p50_ms', np.percentile(latencies, 50), 'ms')
+            record(results, f'{name}.p99_ms', np.percentile(latencies, 99), 'ms', gate=False)
+            record(results, f'{name}.errors', errors, 'count')
+            print(f"  {name:<42} {rate:>8.0f} req/s   p50 {np.percentile(latencies, 50):.2f} ms   "
+                  f"p99 {np.percentile(latencies, 99):.2f} ms   {errors} errors")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def environment(app, sizes, quick):
+    """What a result depends on, so runs are only compared like for like"""
+    import sklearn
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'sklearn': sklearn.__version__,
+        'model_version': app.registry.current.version,
+        'sizes': sizes,
+        'quick': quick,
+        'env': {key: value for key, value in os.environ.items() if key.startswith('AGROSMART_')},
+    }
+
+
+def compare(baseline, current, threshold):
+    """Print every shared metric's change; returns the names that regressed beyond threshold"""
+    regressions = []
+    print(f"{'metric':<58} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name in sorted(set(baseline['results']) & set(current['results'])):
+        old, new = baseline['results'][name], current['results'][name]
+        if old['unit'] == 'count':
+            worse = new['value'] > old['value']
+            change = new['value'] - old['value']
+            text = f"{change:+.0f}"
+        elif old['value']:
+            change = (new['value'] - old['value']) / old['value']
+            worse = change > threshold if old['better'] == 'lower' else change < -threshold
+            worse = (worse and old.get('gate', True) and
+                     abs(new['value'] - old['value']) > MIN_ABSOLUTE_CHANGE.get(old['unit'], 0.0))
+            text = f"{change:+.1%}"
+        else:
+            continue
+        flag = '  ❌' if worse else ('' if old.get('gate', True) else '  (not gated)')
+        print(f"{name:<58} {old['value']:>12.3f} {new['value']:>12.3f} {text:>8}{flag}")
+        if worse:
+            regressions.append(name)
+
+    missing = sorted(set(baseline['results']) - set(current['results']))
+    if missing:
+        print(f"Not measured in this run: {', '.join(missing)}")
+    if baseline['meta'].get('cpus') != current['meta'].get('cpus'):
+        print("⚠️ The runs used different CPU counts; differences may not be regressions")
+    return regressions
+
+
+def run(args):
+    sizes = args.sizes or (QUICK_SIZES if args.quick else SIZES)
+    calls = MICRO_CALLS // 4 if args.quick else MICRO_CALLS
+
+    import app
+    app.registry.ready.wait()
+    results = {}
+
+    print("Model benchmarks")
+    model_benchmarks(app, results, calls)
+    print("Dataset benchmarks")
+    # Each size runs in its own process, so sizes do not share memory and one that
+    # exhausts it does not take the rest of the run down
+    failed_sizes = [size for size in sizes if not run_dataset_benchmarks(results, size, calls)]
+    print("End-to-end /predict")
+    test_client_benchmark(app, results, TEST_CLIENT_REQUESTS // 4 if args.quick else TEST_CLIENT_REQUESTS)
+    if not args.no_server:
+        server_benchmark(results, SERVER_CLIENTS, SERVER_DURATION / 5 if args.quick else SERVER_DURATION,
+                         args.port)
+
+    report = {'meta': dict(environment(app, sizes, args.quick), failed_sizes=failed_sizes), 'results': results}
+    out = args.out or os.path.join(RESULTS_DIR, f"suite-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"📝 {len(results)} results written to {out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.threshold)
+        if regressions:
+            print(f"❌ {len(regressions)} metric(s) regressed more than {args.threshold:.0%}")
+            sys.exit(1)
+        print("✅ No regressions")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run the suite and write its JSON results')
+    run_parser.add_argument('--sizes', type=int, nargs='+', help=f'dataset sizes (default {SIZES})')
+    run_parser.add_argument('--quick', action='store_true', help='small sizes and fewer calls, for a smoke run')
+    run_parser.add_argument('--no-server', action='store_true', help='skip the WSGI server load test')
+    run_parser.add_argument('--port', type=int, default=SERVER_PORT)
+    run_parser.add_argument('--out', help='result file (default benchmarks/results/suite-<timestamp>.json)')
+    run_parser.add_argument('--baseline', help='fail when a metric regressed against this result file')
+    run_parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                            help='allowed relative change before a metric counts as regressed')
+
+    compare_parser = commands.add_parser('compare', help='compare two result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=THRESHOLD)
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run(args)
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        if regressions:
+            print(f"❌ {len(regressions)} metric(s) regressed more than {args.threshold:.0%}")
+            sys.exit(1)
+        print("✅ No regressions")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,279 @@
+"""Carbon footprint of fertilizer use, computed with NumPy over many plots at once.
+
+Emission factors are per kg of fertilizer product and keyed by the names the
+fertilizer encoder emits. A plot's footprint has four parts:
+- the factory emissions of the fertilizer it received,
+- the field emissions of that fertilizer's nitrogen: direct N2O at the IPCC 2019
+  default of 1% of applied N with a GWP100 of 273, plus the CO2 that urea
+  releases on hydrolysis,
+- diesel burned by machinery,
+- diesel burned by transport.
+Every step is a whole-array operation, so one field and a co-op's 100,000 plots
+go through the same few NumPy calls.
+"""
+import math
+
+import numpy as np
+
+# kg CO2e per kg of N2O (IPCC AR6 GWP100)
+N2O_GWP = 273
+# kg N2O-N emitted per kg of N applied (IPCC 2019 direct emission factor)
+N2O_EMISSION_FACTOR = 0.01
+N2O_PER_N2O_N = 44 / 28
+# kg CO2 released per kg of urea on hydrolysis (IPCC 2006: 0.20 kg C per kg)
+UREA_CO2 = 0.20 * 44 / 12
+# kg CO2 per machinery hour: about 10 L of diesel per tractor hour at 2.68 kg CO2/L
+MACHINERY_CO2_PER_HOUR = 26.8
+# kg CO2 per km driven by a light delivery truck
+TRANSPORT_CO2_PER_KM = 0.25
+# kg CO2 one tree absorbs per year
+TREE_CO2_PER_YEAR = 22.0
+# Model probability an alternative needs to be offered as the lowest-emission option
+ALTERNATIVE_MIN_PROBABILITY = 0.05
+
+# Per fertilizer, by the names the fertilizer encoder emits:
+# - production: kg CO2e per kg of product, cradle to farm gate
+# - nitrogen: N mass fraction
+# - field_co2: CO2 the product itself releases in the field (kg per kg)
+# - rate: typical application in kg/ha, used when a plot gives none
+EMISSION_FACTORS = {
+    'Compost': {'production': 0.05, 'nitrogen': 0.015, 'field_co2': 0.0, 'rate': 5000.0},
+    'DAP': {'production': 1.0, 'nitrogen': 0.18, 'field_co2': 0.0, 'rate': 100.0},
+    'MOP': {'production': 0.25, 'nitrogen': 0.0, 'field_co2': 0.0, 'rate': 80.0},
+    'NPK': {'production': 1.2, 'nitrogen': 0.15, 'field_co2': 0.0, 'rate': 200.0},
+    'Urea': {'production': 1.9, 'nitrogen': 0.46, 'field_co2': UREA_CO2, 'rate': 150.0},
+}
+
+# Plot fields (named like the calculator form) and whether each one is required
+PLOT_FIELDS = {
+    'fertilizer': True,
+    'area': True,              # hectares
+    'fertilizer_amount': False,  # kg/ha, defaults to the fertilizer's typical rate
+    'machinery_hours': False,
+    'transportation': False,   # km
+}
+# Per-plot result columns, all in kg (CO2e unless named fertilizer_kg)
+RESULT_COLS = ['fertilizer_kg', 'production', 'field', 'machinery', 'transport', 'total']
+
+
+def read_plots(data):
+    """Plot columns from a request payload, and whether it was columnar.
+
+    The payload is one plot object, {"plots": [plot, ...]}, or
+    {"columns": {field: [values]}}. Raises ValueError with the message returned
+    to the client.
+    """
+    if not isinstance(data, dict):
+        raise ValueError('Expected a JSON object')
+    if 'columns' in data:
+        columns = data['columns']
+        if not isinstance(columns, dict):
+            raise ValueError('"columns" must map field names to arrays')
+        columnar = True
+    else:
+        plots = data['plots'] if 'plots' in data else [data]
+        if not isinstance(plots, list) or not all(isinstance(plot, dict) for plot in plots):
+            raise ValueError('"plots" must be an array of objects')
+        columns = {field: [plot.get(field) for plot in plots]
+                   for field in PLOT_FIELDS if any(field in plot for plot in plots)}
+        columnar = False
+
+    lengths = {len(values) for values in columns.values() if isinstance(values, list)}
+    if len(lengths) > 1:
+        raise ValueError('All columns must have the same length')
+    for field, required in PLOT_FIELDS.items():
+        if field not in columns:
+            if required:
+                raise ValueError(f'Missing required field: {field}')
+        elif not isinstance(columns[field], list):
+            raise ValueError(f'Column {field} must be an array')
+    return {field: columns[field] for field in PLOT_FIELDS if field in columns}, columnar
+
+
+def numeric_column(columns, field, n_plots, default):
+    """float64 column of non-negative numbers, with missing values set to default"""
+    values = columns.get(field)
+    if values is None:
+        return np.full(n_plots, default)
+    try:
+        array = np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise ValueError(f'{field} must be numeric')
+    if array.ndim != 1:
+        raise ValueError(f'{field} must be a flat array of numbers')
+    missing = np.isnan(array)
+    if PLOT_FIELDS[field] and missing.any():
+        raise ValueError(f'{field} is missing for plot {int(np.argmax(missing))}')
+    invalid = ~missing & ~(np.isfinite(array) & (array >= 0))
+    if invalid.any():
+        raise ValueError(f'{field} must be a non-negative number (plot {int(np.argmax(invalid))})')
+    array[missing] = default
+    return array
+
+
+class CarbonEngine:
+    """Vectorized footprint calculator over an emission-factor table"""
+
+    def __init__(self, factors=None):
+        factors = factors or EMISSION_FACTORS
+        self.names = np.array(sorted(factors), dtype=object)
+        self._codes = {name: code for code, name in enumerate(self.names)}
+        table = [factors[name] for name in self.names]
+        self.production = np.array([entry['production'] for entry in table])
+        self.field = np.array([entry['nitrogen'] * N2O_EMISSION_FACTOR * N2O_PER_N2O_N * N2O_GWP
+                               + entry['field_co2'] for entry in table])
+        self.per_kg = self.production + self.field
+        self.default_rate = np.array([entry['rate'] for entry in table])
+
+    def codes(self, fertilizers):
+        """Table positions of fertilizer names, -1 for names without factors"""
+        lookup = self._codes
+        return np.fromiter((lookup.get(name, -1) for name in fertilizers), dtype=np.intp, count=len(fertilizers))
+
+    def footprint(self, codes, area, rate=None, machinery_hours=None, transport_km=None):
+        """Per-plot area and emissions as a dict of arrays ('area' and RESULT_COLS).
+
+        A NaN rate takes the fertilizer's typical rate.
+        """
+        codes = np.asarray(codes, dtype=np.intp)
+        area = np.asarray(area, dtype=np.float64)
+        default_rate = self.default_rate[codes]
+        rate = default_rate if rate is None else np.where(np.isnan(rate), default_rate, rate)
+        fertilizer_kg = area * rate
+        production = fertilizer_kg * self.production[codes]
+        field = fertilizer_kg * self.field[codes]
+        machinery = (0.0 if machinery_hours is None else np.asarray(machinery_hours)) * MACHINERY_CO2_PER_HOUR
+        transport = (0.0 if transport_km is None else np.asarray(transport_km)) * TRANSPORT_CO2_PER_KM
+        machinery = np.broadcast_to(machinery, codes.shape)
+        transport = np.broadcast_to(transport, codes.shape)
+        return {
+            'area': area,
+            'fertilizer_kg': fertilizer_kg,
+            'production': production,
+            'field': field,
+            'machinery': machinery,
+            'transport': transport,
+            'total': production + field + machinery + transport,
+        }
+
+    def assess(self, columns):
+        """(codes, per-plot footprint) of the plot columns returned by read_plots"""
+        fertilizers = columns['fertilizer']
+        try:
+            codes = self.codes(fertilizers)
+        except TypeError:
+            raise ValueError('fertilizer must be a fertilizer name')
+        unknown = codes < 0
+        if unknown.any():
+            position = int(np.argmax(unknown))
+            raise ValueError(f'Unknown fertilizer {fertilizers[position]!r} (plot {position}); '
+                             f'expected one of {", ".join(self.names)}')
+        n_plots = len(codes)
+        return codes, self.footprint(
+            codes,
+            numeric_column(columns, 'area', n_plots, 0.0),
+            rate=numeric_column(columns, 'fertilizer_amount', n_plots, float('nan')),
+            machinery_hours=numeric_column(columns, 'machinery_hours', n_plots, 0.0),
+            transport_km=numeric_column(columns, 'transportation', n_plots, 0.0),
+        )
+
+    def summarize(self, codes, result):
+        """Totals over all plots and per fertilizer"""
+        area = result['area']
+        total = float(result['total'].sum())
+        total_area = float(np.sum(area))
+        n_types = len(self.names)
+        plots = np.bincount(codes, minlength=n_types)
+        by_area = np.bincount(codes, weights=area, minlength=n_types)
+        by_kg = np.bincount(codes, weights=result['fertilizer_kg'], minlength=n_types)
+        by_total = np.bincount(codes, weights=result['total'], minlength=n_types)
+        return {
+            'plots': len(codes),
+            'area_ha': total_area,
+            'fertilizer_kg': float(result['fertilizer_kg'].sum()),
+            **{f'{col}_kg_co2e': float(result[col].sum()) for col in RESULT_COLS[1:-1]},
+            'total_kg_co2e': total,
+            'kg_co2e_per_ha': total / total_area if total_area else None,
+            'trees_to_offset': math.ceil(total / TREE_CO2_PER_YEAR),
+            'by_fertilizer': {
+                name: {
+                    'plots': int(plots[code]),
+                    'area_ha': float(by_area[code]),
+                    'fertilizer_kg': float(by_kg[code]),
+                    'total_kg_co2e': float(by_total[code]),
+                } for code, name in enumerate(self.names) if plots[code]
+            },
+        }
+
+    def factors(self):
+        """The emission-factor table, per kg of product"""
+        return {name: {
+            'production_kg_co2e_per_kg': float(self.production[code]),
+            'field_kg_co2e_per_kg': float(self.field[code]),
+            'total_kg_co2e_per_kg': float(self.per_kg[code]),
+            'default_rate_kg_per_ha': float(self.default_rate[code]),
+        } for code, name in enumerate(self.names)}
+
+    def compare(self, candidates, probabilities, area=1.0, rate=None, min_probability=ALTERNATIVE_MIN_PROBABILITY):
+        """Footprints of each row's recommendation and its ranked alternatives in one pass.
+
+        candidates and probabilities are the (rows, k) ranking of
+        pipeline.top_k_classes. Each row starts with its recommendation. Rows
+        without a model ranking hold None and NaN after it. The recommendation is
+        applied at rate (NaN: its typical rate) and the alternatives at their
+        typical rates. Returns (rows, k) arrays 'names', 'probabilities',
+        'fertilizer_kg' and 'kg_co2e', the per-row 'area', and 'lowest'. 'lowest'
+        is the column of the lowest-emission candidate among the recommendation and
+        the alternatives at least min_probability likely, or -1 when none of them
+        has emission factors.
+        """
+        names = np.asarray(candidates, dtype=object)
+        ranked = np.asarray(probabilities, dtype=np.float64)
+        n_rows = len(names)
+
+        # Code -1 (no emission factors) picks the trailing NaN
+        codes = self.codes(names.ravel()).reshape(names.shape)
+        per_kg = np.append(self.per_kg, np.nan)[codes]
+        rates = np.append(self.default_rate, np.nan)[codes]
+        if rate is not None:
+            rate = np.broadcast_to(np.asarray(rate, dtype=np.float64), (n_rows,))
+            rates[:, 0] = np.where(np.isnan(rate), rates[:, 0], rate)
+        area = np.broadcast_to(np.asarray(area, dtype=np.float64), (n_rows,))
+        fertilizer_kg = area[:, np.newaxis] * rates
+        kg_co2e = fertilizer_kg * per_kg
+        missing = np.isnan(kg_co2e)
+        missing[:, 1:] |= ~(ranked[:, 1:] >= min_probability)
+        lowest = np.where(missing.all(axis=1), -1, np.argmin(np.where(missing, np.inf, kg_co2e), axis=1))
+        return {
+            'names': names,
+            'probabilities': ranked,
+            'fertilizer_kg': fertilizer_kg,
+            'kg_co2e': kg_co2e,
+            'area': area,
+            'lowest': lowest,
+        }
+
+
+def comparison_entries(comparison):
+    """JSON-ready footprint of every row of CarbonEngine.compare"""
+    def number(value):
+        return None if math.isnan(value) else value
+
+    entries = []
+    for names, probabilities, fertilizer_kg, kg_co2e, area, lowest in zip(
+            comparison['names'].tolist(), comparison['probabilities'].tolist(),
+            comparison['fertilizer_kg'].tolist(), comparison['kg_co2e'].tolist(),
+            comparison['area'].tolist(), comparison['lowest'].tolist()):
+        options = [{
+            'fertilizer': name,
+            'probability': number(probability),
+            'fertilizer_kg': number(kg),
+            'kg_co2e': number(co2e),
+        } for name, probability, kg, co2e in zip(names, probabilities, fertilizer_kg, kg_co2e) if name is not None]
+        entries.append({
+            'area_ha': area,
+            'recommended': options[0],
+            'alternatives': options[1:],
+            'lowest_emission': options[lowest] if lowest >= 0 else None,
+        })
+    return entries
@@ -0,0 +1,190 @@
+"""Columnar, memory-mapped cache of the fertilizer dataset CSV.
+
+The CSV is converted once into one .npy file per column: numeric columns in the
+narrowest float dtype that round-trips every value (float32 where lossless,
+float64 otherwise), and text columns as integer codes plus a category dictionary.
+Loading memory-maps those files, so pre-forked workers share the same page-cache
+pages instead of each parsing the CSV into its own object-dtype copy.
+
+Each CSV version is cached under its SHA-256 digest and rebuilt when the digest
+changes.
+
+Usage:
+    python dataset_cache.py build [--csv DATASET] [--cache-dir DIR]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DATASET_PATH = "Fertilizer_Prediction_gpt(1).csv"
+CACHE_DIR = ".dataset_cache"
+META_FILE = "meta.json"
+CACHE_FORMAT = 1
+
+
+def csv_digest(csv_path):
+    """SHA-256 of the CSV contents"""
+    digest = hashlib.sha256()
+    with open(csv_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def narrowest_float(values):
+    """float32 when it reproduces every value exactly, otherwise float64"""
+    values = np.asarray(values, dtype=np.float64)
+    narrow = values.astype(np.float32)
+    if np.array_equal(narrow.astype(np.float64), values, equal_nan=True):
+        return narrow
+    return values
+
+
+def code_dtype(n_categories):
+    """Smallest signed integer dtype for category codes (-1 marks missing)"""
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_categories < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def build_cache(csv_path=DATASET_PATH, cache_dir=CACHE_DIR, digest=None):
+    """Convert the CSV into a columnar cache directory; returns its path"""
+    digest = digest or csv_digest(csv_path)
+    target = os.path.join(cache_dir, digest)
+    if os.path.exists(os.path.join(target, META_FILE)):
+        return target
+
+    frame = pd.read_csv(csv_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Build in a private directory and rename it into place, so concurrent
+    # workers never see a half-written cache
+    staging = tempfile.mkdtemp(prefix=f"{digest}.", dir=cache_dir)
+    columns = []
+    for i, name in enumerate(frame.columns):
+        series = frame[name]
+        if pd.api.types.is_numeric_dtype(series):
+            values = narrowest_float(series.to_numpy())
+            np.save(os.path.join(staging, f"col{i}.npy"), values)
+            columns.append({'name': name, 'kind': 'numeric', 'dtype': values.dtype.name})
+        else:
+            categorical = pd.Categorical(series)
+            categories = [str(c) for c in categorical.categories]
+            codes = categorical.codes.astype(code_dtype(len(categories)))
+            np.save(os.path.join(staging, f"col{i}.npy"), codes)
+            columns.append({'name': name, 'kind': 'categorical', 'dtype': codes.dtype.name,
+                            'categories': categories})
+
+    meta = {'format': CACHE_FORMAT, 'digest': digest, 'rows': len(frame), 'columns': columns}
+    with open(os.path.join(staging, META_FILE), 'w') as f:
+        json.dump(meta, f)
+
+    os.chmod(staging, 0o755)
+    try:
+        os.rename(staging, target)
+    except OSError:
+        # Another process published the same version first
+        shutil.rmtree(staging, ignore_errors=True)
+    logger.info(f"Built columnar dataset cache {target} ({len(frame)} rows)")
+    return target
+
+
+def open_cache(path):
+    """Memory-map a cache directory as a DataFrame without copying the columns"""
+    with open(os.path.join(path, META_FILE)) as f:
+        meta = json.load(f)
+    if meta.get('format') != CACHE_FORMAT:
+        raise ValueError(f"Unsupported dataset cache format: {meta.get('format')}")
+
+    data = {}
+    for i, column in enumerate(meta['columns']):
+        values = np.load(os.path.join(path, f"col{i}.npy"), mmap_mode='r')
+        if column['kind'] == 'categorical':
+            data[column['name']] = pd.Categorical.from_codes(values, categories=column['categories'])
+        else:
+            data[column['name']] = values
+    return pd.DataFrame(data, copy=False)
+
+
+def state_path(cache_dir):
+    return os.path.join(cache_dir, 'source.json')
+
+
+def current_digest(csv_path, cache_dir):
+    """CSV digest, reusing the last one while the file's size and mtime are unchanged"""
+    stat = os.stat(csv_path)
+    signature = {'path': os.path.abspath(csv_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    try:
+        with open(state_path(cache_dir)) as f:
+            state = json.load(f)
+        if {k: state.get(k) for k in signature} == signature:
+            return state['digest']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    digest = csv_digest(csv_path)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(dict(signature, digest=digest), f)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, state_path(cache_dir))
+    except OSError:
+        pass
+    return digest
+
+
+def prune_cache(cache_dir, keep):
+    """Remove cached versions other than keep"""
+    for entry in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, entry)
+        if entry != keep and os.path.isdir(path) and '.' not in entry:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def load_dataset(csv_path=DATASET_PATH, cache_dir=CACHE_DIR):
+    """Load the dataset through the columnar cache, rebuilding it when the CSV changed.
+
+    Falls back to pd.read_csv when the cache directory cannot be written.
+    """
+    try:
+        digest = current_digest(csv_path, cache_dir)
+        path = build_cache(csv_path, cache_dir, digest)
+        prune_cache(cache_dir, keep=digest)
+        return open_cache(path)
+    except OSError as e:
+        logger.warning(f"Dataset cache unavailable, reading CSV directly: {str(e)}")
+        return pd.read_csv(csv_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the columnar dataset cache")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='convert the CSV into the memory-mappable cache')
+    build.add_argument('--csv', default=DATASET_PATH)
+    build.add_argument('--cache-dir', default=CACHE_DIR)
+    args = parser.parse_args()
+
+    digest = current_digest(args.csv, args.cache_dir)
+    path = build_cache(args.csv, args.cache_dir, digest)
+    prune_cache(args.cache_dir, keep=digest)
+    with open(os.path.join(path, META_FILE)) as f:
+        meta = json.load(f)
+    print(f"✅ Cached {meta['rows']} rows of {args.csv} in {path}")
+    for column in meta['columns']:
+        extra = f", {len(column['categories'])} categories" if column['kind'] == 'categorical' else ''
+        print(f"   {column['name']}: {column['kind']} {column['dtype']}{extra}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,342 @@
+"""Precomputed recommendation grid over the common input region.
+
+`python grid.py build` evaluates the network at every node of a quantized
+lattice over the six numeric inputs, once per Soil Type x Crop Type combination
+in the dataset. For each cell between neighbouring nodes it keeps the class the
+network predicts at all of the cell's corners, or MIXED where they disagree, and
+the lowest of the corners' confidences, floored to a whole percent. The network
+is not monotonic between nodes, so that is the confidence at the corners, not a
+bound on inputs inside the cell. The table is a single uint8 array written with
+np.save and memory-mapped at serve time, so pre-forked workers share it. An
+input inside a uniform cell is answered with a few index computations and one
+array read. Inputs in mixed cells, outside the lattice or with unseen categories
+go to live inference.
+
+The grid records the digest of the model files it was built from and is ignored
+by the app once they change; rerun the build after retraining.
+
+Usage:
+    python grid.py build [--force] [--step Nitrogen=5 ...]
+    python grid.py verify
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from inference import (H5_MODEL_PATH, NPZ_MODEL_PATH, PREPROCESSOR_PATH, DATASET_PATH,
+                       file_digest, load_serving_model, FeatureEncoder)
+from matching import NUMERIC_COLS
+
+logger = logging.getLogger(__name__)
+
+FERTILIZER_ENCODER_PATH = "fertilizer_encoder.pkl"
+GRID_DIR = ".recommendation_grid"
+GRID_META = "grid.json"
+GRID_FORMAT = 1
+
+# Lattice spacing per numeric input; a cell spans one step on every axis
+GRID_STEPS = {'Temperature': 5.0, 'Humidity': 10.0, 'Moisture': 5.0,
+              'Nitrogen': 10.0, 'Phosphorus': 10.0, 'Potassium': 10.0}
+# Class code of a cell whose corners the network labels differently
+MIXED = 255
+# Lattice nodes per forward pass while building
+BUILD_BATCH_ROWS = 65536
+
+
+def model_digest(h5_path=H5_MODEL_PATH, preprocessor_path=PREPROCESSOR_PATH,
+                 encoder_path=FERTILIZER_ENCODER_PATH):
+    """Digest of the model, preprocessor and label encoder files a grid is built from"""
+    digest = hashlib.sha256()
+    for path in (h5_path, preprocessor_path, encoder_path):
+        digest.update(f"{os.path.basename(path)}:{file_digest(path)}\n".encode())
+    return digest.hexdigest()[:16]
+
+
+def grid_axes(frame, steps):
+    """(low, step, nodes) of each numeric axis, covering the dataset's range"""
+    axes = []
+    for col in NUMERIC_COLS:
+        step = float(steps[col])
+        low = np.floor(frame[col].min() / step) * step
+        high = np.ceil(frame[col].max() / step) * step
+        axes.append((float(low), step, int(round((high - low) / step)) + 1))
+    return axes
+
+
+def uniform_cells(node_classes, node_confidence):
+    """Class and minimum corner confidence of every cell; MIXED where corners disagree"""
+    low = high = node_classes
+    confidence = node_confidence
+    # Reduce over the two corners along each axis in turn, 2**6 corners in total
+    for axis in range(node_classes.ndim):
+        first = [slice(None)] * node_classes.ndim
+        second = list(first)
+        first[axis], second[axis] = slice(None, -1), slice(1, None)
+        first, second = tuple(first), tuple(second)
+        low = np.minimum(low[first], low[second])
+        high = np.maximum(high[first], high[second])
+        confidence = np.minimum(confidence[first], confidence[second])
+    return np.where(low == high, low, MIXED).astype(np.uint8), confidence
+
+
+def evaluation_inputs(csv_path, synthetic, seed):
+    """Dataset rows plus jittered rows rounded like real traffic (integer NPK, one decimal)"""
+    df = pd.read_csv(csv_path)
+    rng = np.random.default_rng(seed)
+    jittered = df.iloc[rng.integers(0, len(df), synthetic)].reset_index(drop=True)
+    for col in NUMERIC_COLS:
+        noise = rng.normal(0, 0.25 * df[col].std(), synthetic)
+        values = np.clip(jittered[col] + noise, df[col].min(), df[col].max())
+        jittered[col] = values.round(0 if col in ('Nitrogen', 'Phosphorus', 'Potassium') else 1)
+    return df, jittered
+
+
+class RecommendationGrid:
+    """Memory-mapped grid table with O(1) lookups"""
+
+    def __init__(self, meta, table):
+        self.meta = meta
+        self.table = table
+        # Flat view and element strides, so a lookup is plain integer arithmetic
+        self._flat = np.asarray(table).reshape(-1)
+        strides = [stride // table.itemsize for stride in table.strides]
+        self._combo_stride = strides[0]
+        self.model_digest = meta['model_digest']
+        self.class_names = np.array(meta['class_names'], dtype=object)
+        self.combos = {(soil, crop): i for i, (soil, crop) in enumerate(meta['combos'])}
+        # (column, low, step, cells, stride) per numeric axis
+        self.axes = [(col, low, step, nodes - 1, stride) for col, (low, step, nodes), stride
+                     in zip(NUMERIC_COLS, meta['axes'], strides[1:])]
+
+    @classmethod
+    def load(cls, grid_dir=GRID_DIR):
+        """Open the current grid, or return None when none has been built"""
+        try:
+            with open(os.path.join(grid_dir, GRID_META)) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+        if meta.get('format') != GRID_FORMAT:
+            raise ValueError(f"Unsupported grid format: {meta.get('format')}")
+        return cls(meta, np.load(os.path.join(grid_dir, meta['table']), mmap_mode='r'))
+
+    def lookup(self, input_row):
+        """(fertilizer name, lowest corner confidence) for an input inside a uniform cell, else None"""
+        combo = self.combos.get((input_row['Soil Type'], input_row['Crop Type']))
+        if combo is None:
+            return None
+        offset = combo * self._combo_stride
+        for col, low, step, cells, stride in self.axes:
+            position = (input_row[col] - low) / step
+            if not 0 <= position <= cells:
+                return None
+            # The upper boundary belongs to the last cell
+            offset += min(int(position), cells - 1) * stride
+        code = int(self._flat[offset])
+        if code == MIXED:
+            return None
+        return self.class_names[code], float(self._flat[offset + 1])
+
+    def stats(self):
+        return {
+            'built_at': self.meta['built_at'],
+            'cells': int(np.prod(self.table.shape[:-1])),
+            'uniform_share': self.meta['uniform_share'],
+            'bytes': self.table.nbytes,
+        }
+
+
+def evaluate_grid(grid, model, encoder, class_names, csv_path=DATASET_PATH, synthetic=50000, seed=0):
+    """Coverage and accuracy delta of grid-first serving against live inference"""
+    labeled, jittered = evaluation_inputs(csv_path, synthetic, seed)
+    report = {}
+    for name, frame in (('dataset', labeled), ('synthetic', jittered)):
+        live = class_names[model.predict(encoder.transform_batch(frame)).argmax(axis=1)]
+        served = live.copy()
+        hits = np.zeros(len(frame), dtype=bool)
+        for i, row in enumerate(frame[NUMERIC_COLS + ['Soil Type', 'Crop Type']].to_dict('records')):
+            hit = grid.lookup(row)
+            if hit is not None:
+                hits[i] = True
+                served[i] = hit[0]
+        result = {
+            'rows': len(frame),
+            'grid_share': round(float(hits.mean()), 4),
+            'agreement_with_live': round(float(np.mean(served == live)), 5),
+        }
+        if name == 'dataset':
+            truth = frame['Fertilizer Name'].to_numpy(dtype=object)
+            result['live_accuracy'] = round(float(np.mean(live == truth)), 5)
+            result['grid_accuracy'] = round(float(np.mean(served == truth)), 5)
+            result['accuracy_delta'] = round(result['grid_accuracy'] - result['live_accuracy'], 5)
+        report[name] = result
+
+    # Single-row latency: one grid lookup vs encoding and a forward pass
+    rows = jittered.head(2000)[NUMERIC_COLS + ['Soil Type', 'Crop Type']].to_dict('records')
+    start = time.perf_counter()
+    for row in rows:
+        grid.lookup(row)
+    grid_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    for row in rows:
+        model.predict(encoder.transform_row(row).reshape((1, 1, -1)))
+    live_seconds = time.perf_counter() - start
+    report['latency_us'] = {'grid': round(grid_seconds / len(rows) * 1e6, 1),
+                            'live': round(live_seconds / len(rows) * 1e6, 1)}
+    return report
+
+
+def build_grid(csv_path=DATASET_PATH, grid_dir=GRID_DIR, steps=None, force=False):
+    """Evaluate the network over the lattice and publish the grid; returns its metadata.
+
+    Skips the build when the current grid was made from the same model files and
+    steps, unless force is set.
+    """
+    import joblib
+
+    steps = dict(GRID_STEPS, **(steps or {}))
+    digest = model_digest()
+    current = RecommendationGrid.load(grid_dir) if os.path.exists(os.path.join(grid_dir, GRID_META)) else None
+    if current is not None and not force and current.model_digest == digest and current.meta['steps'] == steps:
+        logger.info(f"Recommendation grid is up to date with model {digest}")
+        return current.meta
+
+    model = load_serving_model(H5_MODEL_PATH, NPZ_MODEL_PATH)
+    encoder = FeatureEncoder.load(PREPROCESSOR_PATH)
+    class_names = joblib.load(FERTILIZER_ENCODER_PATH).classes_
+    if len(class_names) >= MIXED:
+        raise ValueError(f"Too many classes for a uint8 grid: {len(class_names)}")
+
+    df = pd.read_csv(csv_path)
+    axes = grid_axes(df, steps)
+    combos = sorted(df.groupby(['Soil Type', 'Crop Type']).groups)
+    shape = tuple(nodes for _, _, nodes in axes)
+    values = np.meshgrid(*[low + step * np.arange(nodes) for low, step, nodes in axes], indexing='ij')
+    lattice = {col: value.ravel() for col, value in zip(NUMERIC_COLS, values)}
+    n_nodes = int(np.prod(shape))
+
+    start = time.perf_counter()
+    table = np.empty((len(combos),) + tuple(nodes - 1 for nodes in shape) + (2,), dtype=np.uint8)
+    features = np.empty((min(BUILD_BATCH_ROWS, n_nodes), encoder.n_features), dtype=np.float32)
+    for i, (soil, crop) in enumerate(combos):
+        node_classes = np.empty(n_nodes, dtype=np.uint8)
+        node_confidence = np.empty(n_nodes, dtype=np.uint8)
+        for block in range(0, n_nodes, BUILD_BATCH_ROWS):
+            rows = slice(block, min(block + BUILD_BATCH_ROWS, n_nodes))
+            n_rows = rows.stop - rows.start
+            columns = {col: values[rows] for col, values in lattice.items()}
+            columns['Soil Type'] = np.full(n_rows, soil, dtype=object)
+            columns['Crop Type'] = np.full(n_rows, crop, dtype=object)
+            probabilities = model.predict(encoder.transform_batch(columns, out=features[:n_rows]))
+            node_classes[rows] = probabilities.argmax(axis=1)
+            node_confidence[rows] = np.floor(probabilities.max(axis=1) * 100)
+        cells, confidence = uniform_cells(node_classes.reshape(shape), node_confidence.reshape(shape))
+        table[i, ..., 0] = cells
+        table[i, ..., 1] = confidence
+    build_seconds = time.perf_counter() - start
+
+    # The table gets a fresh name and grid.json is replaced last, so a reader
+    # never pairs new metadata with an old table
+    os.makedirs(grid_dir, exist_ok=True)
+    table_name = f"{uuid.uuid4().hex[:12]}.npy"
+    np.save(os.path.join(grid_dir, table_name), table)
+    meta = {
+        'format': GRID_FORMAT,
+        'model_digest': digest,
+        'built_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'build_seconds': round(build_seconds, 1),
+        'table': table_name,
+        'steps': steps,
+        'axes': axes,
+        'combos': [list(combo) for combo in combos],
+        'class_names': [str(name) for name in class_names],
+        'nodes_evaluated': n_nodes * len(combos),
+        'uniform_share': round(float(np.mean(table[..., 0] != MIXED)), 4),
+    }
+    meta['evaluation'] = evaluate_grid(RecommendationGrid(meta, table), model, encoder, class_names, csv_path)
+    write_meta(grid_dir, meta)
+    prune_tables(grid_dir, keep=table_name)
+    logger.info(f"Built recommendation grid {table_name} for model {digest} in {build_seconds:.1f}s")
+    return meta
+
+
+def write_meta(grid_dir, meta):
+    fd, tmp_path = tempfile.mkstemp(dir=grid_dir, suffix='.json')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, os.path.join(grid_dir, GRID_META))
+
+
+def prune_tables(grid_dir, keep):
+    """Remove superseded tables; processes still mapping one keep it until they close it"""
+    for entry in os.listdir(grid_dir):
+        if entry.endswith('.npy') and entry != keep:
+            os.remove(os.path.join(grid_dir, entry))
+
+
+def parse_step(text):
+    name, _, value = text.partition('=')
+    if name not in GRID_STEPS:
+        raise argparse.ArgumentTypeError(f"unknown input {name!r}, expected one of {', '.join(GRID_STEPS)}")
+    return name, float(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and check the precomputed recommendation grid")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='evaluate the model over the grid (skipped when up to date)')
+    build.add_argument('--csv', default=DATASET_PATH, help='dataset whose ranges and soil/crop pairs the grid covers')
+    build.add_argument('--grid-dir', default=GRID_DIR)
+    build.add_argument('--step', type=parse_step, action='append', default=[],
+                       help='lattice spacing of one input, e.g. Nitrogen=5 (repeatable)')
+    build.add_argument('--force', action='store_true', help='rebuild even if the grid matches the model')
+
+    verify = commands.add_parser('verify', help='re-measure the grid against live inference')
+    verify.add_argument('--csv', default=DATASET_PATH)
+    verify.add_argument('--grid-dir', default=GRID_DIR)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == 'build':
+        meta = build_grid(args.csv, args.grid_dir, dict(args.step), args.force)
+        evaluation = meta['evaluation']
+    else:
+        import joblib
+
+        grid = RecommendationGrid.load(args.grid_dir)
+        if grid is None:
+            print("❌ No grid built yet; run python grid.py build")
+            raise SystemExit(1)
+        if grid.model_digest != model_digest():
+            print("⚠️ The grid was built from another version of the model; run python grid.py build")
+        meta = grid.meta
+        evaluation = evaluate_grid(grid, load_serving_model(H5_MODEL_PATH, NPZ_MODEL_PATH),
+                                   FeatureEncoder.load(PREPROCESSOR_PATH),
+                                   joblib.load(FERTILIZER_ENCODER_PATH).classes_, args.csv)
+
+    table_bytes = os.path.getsize(os.path.join(args.grid_dir, meta['table']))
+    print(f"✅ Grid {meta['table']}: {meta['nodes_evaluated']} nodes evaluated in {meta['build_seconds']}s, "
+          f"{table_bytes / 1e6:.1f} MB, {meta['uniform_share']:.1%} of cells uniform")
+    dataset, synthetic = evaluation['dataset'], evaluation['synthetic']
+    print(f"   dataset rows:   {dataset['grid_share']:.1%} answered by the grid, accuracy "
+          f"{dataset['grid_accuracy']:.4f} vs {dataset['live_accuracy']:.4f} live "
+          f"(delta {dataset['accuracy_delta']:+.4f})")
+    print(f"   synthetic rows: {synthetic['grid_share']:.1%} answered by the grid, "
+          f"{synthetic['agreement_with_live']:.3%} agreement with live inference")
+    print(f"⏱️ Single-row latency: grid {evaluation['latency_us']['grid']} µs, "
+          f"live {evaluation['latency_us']['live']} µs")
+
+
+if __name__ == '__main__':
+    main()
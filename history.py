@@ -0,0 +1,242 @@
+"""SQLite-backed recommendation history.
+
+/predict hands each answered request to HistoryStore.record(), which only puts it
+on a queue. A background writer thread drains the queue and inserts the rows in
+batched transactions, so recording history never adds database latency to the
+prediction response. Reads are keyset-paginated on (created_at, id) through
+indexes that lead with the user, so a page costs the same at any depth.
+"""
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recommendations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL,
+    created_at INTEGER NOT NULL,  -- milliseconds since the epoch
+    temperature REAL,
+    humidity REAL,
+    moisture REAL,
+    nitrogen REAL,
+    phosphorus REAL,
+    potassium REAL,
+    soil_type TEXT,
+    crop_type TEXT,
+    fertilizer TEXT NOT NULL,
+    confidence REAL,
+    method TEXT,
+    model_version TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_recommendations_user_time
+    ON recommendations (username, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_recommendations_user_crop_time
+    ON recommendations (username, crop_type, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_recommendations_time
+    ON recommendations (created_at);
+"""
+
+INSERT = """
+INSERT INTO recommendations (username, created_at, temperature, humidity, moisture,
+    nitrogen, phosphorus, potassium, soil_type, crop_type, fertilizer, confidence,
+    method, model_version)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Input fields in the column order of INSERT
+INPUT_COLUMNS = [
+    ('Temperature', 'temperature'), ('Humidity', 'humidity'), ('Moisture', 'moisture'),
+    ('Nitrogen', 'nitrogen'), ('Phosphorus', 'phosphorus'), ('Potassium', 'potassium'),
+    ('Soil Type', 'soil_type'), ('Crop Type', 'crop_type'),
+]
+
+SELECT_COLUMNS = ('id, created_at, ' + ', '.join(column for _, column in INPUT_COLUMNS) +
+                  ', fertilizer, confidence, method, model_version')
+
+
+def encode_cursor(created_at, row_id):
+    return f"{created_at}-{row_id}"
+
+
+def decode_cursor(cursor):
+    """(created_at, id) from a cursor returned by page(); raises ValueError"""
+    try:
+        created_at, row_id = cursor.split('-')
+        return int(created_at), int(row_id)
+    except ValueError:
+        raise ValueError(f"malformed cursor {cursor!r}")
+
+
+class HistoryStore:
+    """Recommendation history in one SQLite file with a batching background writer.
+
+    record() never blocks: when the queue is full (the disk cannot keep up) the
+    entry is dropped and counted instead of slowing down /predict.
+    """
+
+    def __init__(self, path, max_batch_size=256, flush_interval=0.5, max_queue_size=10000):
+        self.path = path
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._local = threading.local()
+        self._closed = False
+        self._stop = threading.Event()
+
+        # Metrics
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+
+        self._writer = threading.Thread(target=self._run, name='history-writer', daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        # WAL lets readers (and other worker processes) proceed while a batch commits
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def _reader(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    def record(self, username, input_row, recommendation, created_at=None):
+        """Queue one answered /predict request for writing"""
+        if self._closed:
+            return False
+        created_at = int((created_at if created_at is not None else time.time()) * 1000)
+        row = ((username, created_at) + tuple(input_row.get(field) for field, _ in INPUT_COLUMNS) +
+               (recommendation['recommendation'], recommendation.get('confidence'),
+                recommendation.get('method'), recommendation.get('model_version')))
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def flush(self):
+        """Block until every queued entry has been written"""
+        self._queue.join()
+
+    def close(self):
+        """Write what is queued and stop the writer"""
+        self._closed = True
+        self._stop.set()
+        try:
+            # Wakes a writer waiting on an empty queue; a full queue wakes it anyway
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+        self._writer.join()
+
+    def page(self, username, limit=20, cursor=None, crop_type=None):
+        """Newest-first entries of one user after cursor; returns (entries, next_cursor)"""
+        clauses = ['username = ?']
+        params = [username]
+        if crop_type:
+            clauses.append('crop_type = ?')
+            params.append(crop_type)
+        if cursor:
+            clauses.append('(created_at, id) < (?, ?)')
+            params.extend(decode_cursor(cursor))
+
+        # One extra row tells whether another page follows
+        rows = self._reader().execute(
+            f"SELECT {SELECT_COLUMNS} FROM recommendations WHERE {' AND '.join(clauses)} "
+            f"ORDER BY created_at DESC, id DESC LIMIT ?",
+            params + [limit + 1]
+        ).fetchall()
+
+        entries = [self._entry(row) for row in rows[:limit]]
+        next_cursor = encode_cursor(rows[limit - 1][1], rows[limit - 1][0]) if len(rows) > limit else None
+        return entries, next_cursor
+
+    def delete_user(self, username):
+        """Remove one user's history, including entries still queued"""
+        self.flush()
+        connection = self._reader()
+        with connection:
+            deleted = connection.execute('DELETE FROM recommendations WHERE username = ?', (username,)).rowcount
+        return deleted
+
+    def stats(self):
+        """Writer counters for /api/stats"""
+        return {
+            'queue_depth': self._queue.qsize(),
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'batches': self.batches,
+        }
+
+    @staticmethod
+    def _entry(row):
+        """API shape of one row, matching the entries script.js keeps locally"""
+        inputs = {field: value for (field, _), value in zip(INPUT_COLUMNS, row[2:10])}
+        return {
+            'id': row[0],
+            'timestamp': datetime.fromtimestamp(row[1] / 1000, timezone.utc).isoformat(),
+            'inputs': inputs,
+            'fertilizer': row[10],
+            'confidence': row[11],
+            'method': row[12],
+            'model_version': row[13],
+        }
+
+    def _collect(self, first):
+        """Gather queued rows behind the first one for up to flush_interval"""
+        batch = [first]
+        deadline = time.perf_counter() + self.flush_interval
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.task_done()
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        connection = self._connect()
+        # After close() the writer drains what is queued, then stops
+        while not (self._stop.is_set() and self._queue.empty()):
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            if first is None:
+                self._queue.task_done()
+                continue
+            batch = self._collect(first)
+            try:
+                with connection:
+                    connection.executemany(INSERT, batch)
+                self.written += len(batch)
+                self.batches += 1
+            except sqlite3.Error as e:
+                self.failed += len(batch)
+                logger.error(f"Could not write {len(batch)} history entries: {str(e)}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+        connection.close()
@@ -0,0 +1,439 @@
+"""NumPy runtime for the trained LSTM + Dense fertilizer model.
+
+The Keras network from model.train_hybrid_model runs an LSTM over a single
+timestep followed by Dense layers, so serving it is a handful of small matrix
+multiplies. export_weights() copies the weights out of the .h5 file (with h5py,
+no TensorFlow needed) into a compact .npz that NumpyModel runs. FeatureEncoder
+does the same for preprocessor.pkl, replacing ColumnTransformer.transform.
+TreeStudent serves the decision tree distilled from the network.
+
+Usage:
+    python inference.py export [--h5 best_fertilizer_model.h5] [--out best_fertilizer_model.npz]
+    python inference.py verify [--h5 best_fertilizer_model.h5] [--npz best_fertilizer_model.npz]
+    python inference.py verify-encoder [--preprocessor preprocessor.pkl] [--csv DATASET]
+"""
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+H5_MODEL_PATH = "best_fertilizer_model.h5"
+NPZ_MODEL_PATH = "best_fertilizer_model.npz"
+PREPROCESSOR_PATH = "preprocessor.pkl"
+STUDENT_PATH = "student_model.pkl"
+DATASET_PATH = "Fertilizer_Prediction_gpt(1).csv"
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'tanh': np.tanh,
+    'sigmoid': lambda x: 0.5 * (1 + np.tanh(0.5 * x)),
+}
+
+
+def softmax(x):
+    """Row-wise softmax"""
+    shifted = np.exp(x - x.max(axis=-1, keepdims=True))
+    return shifted / shifted.sum(axis=-1, keepdims=True)
+
+
+def activation(name):
+    """Resolve a Keras activation name"""
+    if name == 'softmax':
+        return softmax
+    if name not in ACTIVATIONS:
+        raise ValueError(f"Unsupported activation: {name}")
+    return ACTIVATIONS[name]
+
+
+def file_digest(path):
+    """SHA-256 of a file, used to tie an export to its source model"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def export_weights(h5_path=H5_MODEL_PATH, npz_path=NPZ_MODEL_PATH):
+    """Write the layer specs and float32 weights of a Keras .h5 model to .npz"""
+    import h5py
+
+    with h5py.File(h5_path, 'r') as f:
+        config = json.loads(f.attrs['model_config'])
+        weights_group = f['model_weights'] if 'model_weights' in f else f
+
+        specs = []
+        arrays = {}
+        for layer in config['config']['layers']:
+            kind = layer['class_name']
+            layer_config = layer['config']
+            if kind in ('InputLayer', 'Dropout'):
+                # Dropout is the identity at inference time
+                continue
+            if kind not in ('LSTM', 'Dense'):
+                raise ValueError(f"Unsupported layer type: {kind}")
+            if kind == 'LSTM' and (layer_config.get('return_sequences') or layer_config.get('go_backwards')):
+                raise ValueError("Only forward LSTM layers returning the last state are supported")
+
+            group = weights_group[layer_config['name']]
+            names = [n.decode() if isinstance(n, bytes) else n for n in group.attrs['weight_names']]
+            values = [np.asarray(group[name], dtype=np.float32) for name in names]
+
+            index = len(specs)
+            if kind == 'LSTM':
+                specs.append({
+                    'type': 'lstm',
+                    'units': layer_config['units'],
+                    'activation': layer_config.get('activation', 'tanh'),
+                    'recurrent_activation': layer_config.get('recurrent_activation', 'sigmoid'),
+                })
+                params = ['kernel', 'recurrent_kernel', 'bias']
+            else:
+                specs.append({'type': 'dense', 'activation': layer_config.get('activation', 'linear')})
+                params = ['kernel', 'bias']
+
+            for param, value in zip(params, values):
+                arrays[f"layer{index}_{param}"] = value
+
+    # Write beside the target and rename, so workers reloading at the same time
+    # never read a half-written file
+    fd, tmp_path = tempfile.mkstemp(suffix='.npz', dir=os.path.dirname(os.path.abspath(npz_path)))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez_compressed(f, spec=np.array(json.dumps(specs)),
+                                source=np.array(file_digest(h5_path)), **arrays)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, npz_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return npz_path
+
+
+class NumpyModel:
+    """Forward pass of the exported network using only NumPy"""
+
+    def __init__(self, specs, arrays):
+        self.layers = []
+        for index, spec in enumerate(specs):
+            kernel = arrays[f"layer{index}_kernel"]
+            bias = arrays.get(f"layer{index}_bias", np.zeros(kernel.shape[1], dtype=np.float32))
+            if spec['type'] == 'lstm':
+                recurrent = arrays[f"layer{index}_recurrent_kernel"]
+                self.layers.append(('lstm', spec['units'], kernel, recurrent, bias,
+                                    activation(spec['activation']),
+                                    activation(spec['recurrent_activation'])))
+            else:
+                self.layers.append(('dense', kernel, bias, activation(spec['activation'])))
+
+        self.input_dim = arrays['layer0_kernel'].shape[0]
+        self.output_dim = arrays[f"layer{len(specs) - 1}_bias"].shape[0]
+        if specs[-1]['type'] == 'lstm':
+            self.output_dim = specs[-1]['units']
+
+    @classmethod
+    def load(cls, path=NPZ_MODEL_PATH):
+        """Load a model written by export_weights"""
+        with np.load(path) as data:
+            specs = json.loads(str(data['spec']))
+            arrays = {name: data[name] for name in data.files if name not in ('spec', 'source')}
+            model = cls(specs, arrays)
+            model.source = str(data['source']) if 'source' in data.files else None
+        return model
+
+    @staticmethod
+    def lstm(inputs, units, kernel, recurrent, bias, act, recurrent_act):
+        """Keras LSTM (gate order i, f, c, o) returning the last hidden state"""
+        h = np.zeros((inputs.shape[0], units), dtype=np.float32)
+        c = np.zeros((inputs.shape[0], units), dtype=np.float32)
+        for t in range(inputs.shape[1]):
+            z = inputs[:, t, :] @ kernel + bias
+            if t:
+                # The initial state is zero, so the first step skips the recurrent product
+                z += h @ recurrent
+            i = recurrent_act(z[:, :units])
+            f = recurrent_act(z[:, units:2 * units])
+            g = act(z[:, 2 * units:3 * units])
+            o = recurrent_act(z[:, 3 * units:])
+            c = f * c + i * g
+            h = o * act(c)
+        return h
+
+    def predict(self, inputs, verbose=0):
+        """Class probabilities for (samples, features) or (samples, timesteps, features) input.
+
+        Mirrors keras Model.predict so it can stand in for the loaded .h5 model.
+        """
+        x = np.asarray(inputs, dtype=np.float32)
+        if x.ndim == 2:
+            x = x[:, np.newaxis, :]
+        for layer in self.layers:
+            if layer[0] == 'lstm':
+                x = self.lstm(x, *layer[1:])
+            else:
+                _, kernel, bias, act = layer
+                if x.ndim == 3:
+                    x = x.reshape(x.shape[0], -1)
+                x = act(x @ kernel + bias)
+        return x
+
+
+def load_serving_model(h5_path=H5_MODEL_PATH, npz_path=NPZ_MODEL_PATH):
+    """Load the NumPy runtime, re-exporting when the .npz is missing or was built from another .h5"""
+    if not os.path.exists(npz_path):
+        if not os.path.exists(h5_path):
+            return None
+        export_weights(h5_path, npz_path)
+
+    model = NumpyModel.load(npz_path)
+    if os.path.exists(h5_path) and model.source != file_digest(h5_path):
+        export_weights(h5_path, npz_path)
+        model = NumpyModel.load(npz_path)
+    return model
+
+
+class FeatureEncoder:
+    """Compiled copy of the fitted ColumnTransformer from model.load_and_prepare_data.
+
+    Standard scaling is a mean/scale vector and one-hot encoding is a category ->
+    output column table, written straight into float32 buffers. Unknown categories
+    leave their block at zero, like OneHotEncoder(handle_unknown='ignore').
+    """
+
+    def __init__(self, n_features, numeric, categorical):
+        self.n_features = n_features
+        # numeric: list of (output positions, columns, mean, scale)
+        self.numeric = numeric
+        # categorical: list of (column, block slice, {category: output position}, categories, handle_unknown)
+        self.categorical = categorical
+        self._local = threading.local()
+
+    @classmethod
+    def from_preprocessor(cls, preprocessor):
+        """Extract the encoder from a fitted ColumnTransformer"""
+        import pandas as pd
+        from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+        numeric = []
+        categorical = []
+        for name, transformer, columns in preprocessor.transformers_:
+            if transformer == 'drop' or name == 'remainder':
+                if transformer != 'drop' and len(columns):
+                    raise ValueError("Passthrough remainder columns are not supported")
+                continue
+            output = preprocessor.output_indices_[name]
+            if isinstance(transformer, StandardScaler):
+                mean = transformer.mean_ if transformer.with_mean else np.zeros(len(columns))
+                scale = transformer.scale_ if transformer.with_std else np.ones(len(columns))
+                positions = np.arange(output.start, output.stop)
+                numeric.append((positions, list(columns), np.asarray(mean, dtype=np.float64),
+                                np.asarray(scale, dtype=np.float64)))
+            elif isinstance(transformer, OneHotEncoder):
+                if transformer.drop_idx_ is not None:
+                    raise ValueError("OneHotEncoder(drop=...) is not supported")
+                offset = output.start
+                for column, categories in zip(columns, transformer.categories_):
+                    block = slice(offset, offset + len(categories))
+                    lookup = {category: offset + i for i, category in enumerate(categories)}
+                    categorical.append((column, block, lookup, pd.Index(categories), transformer.handle_unknown))
+                    offset += len(categories)
+            else:
+                raise ValueError(f"Unsupported transformer: {type(transformer).__name__}")
+
+        n_features = max(s.stop for s in preprocessor.output_indices_.values())
+        return cls(n_features, numeric, categorical)
+
+    @classmethod
+    def load(cls, path=PREPROCESSOR_PATH):
+        """Compile the encoder from a joblib-saved preprocessor"""
+        import joblib
+        return cls.from_preprocessor(joblib.load(path))
+
+    def transform_row(self, input_row):
+        """Encode one input dict into this thread's preallocated (1, n_features) buffer.
+
+        The buffer is reused by the next call on the same thread, so copy it if
+        it must outlive the current request.
+        """
+        out = getattr(self._local, 'row', None)
+        if out is None:
+            out = self._local.row = np.empty((1, self.n_features), dtype=np.float32)
+
+        row = out[0]
+        for positions, columns, mean, scale in self.numeric:
+            values = np.array([input_row[col] for col in columns], dtype=np.float64)
+            row[positions] = (values - mean) / scale
+
+        for column, block, lookup, _, handle_unknown in self.categorical:
+            row[block] = 0
+            position = lookup.get(input_row[column])
+            if position is not None:
+                row[position] = 1
+            elif handle_unknown == 'error':
+                raise ValueError(f"Found unknown category {input_row[column]!r} in column {column!r}")
+        return out
+
+    def transform_batch(self, frame, out=None):
+        """Encode a DataFrame (or dict of columns) into a (rows, n_features) float32 array"""
+        n_rows = len(frame[self.categorical[0][0]] if self.categorical else frame[self.numeric[0][1][0]])
+        if out is None:
+            out = np.empty((n_rows, self.n_features), dtype=np.float32)
+
+        for positions, columns, mean, scale in self.numeric:
+            values = np.column_stack([np.asarray(frame[col], dtype=np.float64) for col in columns])
+            out[:, positions] = (values - mean) / scale
+
+        for column, block, _, categories, handle_unknown in self.categorical:
+            out[:, block] = 0
+            codes = categories.get_indexer(np.asarray(frame[column], dtype=object))
+            known = codes >= 0
+            if handle_unknown == 'error' and not known.all():
+                raise ValueError(f"Found unknown categories in column {column!r}")
+            out[np.flatnonzero(known), block.start + codes[known]] = 1
+        return out
+
+    def transform(self, frame):
+        """ColumnTransformer-compatible alias for transform_batch"""
+        return self.transform_batch(frame)
+
+
+class TreeStudent:
+    """Decision tree distilled from the network (model.distill_student), compiled to arrays.
+
+    The tree is a multi-output regressor fitted on the network's class
+    probabilities, so each leaf holds a probability vector. predict_row walks
+    plain lists, which is much faster than sklearn's per-call overhead for one row.
+    """
+
+    def __init__(self, tree, teacher=None, report=None):
+        nodes = tree.tree_
+        self.teacher = teacher
+        self.report = report or {}
+        self.n_features = nodes.n_features
+        self.depth = nodes.max_depth
+        self.left = nodes.children_left.astype(np.int64)
+        self.right = nodes.children_right.astype(np.int64)
+        self.feature = nodes.feature.astype(np.int64)
+        self.threshold = nodes.threshold.astype(np.float64)
+        self.probabilities = nodes.value[:, :, 0].astype(np.float32)
+        self._nodes = list(zip(self.left.tolist(), self.right.tolist(),
+                               self.feature.tolist(), self.threshold.tolist()))
+
+    @classmethod
+    def load(cls, path=STUDENT_PATH):
+        """Compile the student saved by model.distill_student"""
+        import joblib
+        saved = joblib.load(path)
+        return cls(saved['tree'], saved.get('teacher'), saved.get('report'))
+
+    def predict_row(self, features):
+        """Class probabilities for one encoded (n_features,) row"""
+        row = features.tolist()
+        nodes = self._nodes
+        node = 0
+        left, right, feature, threshold = nodes[0]
+        while left != -1:
+            # sklearn compares float32 features with float64 thresholds
+            node = left if row[feature] <= threshold else right
+            left, right, feature, threshold = nodes[node]
+        return self.probabilities[node]
+
+    def predict(self, inputs, verbose=0):
+        """Class probabilities for (samples, features) or (samples, 1, features) input"""
+        x = np.asarray(inputs, dtype=np.float32).reshape(len(inputs), -1)
+        node = np.zeros(len(x), dtype=np.int64)
+        rows = np.arange(len(x))
+        for _ in range(self.depth):
+            inner = self.left[node] != -1
+            if not inner.any():
+                break
+            go_left = x[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(inner, np.where(go_left, self.left[node], self.right[node]), node)
+        return self.probabilities[node]
+
+
+def check_encoder(preprocessor_path=PREPROCESSOR_PATH, csv_path=DATASET_PATH, seed=0):
+    """Compare FeatureEncoder with preprocessor.transform on the dataset plus unknown categories.
+
+    Returns the number of rows checked; raises AssertionError on any mismatch.
+    """
+    import joblib
+    import pandas as pd
+
+    preprocessor = joblib.load(preprocessor_path)
+    encoder = FeatureEncoder.from_preprocessor(preprocessor)
+
+    frame = pd.read_csv(csv_path)
+    unknown = frame.sample(frac=0.1, random_state=seed).copy()
+    unknown['Soil Type'] = 'Unseen Soil'
+    unknown.loc[unknown.index[::2], 'Crop Type'] = 'Unseen Crop'
+    frame = pd.concat([frame, unknown], ignore_index=True)
+
+    expected = np.asarray(preprocessor.transform(frame), dtype=np.float32)
+    batch = encoder.transform_batch(frame)
+    assert np.array_equal(expected, batch), "batch encoding differs from preprocessor.transform"
+
+    for i, row in enumerate(frame.to_dict('records')):
+        assert np.array_equal(expected[i], encoder.transform_row(row)[0]), f"row {i} differs"
+    return len(frame)
+
+
+def check_parity(h5_path=H5_MODEL_PATH, npz_path=NPZ_MODEL_PATH, samples=2000, seed=0):
+    """Largest absolute difference between Keras and NumPy probabilities on random inputs"""
+    from tensorflow.keras.models import load_model
+
+    keras_model = load_model(h5_path)
+    numpy_model = NumpyModel.load(npz_path)
+
+    rng = np.random.default_rng(seed)
+    inputs = rng.normal(0, 1.5, (samples, 1, numpy_model.input_dim)).astype(np.float32)
+    expected = keras_model.predict(inputs, verbose=0)
+    actual = numpy_model.predict(inputs)
+
+    agreement = float(np.mean(expected.argmax(axis=1) == actual.argmax(axis=1)))
+    return float(np.abs(expected - actual).max()), agreement
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export and verify the NumPy serving model")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export = commands.add_parser('export', help='write .npz weights from the Keras .h5 model')
+    export.add_argument('--h5', default=H5_MODEL_PATH)
+    export.add_argument('--out', default=NPZ_MODEL_PATH)
+
+    verify = commands.add_parser('verify', help='compare NumPy and Keras outputs')
+    verify.add_argument('--h5', default=H5_MODEL_PATH)
+    verify.add_argument('--npz', default=NPZ_MODEL_PATH)
+    verify.add_argument('--samples', type=int, default=2000)
+    verify.add_argument('--tolerance', type=float, default=1e-5)
+
+    verify_encoder = commands.add_parser('verify-encoder',
+                                         help='compare FeatureEncoder with preprocessor.transform')
+    verify_encoder.add_argument('--preprocessor', default=PREPROCESSOR_PATH)
+    verify_encoder.add_argument('--csv', default=DATASET_PATH)
+
+    args = parser.parse_args()
+
+    if args.command == 'verify-encoder':
+        rows = check_encoder(args.preprocessor, args.csv)
+        print(f"✅ FeatureEncoder matches preprocessor.transform on {rows} rows")
+    elif args.command == 'export':
+        export_weights(args.h5, args.out)
+        print(f"✅ Exported {args.h5} -> {args.out} ({os.path.getsize(args.out)} bytes)")
+    else:
+        max_diff, agreement = check_parity(args.h5, args.npz, args.samples)
+        print(f"Max |keras - numpy| = {max_diff:.2e}, argmax agreement = {agreement:.2%}")
+        if max_diff > args.tolerance or agreement < 1.0:
+            print("❌ NumPy runtime does not match Keras")
+            raise SystemExit(1)
+        print("✅ NumPy runtime matches Keras")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+"""Array-backed dataset matching used by the recommendation fallbacks"""
+import numpy as np
+
+NUMERIC_COLS = ['Temperature', 'Humidity', 'Moisture', 'Nitrogen', 'Phosphorus', 'Potassium']
+
+# Scores within this distance of the best float32 score are re-ranked in float64
+RESCORE_TOLERANCE = 1e-4
+
+# Partitions smaller than this are scanned directly instead of through a KD-tree
+TREE_MIN_ROWS = 256
+
+# Queries scanned together against a small partition in closest_batch
+SCAN_CHUNK_ROWS = 1024
+
+
+class Partition:
+    """Dataset rows sharing a soil/crop key, with a spatial index when large enough"""
+
+    def __init__(self, positions, scaled):
+        self.positions = positions
+        self.tree = None
+        if len(positions) >= TREE_MIN_ROWS:
+            from sklearn.neighbors import KDTree
+            # Manhattan distance over range-scaled columns ranks rows like the similarity score
+            self.tree = KDTree(scaled[positions], metric='manhattan')
+
+    def __len__(self):
+        return len(self.positions)
+
+
+class SimilarityEngine:
+    """Closest-match scorer built once from the dataset.
+
+    Holds the per-column ranges, a range-normalized float32 feature matrix and the
+    dataset pre-partitioned by (Soil Type, Crop Type) and by Crop Type, each with a
+    KD-tree, so a request is a dict lookup plus a logarithmic tree search. The
+    winning row and its confidence are identical to the original per-row loop.
+    """
+
+    def __init__(self, df):
+        self.labels = df['Fertilizer Name'].to_numpy()
+
+        # Keep float64 values for exact re-scoring of near ties
+        self.values = df[NUMERIC_COLS].to_numpy(dtype=np.float64)
+        ranges = self.values.max(axis=0) - self.values.min(axis=0)
+        ranges[ranges == 0] = 1
+        self.ranges = ranges
+        scaled = self.values / ranges
+        self.features = scaled.astype(np.float32)
+
+        self.pairs = {
+            key: Partition(positions, scaled)
+            for key, positions in df.groupby(['Soil Type', 'Crop Type'], sort=False, observed=True).indices.items()
+        }
+        self.crops = {
+            key: Partition(positions, scaled)
+            for key, positions in df.groupby('Crop Type', sort=False, observed=True).indices.items()
+        }
+        self.everything = Partition(np.arange(len(df)), scaled)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def partition_for(self, soil_type, crop_type):
+        """Partition to search, using the soil/crop -> crop -> all fallback order"""
+        partition = self.pairs.get((soil_type, crop_type))
+        if partition is None:
+            partition = self.crops.get(crop_type, self.everything)
+        return partition
+
+    def candidates(self, input_row):
+        """Partition to search for an input row"""
+        return self.partition_for(input_row['Soil Type'], input_row['Crop Type'])
+
+    def query_vector(self, input_row):
+        """Numeric input values as a float64 vector in column order"""
+        return np.array([input_row[col] for col in NUMERIC_COLS], dtype=np.float64)
+
+    def exact_scores(self, positions, queries):
+        """Similarity scores computed in float64 exactly like the original loop.
+
+        queries is one query vector, or one query row per position.
+        """
+        values = self.values[positions]
+        queries = np.atleast_2d(queries)
+        score = np.zeros(len(positions), dtype=np.float64)
+        for i in range(len(NUMERIC_COLS)):
+            score += 1 - np.abs(values[:, i] - queries[:, i]) / self.ranges[i]
+        return score / len(NUMERIC_COLS)
+
+    def nearest_batch(self, partition, queries):
+        """Row positions within rescoring tolerance of the best match, for each query row"""
+        positions = partition.positions
+        finite = np.isfinite(queries).all(axis=1)
+        # NaN/inf inputs score every row alike; the original loop picked the first row
+        nearest = [positions[:1]] * len(queries)
+        rows = np.flatnonzero(finite)
+        if len(rows) == 0:
+            return nearest
+
+        if partition.tree is None:
+            features = self.features[positions]
+            scaled = (queries[rows] / self.ranges).astype(np.float32)
+            for start in range(0, len(rows), SCAN_CHUNK_ROWS):
+                block = scaled[start:start + SCAN_CHUNK_ROWS]
+                distances = np.abs(features[np.newaxis, :, :] - block[:, np.newaxis, :]).sum(axis=2)
+                within = distances <= distances.min(axis=1, keepdims=True) + RESCORE_TOLERANCE
+                for row, mask in zip(rows[start:start + SCAN_CHUNK_ROWS], within):
+                    nearest[row] = positions[mask]
+            return nearest
+
+        scaled = queries[rows] / self.ranges
+        distances, _ = partition.tree.query(scaled, k=1)
+        local = partition.tree.query_radius(scaled, r=distances[:, 0] + RESCORE_TOLERANCE)
+        for row, found in zip(rows, local):
+            nearest[row] = np.sort(positions[found])
+        return nearest
+
+    def nearest_positions(self, partition, query):
+        """Row positions within rescoring tolerance of the best match in a partition"""
+        return self.nearest_batch(partition, query[np.newaxis, :])[0]
+
+    def best_of(self, partition, query):
+        """Return (row position, score) of the best match in a partition"""
+        # Re-rank the front-runners in float64 so ties break on the first row
+        near = self.nearest_positions(partition, query)
+        scores = self.exact_scores(near, query)
+        best = int(np.argmax(scores))
+        return int(near[best]), float(scores[best])
+
+    def closest(self, input_row):
+        """Return (row position, score) of the most similar dataset row"""
+        if len(self.labels) == 0:
+            return None
+        return self.best_of(self.candidates(input_row), self.query_vector(input_row))
+
+    def closest_batch(self, values, soil_types, crop_types):
+        """Best row positions and scores for many queries at once.
+
+        values is a (queries, 6) array in NUMERIC_COLS order. Queries are grouped by
+        partition so each KD-tree is searched once for all of its queries.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        groups = {}
+        for i, key in enumerate(zip(soil_types, crop_types)):
+            partition = self.partition_for(*key)
+            groups.setdefault(id(partition), (partition, []))[1].append(i)
+
+        owners = []
+        candidates = []
+        for partition, rows in groups.values():
+            rows = np.asarray(rows)
+            for row, near in zip(rows, self.nearest_batch(partition, values[rows])):
+                owners.append(np.full(len(near), row))
+                candidates.append(near)
+        owners = np.concatenate(owners)
+        candidates = np.concatenate(candidates)
+
+        # Re-score every (query, candidate) pair in float64 and keep the best per query,
+        # breaking ties on the first dataset row like np.argmax over the original scores
+        scores = self.exact_scores(candidates, values[owners])
+        order = np.lexsort((candidates, -scores, owners))
+        _, first = np.unique(owners[order], return_index=True)
+        best = order[first]
+        return candidates[best], scores[best]
+
+
+class ExactMatchIndex:
+    """Hash lookup from the eight input fields to the first matching dataset row"""
+
+    def __init__(self, df):
+        self.labels = df['Fertilizer Name'].to_numpy()
+
+        # Numeric fields are keyed as Python floats so 112, 112.0 and "112.00" agree
+        columns = [df[col].to_numpy(dtype=np.float64).tolist() for col in NUMERIC_COLS]
+        columns += [df['Soil Type'].tolist(), df['Crop Type'].tolist()]
+
+        self.index = {}
+        for position, key in enumerate(zip(*columns)):
+            # First row wins, matching matched.iloc[0] on the boolean filter
+            self.index.setdefault(key, position)
+
+    def __len__(self):
+        return len(self.index)
+
+    @staticmethod
+    def key(input_row):
+        """Normalized lookup key for an input row"""
+        return tuple(float(input_row[col]) for col in NUMERIC_COLS) + (
+            input_row['Soil Type'], input_row['Crop Type'])
+
+    def lookup(self, input_row):
+        """Row position of the first exact match, or None"""
+        return self.index.get(self.key(input_row))
+
+    def lookup_batch(self, frame):
+        """Row positions of the first exact match for each row of a DataFrame, -1 if none"""
+        columns = [frame[col].to_numpy(dtype=np.float64).tolist() for col in NUMERIC_COLS]
+        columns += [frame['Soil Type'].tolist(), frame['Crop Type'].tolist()]
+        get = self.index.get
+        return np.array([get(key, -1) for key in zip(*columns)], dtype=np.int64)
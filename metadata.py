@@ -0,0 +1,80 @@
+"""Immutable metadata snapshot of one dataset version.
+
+The dataset only changes when the artifact registry loads a new version, so the
+counts, sorted vocabularies, numeric column ranges and class distribution that
+/api/stats, /api/fertilizers and the /recommend dropdowns show are computed once
+at load time. Each JSON view is also serialized once, with an ETag derived from
+its bytes, so a client polling with If-None-Match gets a 304 without the dataset
+being touched.
+"""
+import hashlib
+import json
+
+import numpy as np
+
+CATEGORICAL_COLS = {'soil_types': 'Soil Type', 'crop_types': 'Crop Type', 'fertilizers': 'Fertilizer Name'}
+CLASS_COL = 'Fertilizer Name'
+
+
+def etag_for(body):
+    """Strong ETag value (without quotes) for a serialized body"""
+    return hashlib.sha256(body).hexdigest()[:20]
+
+
+def numeric_summary(values):
+    """min, max and mean of a column, None where it has no values"""
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return {'min': None, 'max': None, 'mean': None}
+    return {'min': float(values.min()), 'max': float(values.max()), 'mean': round(float(values.mean()), 4)}
+
+
+class DatasetMetadata:
+    """Counts, vocabularies, column ranges and class distribution of a dataset.
+
+    Built once per dataset version (df may be None when no dataset is loaded) and
+    never modified afterwards. view(name) returns the precomputed (body, etag) of
+    the 'fertilizers' list or the full 'dataset' summary.
+    """
+
+    def __init__(self, df=None):
+        self.records = len(df) if df is not None else 0
+        self.vocabularies = {}
+        for key, column in CATEGORICAL_COLS.items():
+            values = df[column].dropna().unique() if df is not None and column in df else []
+            self.vocabularies[key] = sorted(str(value) for value in values)
+
+        self.columns = {}
+        if df is not None:
+            for column in df.columns:
+                if column not in CATEGORICAL_COLS.values() and df[column].dtype.kind in 'iuf':
+                    self.columns[column] = numeric_summary(df[column].to_numpy())
+
+        self.class_distribution = {}
+        if df is not None and CLASS_COL in df and self.records:
+            counts = df[CLASS_COL].astype(str).value_counts()
+            self.class_distribution = {name: {'count': int(counts[name]),
+                                              'share': round(int(counts[name]) / self.records, 4)}
+                                       for name in sorted(counts.index)}
+
+        self.summary = {
+            'records': self.records,
+            'counts': {key: len(values) for key, values in self.vocabularies.items()},
+            'vocabularies': self.vocabularies,
+            'columns': self.columns,
+            'class_distribution': self.class_distribution,
+        }
+        self.etag = etag_for(self.serialize(self.summary))
+        self._views = {}
+        for name, value in (('fertilizers', self.vocabularies['fertilizers']), ('dataset', self.summary)):
+            body = self.serialize(value)
+            self._views[name] = (body, etag_for(body))
+
+    @staticmethod
+    def serialize(value):
+        return json.dumps(value, sort_keys=True, separators=(',', ':')).encode()
+
+    def view(self, name):
+        """(JSON body, ETag) of a precomputed view"""
+        return self._views[name]
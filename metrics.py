@@ -0,0 +1,235 @@
+"""In-process metrics in the Prometheus text format, and a sampling profiler.
+
+Counters, gauges and histograms are plain Python objects updated on the request
+path. Each observation is a dict lookup, a bisect and two additions under a
+lock, so instrumenting every stage costs about a microsecond per request.
+MetricsRegistry.render() produces the text served on /metrics. No
+prometheus_client dependency is needed.
+
+Values are per process: with several worker processes, scrape each one or
+aggregate them on the Prometheus side.
+
+SamplingProfiler periodically samples the stacks of all threads with
+sys._current_frames() and counts them in the collapsed format that flame graph
+tools read. It costs nothing while stopped and can be started and stopped at
+runtime.
+"""
+import bisect
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+
+# Seconds; spans the grid lookup (microseconds) to a slow closest match or reload
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+                   0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 10.0)
+
+
+def format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (list(extra.items()) if extra else [])
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    """Monotonic count per label combination"""
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [f"{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}"
+                                for labels, value in values]
+
+
+class Gauge(Metric):
+    """Value read from a callback at scrape time.
+
+    The callback returns a number, or a dict of label tuples to numbers, or None
+    when there is nothing to report.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, function, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def render(self):
+        values = self.function()
+        if values is None:
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        return self.header() + [f"{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}"
+                                for labels, value in sorted(values.items()) if value is not None]
+
+
+class Histogram(Metric):
+    """Bucketed distribution of observations per label combination"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last one is +Inf), sum, count]
+        self._series = {}
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def totals(self, *labels):
+        """(count, sum) of one label combination"""
+        series = self._series.get(labels)
+        return (series[2], series[1]) if series else (0, 0.0)
+
+    def render(self):
+        with self._lock:
+            snapshot = sorted((labels, list(series[0]), series[1], series[2])
+                              for labels, series in self._series.items())
+        lines = self.header()
+        for labels, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = format_labels(self.labelnames, labels, {'le': format_value(bound)})
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labelnames, labels)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """The metrics exposed together on one /metrics endpoint"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, function, labelnames=()):
+        return self.register(Gauge(name, documentation, function, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class SamplingProfiler:
+    """Samples every thread's stack at a fixed interval into collapsed-stack counts"""
+
+    def __init__(self):
+        self.interval = None
+        self.started_at = None
+        self.samples = 0
+        self._stacks = StackCounter()
+        self._lock = threading.Lock()
+        self._stop = None
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, interval_ms=10.0):
+        """Start sampling, clearing the previous profile; False if already running"""
+        with self._lock:
+            if self._thread is not None:
+                return False
+            self.interval = interval_ms / 1000
+            self.started_at = time.time()
+            self.samples = 0
+            self._stacks = StackCounter()
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(self._stop,),
+                                            name='sampling-profiler', daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        """Stop sampling; the collected profile stays readable"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is None:
+                return False
+            self._stop.set()
+        thread.join()
+        return True
+
+    def _run(self, stop):
+        own = threading.get_ident()
+        while not stop.wait(self.interval):
+            stacks = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stacks.append(';'.join(reversed(names)))
+            self._stacks.update(stacks)
+            self.samples += 1
+
+    def collapsed(self, limit=None):
+        """Profile as "frame;frame;frame count" lines, most frequent first"""
+        return '\n'.join(f"{stack} {count}" for stack, count in self._stacks.most_common(limit)) + '\n'
+
+    def stats(self):
+        return {
+            'running': self.running,
+            'interval_ms': self.interval * 1000 if self.interval else None,
+            'started_at': self.started_at,
+            'samples': self.samples,
+            'distinct_stacks': len(self._stacks),
+        }
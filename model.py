@@ -1,157 +1,849 @@
-import pandas as pd
-import numpy as np
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler, LabelEncoder, OneHotEncoder
-from sklearn.compose import ColumnTransformer
-from tensorflow.keras.models import Sequential, load_model
-from tensorflow.keras.layers import Dense, Dropout, Bidirectional, LSTM
-from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint
-from tensorflow.keras.utils import to_categorical
-import joblib
-import os
-
-# ---------- STEP 1: Load and Prepare Dataset ----------
-def load_and_prepare_data(csv_path):
-    try:
-        df = pd.read_csv('Fertilizer_Prediction_gpt(1).csv')
-    except FileNotFoundError:
-        print(f"❌ Error: Dataset file not found at '{csv_path}'")
-        return None, None, None, None, None, None, None, None
-    except Exception as e:
-        print(f"❌ Error loading dataset: {e}")
-        return None, None, None, None, None, None, None, None
-
-    # Define features and target
-    numerical_features = ['Nitrogen', 'Phosphorus', 'Potassium', 'Moisture', 'Temperature', 'Humidity']
-    categorical_features = ['Soil Type', 'Crop Type']
-    label = 'Fertilizer Name'
-
-    # Ensure all required columns exist
-    required_columns = numerical_features + categorical_features + [label]
-    for col in required_columns:
-        if col not in df.columns:
-            print(f"❌ Error: Missing required column in dataset: '{col}'")
-            return None, None, None, None, None, None, None, None
-
-    X = df[numerical_features + categorical_features]
-    y_raw = df[label]
-
-    # Preprocessing: Scale numerical and one-hot encode categorical features
-    preprocessor = ColumnTransformer(
-        transformers=[
-            ('num', StandardScaler(), numerical_features),
-            ('cat', OneHotEncoder(handle_unknown='ignore'), categorical_features)
-        ]
-    )
-
-    X_processed = preprocessor.fit_transform(X)
-    joblib.dump(preprocessor, "preprocessor.pkl")
-
-    # Label encode the target variable
-    fert_encoder = LabelEncoder()
-    y_encoded = fert_encoder.fit_transform(y_raw)
-    y_cat = to_categorical(y_encoded)
-    joblib.dump(fert_encoder, "fertilizer_encoder.pkl")
-
-    return X_processed, y_cat, X_processed.shape[1], y_cat.shape[1], preprocessor, fert_encoder, y_encoded, X
-
-# ---------- STEP 2: Build and Train Hybrid Model ----------
-def train_hybrid_model(X_train, y_train, input_dim, output_dim):
-    # Reshape data for LSTM input (samples, time_steps, features)
-    # Here time_steps is 1 as each sample is independent
-    X_train_reshaped = X_train.reshape((X_train.shape[0], 1, X_train.shape[1]))
-
-    model = Sequential([
-        LSTM(64, input_shape=(X_train_reshaped.shape[1], X_train_reshaped.shape[2]), return_sequences=False),
-        Dropout(0.4),
-        Dense(128, activation='relu'),
-        Dropout(0.3),
-        Dense(64, activation='relu'),
-        Dropout(0.2),
-        Dense(output_dim, activation='softmax')
-    ])
-
-
-    model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
-
-    # Callbacks for better training
-    early_stop = EarlyStopping(monitor='val_loss', patience=10, restore_best_weights=True)
-    checkpoint = ModelCheckpoint("best_fertilizer_model.h5", save_best_only=True, monitor='val_accuracy', mode='max')
-
-    model.fit(
-        X_train_reshaped, y_train,
-        epochs=100,
-        batch_size=32,
-        validation_split=0.2,
-        callbacks=[early_stop, checkpoint],
-        verbose=1
-    )
-
-    print("✅ Model trained and saved as 'best_fertilizer_model.h5'.")
-
-# ---------- STEP 3: Recommend Fertilizer ----------
-def recommend_fertilizer(input_data: dict, preprocessor, fert_encoder):
-    # Load saved model
-    model = load_model("best_fertilizer_model.h5")
-
-    # Create DataFrame from new input
-    input_df = pd.DataFrame([input_data])
-
-    # Preprocess input using the saved preprocessor
-    try:
-        input_processed = preprocessor.transform(input_df)
-    except ValueError as e:
-        print(f"❌ Error during preprocessing: {e}")
-        print("Please ensure your input data matches the format and types of the training data.")
-        return
-
-    # Reshape input for the LSTM model
-    input_processed_reshaped = input_processed.reshape((input_processed.shape[0], 1, input_processed.shape[1]))
-
-
-    # Predict
-    prediction = model.predict(input_processed_reshaped)
-    predicted_class = np.argmax(prediction)
-
-    recommended_fertilizer = fert_encoder.inverse_transform([predicted_class])[0]
-    print(f"\n🌱 Recommended Fertilizer: {recommended_fertilizer}")
-
-# ---------- STEP 4: Run Everything ----------
-if _name_ == "_main_":
-    # === 1. Load your dataset ===
-    dataset_path = input("📂 Enter path to your fertilizer CSV dataset: ").strip()
-    if not os.path.exists(dataset_path):
-        print("❌ Dataset file not found.")
-        exit()
-
-    X, y_cat, input_dim, output_dim, preprocessor, fert_encoder, y_encoded, X_original = load_and_prepare_data(dataset_path)
-
-    if X is not None:  # Proceed only if data loaded successfully
-        # Split dataset
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y_cat, test_size=0.2, random_state=42, stratify=y_encoded
-        )
-
-        # Train high-capacity hybrid model
-        train_hybrid_model(X_train, y_train, input_dim, output_dim)
-
-        # === 2. Get input from user ===
-        print("\n🔢 Enter soil and crop parameters for fertilizer recommendation:")
-
-        user_input = {}
-        try:
-            user_input['Nitrogen'] = float(input("Nitrogen (N): "))
-            user_input['Phosphorus'] = float(input("Phosphorus (P): "))
-            user_input['Potassium'] = float(input("Potassium (K): "))
-            user_input['Moisture'] = float(input("Moisture (%): "))
-            user_input['Temperature'] = float(input("Temperature (°C): "))
-            user_input['Humidity'] = float(input("Humidity (%): "))
-            user_input['Soil Type'] = input("Soil Type (e.g., Sandy, Loamy, Black): ").strip()
-            user_input['Crop Type'] = input("Crop Type (e.g., Rice, Wheat, Maize): ").strip()
-
-            recommend_fertilizer(user_input, preprocessor, fert_encoder)
-
-        except ValueError:
-            print("❌ Invalid input. Please enter correct numerical values.")
-        except Exception as e:
-            print(f"❌ Unexpected error: {e}")
\ No newline at end of file
+import pandas as pd
+import numpy as np
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import StandardScaler, LabelEncoder, OneHotEncoder
+from sklearn.compose import ColumnTransformer
+import joblib
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+
+# TensorFlow is imported inside the training and Keras prediction functions, so
+# bulk scoring (which runs on the NumPy runtime in inference.py) starts quickly.
+
+DATASET_PATH = "Fertilizer_Prediction_gpt(1).csv"
+
+NUMERICAL_FEATURES = ['Nitrogen', 'Phosphorus', 'Potassium', 'Moisture', 'Temperature', 'Humidity']
+CATEGORICAL_FEATURES = ['Soil Type', 'Crop Type']
+LABEL = 'Fertilizer Name'
+
+# ---------- STEP 1: Load and Prepare Dataset ----------
+def load_and_prepare_data(csv_path, save=True):
+    try:
+        df = pd.read_csv(csv_path)
+    except FileNotFoundError:
+        print(f"❌ Error: Dataset file not found at '{csv_path}'")
+        return None, None, None, None, None, None, None, None
+    except Exception as e:
+        print(f"❌ Error loading dataset: {e}")
+        return None, None, None, None, None, None, None, None
+
+    # Define features and target
+    numerical_features = ['Nitrogen', 'Phosphorus', 'Potassium', 'Moisture', 'Temperature', 'Humidity']
+    categorical_features = ['Soil Type', 'Crop Type']
+    label = 'Fertilizer Name'
+
+    # Ensure all required columns exist
+    required_columns = numerical_features + categorical_features + [label]
+    for col in required_columns:
+        if col not in df.columns:
+            print(f"❌ Error: Missing required column in dataset: '{col}'")
+            return None, None, None, None, None, None, None, None
+
+    X = df[numerical_features + categorical_features]
+    y_raw = df[label]
+
+    # Preprocessing: Scale numerical and one-hot encode categorical features
+    preprocessor = ColumnTransformer(
+        transformers=[
+            ('num', StandardScaler(), numerical_features),
+            ('cat', OneHotEncoder(handle_unknown='ignore'), categorical_features)
+        ]
+    )
+
+    X_processed = preprocessor.fit_transform(X)
+    if save:
+        joblib.dump(preprocessor, "preprocessor.pkl")
+
+    # Label encode the target variable
+    from tensorflow.keras.utils import to_categorical
+    fert_encoder = LabelEncoder()
+    y_encoded = fert_encoder.fit_transform(y_raw)
+    y_cat = to_categorical(y_encoded)
+    if save:
+        joblib.dump(fert_encoder, "fertilizer_encoder.pkl")
+
+    return X_processed, y_cat, X_processed.shape[1], y_cat.shape[1], preprocessor, fert_encoder, y_encoded, X
+
+# ---------- STEP 2: Build and Train Hybrid Model ----------
+def train_hybrid_model(X_train, y_train, input_dim, output_dim, epochs=100, batch_size=32, architecture=None,
+                       validation_split=0.2):
+    """Train and save the model; validation_split=0 trains on every row for exactly epochs"""
+    from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint
+
+    # Reshape data for LSTM input (samples, time_steps, features)
+    # Here time_steps is 1 as each sample is independent
+    X_train_reshaped = X_train.reshape((X_train.shape[0], 1, X_train.shape[1]))
+
+    model = build_hybrid_model(input_dim, output_dim, **(architecture or {}))
+    model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
+
+    # Callbacks for better training
+    early_stop = EarlyStopping(monitor='val_loss', patience=10, restore_best_weights=True)
+    checkpoint = ModelCheckpoint("best_fertilizer_model.h5", save_best_only=True, monitor='val_accuracy', mode='max')
+    epoch_seconds = []
+    callbacks = [epoch_timer(epoch_seconds)]
+    if validation_split:
+        callbacks = [early_stop, checkpoint] + callbacks
+
+    start = time.perf_counter()
+    history = model.fit(
+        X_train_reshaped, y_train,
+        epochs=epochs,
+        batch_size=batch_size,
+        validation_split=validation_split,
+        callbacks=callbacks,
+        verbose=1
+    )
+    if not validation_split:
+        # No validation data to pick a checkpoint with; the last epoch's weights are the model
+        model.save("best_fertilizer_model.h5")
+
+    print("✅ Model trained and saved as 'best_fertilizer_model.h5'.")
+    return model, training_report('numpy', history, epoch_seconds, time.perf_counter() - start,
+                                  batch_size=batch_size, learning_rate=0.001, train_rows=len(X_train))
+
+def build_hybrid_model(input_dim, output_dim, lstm_units=64, dense_units=(128, 64), dropout=(0.4, 0.3, 0.2)):
+    """LSTM + Dense network over one timestep of input_dim features.
+
+    dropout holds one rate for the LSTM output and one per Dense layer.
+    """
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import Input, Dense, Dropout, LSTM
+
+    layers = [Input(shape=(1, input_dim)), LSTM(lstm_units, return_sequences=False), Dropout(dropout[0])]
+    for units, rate in zip(dense_units, dropout[1:]):
+        layers += [Dense(units, activation='relu'), Dropout(rate)]
+    layers.append(Dense(output_dim, activation='softmax'))
+    return Sequential(layers)
+
+def epoch_timer(epoch_seconds):
+    """Keras callback appending the wall-clock seconds of every epoch to epoch_seconds"""
+    from tensorflow.keras.callbacks import LambdaCallback
+
+    started = [0.0]
+    return LambdaCallback(
+        on_epoch_begin=lambda epoch, logs: started.__setitem__(0, time.perf_counter()),
+        on_epoch_end=lambda epoch, logs: epoch_seconds.append(time.perf_counter() - started[0])
+    )
+
+def training_report(pipeline, history, epoch_seconds, total_seconds, **settings):
+    """Timing and accuracy summary of one training run"""
+    val_accuracy = history.history.get('val_accuracy', [])
+    return dict(
+        settings,
+        pipeline=pipeline,
+        epochs=len(epoch_seconds),
+        epoch_seconds=[round(seconds, 3) for seconds in epoch_seconds],
+        mean_epoch_seconds=round(float(np.mean(epoch_seconds)), 3) if epoch_seconds else None,
+        total_seconds=round(total_seconds, 2),
+        final_val_accuracy=float(val_accuracy[-1]) if val_accuracy else None,
+        best_val_accuracy=float(max(val_accuracy)) if val_accuracy else None,
+    )
+
+# ---------- STEP 2b: Streaming tf.data Training ----------
+# Batches whose order tf.data shuffles across chunk boundaries
+SHUFFLE_BATCHES = 16
+
+# Partitions of the streamed rows
+TRAIN, VALIDATION, TEST = 0, 1, 2
+
+def row_partition(chunk_number, n_rows, validation_fraction, test_fraction, seed):
+    """TRAIN, VALIDATION or TEST for each row of one CSV chunk; the same every epoch.
+
+    test_fraction of the rows are held out for the final accuracy, and
+    validation_fraction of the rest for early stopping, like the numpy path's
+    train_test_split followed by validation_split.
+    """
+    draws = np.random.default_rng([seed, chunk_number]).random(n_rows)
+    partition = np.full(n_rows, TRAIN, dtype=np.int8)
+    partition[draws < test_fraction + (1 - test_fraction) * validation_fraction] = VALIDATION
+    partition[draws < test_fraction] = TEST
+    return partition
+
+def scan_training_data(csv_path, chunk_rows, batch_size, validation_fraction, test_fraction, seed):
+    """One streaming pass over the CSV collecting what training needs up front.
+
+    Returns the fitted preprocessor, the label encoder and the train/validation/test
+    row counts and training steps, holding only one chunk in memory at a time.
+    """
+    scaler = StandardScaler()
+    categories = {col: set() for col in CATEGORICAL_FEATURES}
+    labels = set()
+    sample = None
+    counts = {'train_rows': 0, 'val_rows': 0, 'test_rows': 0, 'train_steps': 0}
+
+    for number, chunk in enumerate(pd.read_csv(csv_path, chunksize=chunk_rows)):
+        missing = [col for col in NUMERICAL_FEATURES + CATEGORICAL_FEATURES + [LABEL] if col not in chunk.columns]
+        if missing:
+            raise ValueError(f"Missing required column(s) in dataset: {', '.join(missing)}")
+        if sample is None:
+            sample = chunk
+        scaler.partial_fit(chunk[NUMERICAL_FEATURES].to_numpy(dtype=np.float64))
+        for col in CATEGORICAL_FEATURES:
+            categories[col].update(chunk[col].unique())
+        labels.update(chunk[LABEL].unique())
+
+        sizes = np.bincount(row_partition(number, len(chunk), validation_fraction, test_fraction, seed),
+                            minlength=3)
+        counts['train_rows'] += int(sizes[TRAIN])
+        counts['val_rows'] += int(sizes[VALIDATION])
+        counts['test_rows'] += int(sizes[TEST])
+        counts['train_steps'] += -(-int(sizes[TRAIN]) // batch_size)
+
+    if sample is None:
+        raise ValueError("Dataset is empty")
+
+    # Same transformer as load_and_prepare_data, with the scaler statistics of the
+    # whole file and the categories seen anywhere in it
+    preprocessor = ColumnTransformer(
+        transformers=[
+            ('num', StandardScaler(), NUMERICAL_FEATURES),
+            ('cat', OneHotEncoder(categories=[sorted(categories[col]) for col in CATEGORICAL_FEATURES],
+                                  handle_unknown='ignore'), CATEGORICAL_FEATURES)
+        ]
+    )
+    preprocessor.fit(sample[NUMERICAL_FEATURES + CATEGORICAL_FEATURES])
+    fitted_scaler = preprocessor.named_transformers_['num']
+    for attr in ('mean_', 'var_', 'scale_', 'n_samples_seen_'):
+        setattr(fitted_scaler, attr, getattr(scaler, attr))
+
+    fert_encoder = LabelEncoder().fit(sorted(labels))
+    return preprocessor, fert_encoder, counts
+
+def csv_batches(csv_path, encoder, classes, chunk_rows, batch_size, validation_fraction, test_fraction, seed,
+                partition, rng=None):
+    """Yield (features, labels) batches of one partition's rows, chunk by chunk"""
+    for number, chunk in enumerate(pd.read_csv(csv_path, chunksize=chunk_rows)):
+        part = chunk[row_partition(number, len(chunk), validation_fraction, test_fraction, seed) == partition]
+        if part.empty:
+            continue
+        features = encoder.transform_batch(part)
+        labels = np.searchsorted(classes, part[LABEL].to_numpy()).astype(np.int32)
+        if rng is not None:
+            order = rng.permutation(len(part))
+            features, labels = features[order], labels[order]
+        features = features.reshape((len(part), 1, features.shape[1]))
+        for start in range(0, len(part), batch_size):
+            yield features[start:start + batch_size], labels[start:start + batch_size]
+
+def make_dataset(csv_path, encoder, classes, chunk_rows, batch_size, validation_fraction, test_fraction, seed,
+                 partition):
+    """tf.data pipeline streaming float32 batches of one partition from the CSV"""
+    import tensorflow as tf
+
+    training = partition == TRAIN
+    rng = np.random.default_rng(seed) if training else None
+    dataset = tf.data.Dataset.from_generator(
+        lambda: csv_batches(csv_path, encoder, classes, chunk_rows, batch_size,
+                            validation_fraction, test_fraction, seed, partition, rng),
+        output_signature=(
+            tf.TensorSpec(shape=(None, 1, encoder.n_features), dtype=tf.float32),
+            tf.TensorSpec(shape=(None,), dtype=tf.int32),
+        )
+    )
+    if training:
+        dataset = dataset.shuffle(SHUFFLE_BATCHES, seed=seed, reshuffle_each_iteration=True)
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+def train_streaming_model(csv_path, batch_size=512, epochs=100, learning_rate=0.003,
+                          chunk_rows=100000, validation_fraction=0.2, test_fraction=0.2, seed=42):
+    """Train the hybrid model from a tf.data pipeline that streams the CSV.
+
+    The dataset never has to fit in memory: features are scaled and one-hot
+    encoded to float32 chunk by chunk, rows are shuffled within each chunk and
+    batches across chunks, and the next batches are prefetched while the model
+    trains. The learning rate follows a cosine decay over the whole run. The
+    holdout accuracy is measured on test rows that early stopping never sees.
+    """
+    import tensorflow as tf
+    from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint
+    from inference import FeatureEncoder
+
+    preprocessor, fert_encoder, counts = scan_training_data(
+        csv_path, chunk_rows, batch_size, validation_fraction, test_fraction, seed)
+    joblib.dump(preprocessor, "preprocessor.pkl")
+    joblib.dump(fert_encoder, "fertilizer_encoder.pkl")
+    print(f"📊 {counts['train_rows']} training rows, {counts['val_rows']} validation rows, "
+          f"{counts['test_rows']} test rows, {len(fert_encoder.classes_)} fertilizers")
+
+    encoder = FeatureEncoder.from_preprocessor(preprocessor)
+    classes = fert_encoder.classes_
+    train_data, val_data, test_data = (
+        make_dataset(csv_path, encoder, classes, chunk_rows, batch_size, validation_fraction, test_fraction, seed, part)
+        for part in (TRAIN, VALIDATION, TEST))
+
+    tf.keras.utils.set_random_seed(seed)
+    schedule = tf.keras.optimizers.schedules.CosineDecay(
+        learning_rate, decay_steps=max(counts['train_steps'] * epochs, 1), alpha=0.05)
+    model = build_hybrid_model(encoder.n_features, len(classes))
+    model.compile(optimizer=tf.keras.optimizers.Adam(schedule),
+                  loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+
+    early_stop = EarlyStopping(monitor='val_loss', patience=10, restore_best_weights=True)
+    checkpoint = ModelCheckpoint("best_fertilizer_model.h5", save_best_only=True, monitor='val_accuracy', mode='max')
+    epoch_seconds = []
+
+    start = time.perf_counter()
+    history = model.fit(
+        train_data,
+        epochs=epochs,
+        validation_data=val_data,
+        callbacks=[early_stop, checkpoint, epoch_timer(epoch_seconds)],
+        verbose=1
+    )
+    total_seconds = time.perf_counter() - start
+
+    print("✅ Model trained and saved as 'best_fertilizer_model.h5'.")
+    report = training_report('tfdata', history, epoch_seconds, total_seconds, batch_size=batch_size,
+                             learning_rate=learning_rate, train_rows=counts['train_rows'])
+    report['test_rows'] = counts['test_rows']
+    report['holdout_accuracy'] = float(model.evaluate(test_data, verbose=0)[1])
+    return model, report
+
+# ---------- STEP 2c: Hyperparameter Search ----------
+SEARCH_SPACE = {
+    'lstm_units': [32, 64, 128],
+    'dense_units': [[64, 32], [128, 64], [256, 128]],
+    'dropout': [[0.2, 0.1, 0.1], [0.4, 0.3, 0.2], [0.5, 0.4, 0.3]],
+    'batch_size': [32, 128, 512],
+}
+# The hard-coded train_hybrid_model settings, always the first trial
+ORIGINAL_CONFIG = {'lstm_units': 64, 'dense_units': [128, 64], 'dropout': [0.4, 0.3, 0.2], 'batch_size': 32}
+ARCHITECTURE_KEYS = ('lstm_units', 'dense_units', 'dropout')
+SEARCH_LOG = "search_trials.jsonl"
+# EarlyStopping patience of every CV fold
+SEARCH_PATIENCE = 10
+SEARCH_BEST = "search_best.json"
+
+# Thread-pool sizes the math libraries and TensorFlow read when a search worker imports them
+SEARCH_THREAD_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                      'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS')
+
+# Data of a search worker process, loaded once by init_search_worker
+_search_data = None
+
+def search_configs(trials, seed):
+    """The original configuration followed by distinct random draws from SEARCH_SPACE"""
+    grid = [dict(zip(SEARCH_SPACE, values)) for values in itertools.product(*SEARCH_SPACE.values())]
+    order = np.random.default_rng(seed).permutation(len(grid))
+    configs = [ORIGINAL_CONFIG] + [grid[i] for i in order if grid[i] != ORIGINAL_CONFIG]
+    return configs[:trials]
+
+def trial_key(config, fold, folds, seed, epochs):
+    """Identity of one fold of one trial in the trial log"""
+    return (json.dumps(config, sort_keys=True), fold, folds, seed, epochs)
+
+def read_trial_log(path):
+    """Completed folds from a trial log, keyed by trial_key"""
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Partial line left by an interrupted run
+                continue
+            records[trial_key(record['config'], record['fold'], record['folds'],
+                              record['seed'], record['epochs'])] = record
+    return records
+
+@contextmanager
+def search_worker_threads(threads):
+    """Set the thread caps in the environment the spawned search workers start with.
+
+    A spawned worker imports NumPy and scikit-learn with this module, before its
+    initializer runs, so their BLAS/OpenMP pools only see caps set here. The
+    parent's environment is restored afterwards.
+    """
+    caps = dict.fromkeys(SEARCH_THREAD_VARS, str(threads))
+    caps['TF_NUM_INTEROP_THREADS'] = '1'
+    saved = {name: os.environ.get(name) for name in caps}
+    os.environ.update(caps)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+def init_search_worker(csv_path, threads):
+    """Process-pool initializer: cap TensorFlow's threads, then load the data once.
+
+    The BLAS/OpenMP caps come from the environment (search_worker_threads).
+    """
+    global _search_data
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    X, y_cat, _, _, _, _, y_encoded, _ = load_and_prepare_data(csv_path, save=False)
+    _search_data = (X, y_cat, y_encoded)
+
+def run_fold(config, fold, folds, seed, epochs):
+    """Train one configuration on one stratified CV fold; returns its trial log record"""
+    import tensorflow as tf
+    from tensorflow.keras.callbacks import EarlyStopping
+    from sklearn.model_selection import StratifiedKFold
+
+    X, y_cat, y_encoded = _search_data
+    train_idx, test_idx = list(StratifiedKFold(folds, shuffle=True, random_state=seed).split(X, y_encoded))[fold]
+    X_train = X[train_idx].reshape((len(train_idx), 1, X.shape[1]))
+    X_test = X[test_idx].reshape((len(test_idx), 1, X.shape[1]))
+
+    tf.keras.utils.set_random_seed(seed + fold)
+    model = build_hybrid_model(X.shape[1], y_cat.shape[1], **{k: config[k] for k in ARCHITECTURE_KEYS})
+    model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
+
+    start = time.perf_counter()
+    history = model.fit(
+        X_train, y_cat[train_idx],
+        epochs=epochs,
+        batch_size=config['batch_size'],
+        validation_split=0.2,
+        callbacks=[EarlyStopping(monitor='val_loss', patience=SEARCH_PATIENCE, restore_best_weights=True)],
+        verbose=0
+    )
+    accuracy = model.evaluate(X_test, y_cat[test_idx], verbose=0)[1]
+    return {
+        'config': config, 'fold': fold, 'folds': folds, 'seed': seed, 'epochs': epochs,
+        'accuracy': float(accuracy), 'epochs_run': len(history.history['loss']),
+        'seconds': round(time.perf_counter() - start, 2), 'pid': os.getpid(),
+    }
+
+def summarize_search(configs, records, folds, seed, epochs):
+    """Mean and spread of the fold accuracies of every configuration, best first"""
+    summary = []
+    for config in configs:
+        done = [records[key] for key in (trial_key(config, fold, folds, seed, epochs) for fold in range(folds))
+                if key in records]
+        if len(done) < folds:
+            continue
+        accuracies = [record['accuracy'] for record in done]
+        # EarlyStopping restores the weights from SEARCH_PATIENCE epochs before it stopped
+        best_epochs = [record['epochs_run'] - SEARCH_PATIENCE if record['epochs_run'] < record['epochs']
+                       else record['epochs_run'] for record in done]
+        summary.append({
+            'config': config,
+            'mean_accuracy': float(np.mean(accuracies)),
+            'std_accuracy': float(np.std(accuracies)),
+            'fold_accuracies': accuracies,
+            'train_seconds': round(sum(record['seconds'] for record in done), 2),
+            'best_epoch': max(1, int(round(np.mean(best_epochs)))),
+        })
+    return sorted(summary, key=lambda result: (-result['mean_accuracy'], result['std_accuracy']))
+
+def hyperparameter_search(csv_path, trials=12, folds=5, workers=None, threads_per_worker=None,
+                          epochs=100, seed=42, log_path=SEARCH_LOG):
+    """Stratified k-fold CV of sampled configurations on a pool of processes.
+
+    Each (configuration, fold) pair is one task. Every finished fold is appended
+    to the JSONL trial log straight away, and folds already in the log are
+    skipped, so an interrupted search resumes where it stopped.
+    """
+    cpus = os.cpu_count() or 1
+    workers = workers or cpus
+    threads = threads_per_worker or max(1, cpus // workers)
+    configs = search_configs(trials, seed)
+    records = read_trial_log(log_path)
+    pending = [(config, fold) for config in configs for fold in range(folds)
+               if trial_key(config, fold, folds, seed, epochs) not in records]
+
+    total = len(configs) * folds
+    print(f"🔎 {len(configs)} configurations x {folds} folds: {total - len(pending)} folds already in "
+          f"{log_path}, {len(pending)} to run on {workers} processes x {threads} threads")
+    if pending:
+        start = time.perf_counter()
+        context = multiprocessing.get_context('spawn')
+        with search_worker_threads(threads), \
+                ProcessPoolExecutor(workers, mp_context=context, initializer=init_search_worker,
+                                    initargs=(csv_path, threads)) as pool, open(log_path, 'a') as log:
+            futures = [pool.submit(run_fold, config, fold, folds, seed, epochs) for config, fold in pending]
+            for finished, future in enumerate(as_completed(futures), 1):
+                record = future.result()
+                log.write(json.dumps(record) + '\n')
+                log.flush()
+                os.fsync(log.fileno())
+                records[trial_key(record['config'], record['fold'], folds, seed, epochs)] = record
+                print(f"   [{finished}/{len(pending)}] fold {record['fold']} of {json.dumps(record['config'])}: "
+                      f"accuracy {record['accuracy']:.4f} ({record['seconds']}s, "
+                      f"{time.perf_counter() - start:.0f}s elapsed)")
+
+    return summarize_search(configs, records, folds, seed, epochs)
+
+def export_best_config(csv_path, best, best_path=SEARCH_BEST):
+    """Retrain the winning configuration on the whole dataset as the serving artifact set.
+
+    Every row goes into training, so no holdout is left: it runs for the mean
+    early-stopped epoch count of its CV folds, and the CV accuracy is the estimate.
+    """
+    from inference import export_weights
+
+    X, y_cat, input_dim, output_dim, preprocessor, fert_encoder, y_encoded, X_original = load_and_prepare_data(csv_path)
+    config = best['config']
+    model, report = train_hybrid_model(X, y_cat, input_dim, output_dim, epochs=best['best_epoch'],
+                                       batch_size=config['batch_size'],
+                                       architecture={k: config[k] for k in ARCHITECTURE_KEYS},
+                                       validation_split=0)
+    report['cv_accuracy'] = best['mean_accuracy']
+
+    # The NumPy runtime the app serves from; the app's hot reload picks up the new files
+    export_weights("best_fertilizer_model.h5", "best_fertilizer_model.npz")
+    with open(best_path, 'w') as f:
+        json.dump(dict(best, training=report), f, indent=2)
+    print(f"✅ Best configuration exported: trained on all {len(X)} rows for {report['epochs']} epochs, "
+          f"CV accuracy {best['mean_accuracy']:.4f}, details in {best_path}")
+
+# ---------- STEP 2d: Distill a Tree Student ----------
+STUDENT_PATH = "student_model.pkl"
+# Student confidence (%) levels the distillation report covers
+STUDENT_THRESHOLDS = (50, 70, 80, 90, 95, 99)
+
+def distillation_inputs(csv_path, synthetic, seed):
+    """Dataset rows plus synthetic rows jittered around them, for the teacher to label"""
+    df = pd.read_csv(csv_path)
+    rng = np.random.default_rng(seed)
+    jittered = df.iloc[rng.integers(0, len(df), synthetic)].reset_index(drop=True)
+    for col in NUMERICAL_FEATURES:
+        noise = rng.normal(0, 0.25 * df[col].std(), synthetic)
+        jittered[col] = np.clip(jittered[col] + noise, df[col].min(), df[col].max())
+    return pd.concat([df, jittered], ignore_index=True)
+
+def tier_latency(predict, rows):
+    """Mean and p99 single-row latency of predict in microseconds"""
+    seconds = []
+    for row in rows:
+        start = time.perf_counter()
+        predict(row)
+        seconds.append(time.perf_counter() - start)
+    seconds = np.array(seconds) * 1e6
+    return {'mean_us': round(float(seconds.mean()), 1), 'p99_us': round(float(np.percentile(seconds, 99)), 1)}
+
+def distill_student(csv_path=DATASET_PATH, student_path=STUDENT_PATH, max_depth=12, min_samples_leaf=5,
+                    synthetic=50000, seed=42):
+    """Fit a decision tree on the network's soft labels and save it for tiered serving.
+
+    Returns the report of student/teacher agreement, the share of requests the
+    student would answer at each confidence threshold, and per-tier latency.
+    """
+    from sklearn.tree import DecisionTreeRegressor
+    from inference import load_serving_model, FeatureEncoder, TreeStudent
+    from grid import model_digest
+
+    teacher = load_serving_model("best_fertilizer_model.h5", "best_fertilizer_model.npz")
+    if teacher is None or not os.path.exists("preprocessor.pkl"):
+        raise FileNotFoundError("the trained model and preprocessor.pkl are required")
+    encoder = FeatureEncoder.load("preprocessor.pkl")
+
+    frame = distillation_inputs(csv_path, synthetic, seed)
+    features = encoder.transform_batch(frame)
+    soft_labels = teacher.predict(features)
+    train_idx, test_idx = train_test_split(np.arange(len(frame)), test_size=0.2, random_state=seed)
+
+    start = time.perf_counter()
+    tree = DecisionTreeRegressor(max_depth=max_depth, min_samples_leaf=min_samples_leaf, random_state=seed)
+    tree.fit(features[train_idx], soft_labels[train_idx])
+    fit_seconds = time.perf_counter() - start
+    student = TreeStudent(tree)
+
+    # Agreement with the teacher on rows the student never saw
+    teacher_class = soft_labels[test_idx].argmax(axis=1)
+    student_probabilities = student.predict(features[test_idx])
+    agrees = student_probabilities.argmax(axis=1) == teacher_class
+    confidence = student_probabilities.max(axis=1) * 100
+    thresholds = {}
+    for threshold in STUDENT_THRESHOLDS:
+        served = confidence >= threshold
+        thresholds[str(threshold)] = {
+            'student_share': round(float(served.mean()), 4),
+            # Escalated rows get the teacher's answer, so only student-served rows can disagree
+            'tiered_agreement': round(float(1 - (served & ~agrees).mean()), 4),
+        }
+
+    sample = features[test_idx[:2000]]
+    report = {
+        'teacher': 'best_fertilizer_model.h5',
+        'train_rows': len(train_idx),
+        'test_rows': len(test_idx),
+        'max_depth': max_depth,
+        'leaves': int(tree.get_n_leaves()),
+        'fit_seconds': round(fit_seconds, 2),
+        'agreement': round(float(agrees.mean()), 4),
+        'thresholds': thresholds,
+        'latency': {
+            'student': tier_latency(student.predict_row, sample),
+            'teacher': tier_latency(lambda row: teacher.predict(row.reshape((1, 1, -1))), sample),
+        },
+    }
+
+    # Written atomically: the app's hot reload may be watching the file. The student's
+    # leaves index the label encoder's classes, so it is tied to the encoder as well
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(student_path)), suffix='.tmp')
+    os.close(fd)
+    try:
+        joblib.dump({'tree': tree, 'teacher': model_digest(), 'report': report}, tmp_path)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, student_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return report
+
+# ---------- STEP 3: Recommend Fertilizer ----------
+def recommend_fertilizer(input_data: dict, preprocessor, fert_encoder):
+    # Load saved model
+    from tensorflow.keras.models import load_model
+    model = load_model("best_fertilizer_model.h5")
+
+    # Create DataFrame from new input
+    input_df = pd.DataFrame([input_data])
+
+    # Preprocess input using the saved preprocessor
+    try:
+        input_processed = preprocessor.transform(input_df)
+    except ValueError as e:
+        print(f"❌ Error during preprocessing: {e}")
+        print("Please ensure your input data matches the format and types of the training data.")
+        return
+
+    # Reshape input for the LSTM model
+    input_processed_reshaped = input_processed.reshape((input_processed.shape[0], 1, input_processed.shape[1]))
+
+
+    # Predict
+    prediction = model.predict(input_processed_reshaped)
+    predicted_class = np.argmax(prediction)
+
+    recommended_fertilizer = fert_encoder.inverse_transform([predicted_class])[0]
+    print(f"\n🌱 Recommended Fertilizer: {recommended_fertilizer}")
+
+# ---------- STEP 4: Score a CSV of Soil Tests ----------
+def load_scoring_stages(dataset_path=DATASET_PATH):
+    """Load the serving artifacts as pipeline.score_batch keyword arguments"""
+    from inference import load_serving_model, FeatureEncoder
+    from dataset_cache import load_dataset
+    from matching import SimilarityEngine, ExactMatchIndex
+
+    stages = {'model': None, 'encoder': None, 'class_names': None, 'exact_index': None, 'matcher': None}
+    if os.path.exists("preprocessor.pkl") and os.path.exists("fertilizer_encoder.pkl"):
+        model = load_serving_model("best_fertilizer_model.h5", "best_fertilizer_model.npz")
+        if model is not None:
+            stages['model'] = model
+            stages['encoder'] = FeatureEncoder.load("preprocessor.pkl")
+            stages['class_names'] = joblib.load("fertilizer_encoder.pkl").classes_
+    if os.path.exists(dataset_path):
+        dataset = load_dataset(dataset_path)
+        stages['exact_index'] = ExactMatchIndex(dataset)
+        stages['matcher'] = SimilarityEngine(dataset)
+    return stages
+
+def score_csv_file(input_path, output_path, dataset_path=DATASET_PATH, chunk_rows=10000, top_k=None):
+    """Stream input_path through the recommendation pipeline into output_path ('-' for stdout)"""
+    from pipeline import stream_scored_csv
+
+    # Status goes to stderr so the scored CSV can be piped from stdout
+    stages = load_scoring_stages(dataset_path)
+    if stages['model'] is None and stages['matcher'] is None:
+        print("❌ No model or dataset available to score with.", file=sys.stderr)
+        return False
+    if stages['model'] is None:
+        print("⚠️ ML model artifacts not found, scoring with the dataset fallbacks only.", file=sys.stderr)
+
+    done = {'rows': 0, 'seconds': 0.0}
+    def progress(rows, seconds):
+        done['rows'], done['seconds'] = rows, seconds
+        print(f"\r⏳ {rows} rows scored, {rows / seconds:.0f} rows/s", end='', file=sys.stderr, flush=True)
+
+    out = sys.stdout if output_path == '-' else open(output_path, 'w', newline='')
+    try:
+        for text in stream_scored_csv(input_path, chunk_rows=chunk_rows, progress=progress, top_k=top_k, **stages):
+            out.write(text)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    rows, seconds = done['rows'], done['seconds']
+    target = '' if output_path == '-' else f" -> {output_path}"
+    print(f"\n✅ Scored {rows} rows in {seconds:.1f}s ({rows / seconds if seconds else 0:.0f} rows/s){target}",
+          file=sys.stderr)
+    return True
+
+# ---------- STEP 5: Run Everything ----------
+def main():
+    parser = argparse.ArgumentParser(description="Train the fertilizer model and score soil tests")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    train = commands.add_parser('train', help='train the model on a fertilizer CSV dataset')
+    train.add_argument('--csv', default=DATASET_PATH, help='path to the fertilizer CSV dataset')
+    train.add_argument('--pipeline', choices=['numpy', 'tfdata'], default='numpy',
+                       help='numpy: in-memory arrays, batch size 32 (original settings); '
+                            'tfdata: streaming tf.data input that does not need the dataset in RAM')
+    train.add_argument('--batch-size', type=int, default=512, help='tfdata batch size')
+    train.add_argument('--epochs', type=int, default=100, help='tfdata maximum epochs (early stopping applies)')
+    train.add_argument('--learning-rate', type=float, default=0.003, help='tfdata initial learning rate (cosine decay)')
+    train.add_argument('--chunk-rows', type=int, default=100000, help='tfdata rows read from the CSV at a time')
+    train.add_argument('--report', help='write the timing and accuracy report to this JSON file')
+
+    search = commands.add_parser('search', help='k-fold hyperparameter search on a process pool')
+    search.add_argument('--csv', default=DATASET_PATH, help='path to the fertilizer CSV dataset')
+    search.add_argument('--trials', type=int, default=12, help='configurations to evaluate (the original one first)')
+    search.add_argument('--folds', type=int, default=5, help='stratified cross-validation folds')
+    search.add_argument('--workers', type=int, help='training processes (default: one per CPU)')
+    search.add_argument('--threads-per-worker', type=int, help='BLAS/OpenMP and TensorFlow threads per process (default: CPUs / workers)')
+    search.add_argument('--epochs', type=int, default=100, help='maximum epochs per fold (early stopping applies)')
+    search.add_argument('--seed', type=int, default=42)
+    search.add_argument('--log', default=SEARCH_LOG, help='JSONL trial log; an existing log is resumed')
+    search.add_argument('--no-export', action='store_true', help='do not retrain and export the best configuration')
+
+    distill = commands.add_parser('distill', help='distill the model into a fast decision-tree student')
+    distill.add_argument('--csv', default=DATASET_PATH, help='dataset the synthetic inputs are drawn around')
+    distill.add_argument('--out', default=STUDENT_PATH)
+    distill.add_argument('--max-depth', type=int, default=12)
+    distill.add_argument('--min-samples-leaf', type=int, default=5)
+    distill.add_argument('--synthetic', type=int, default=50000, help='jittered rows labeled by the model')
+    distill.add_argument('--seed', type=int, default=42)
+    distill.add_argument('--report', help='write the distillation report to this JSON file')
+
+    score = commands.add_parser('score', help='score a CSV of soil tests in constant memory')
+    score.add_argument('input', help='CSV with Temperature, Humidity, Moisture, Nitrogen, '
+                                     'Phosphorus, Potassium, Soil Type and Crop Type columns')
+    score.add_argument('-o', '--output', help="scored CSV path ('-' for stdout; default <input>_scored.csv)")
+    score.add_argument('--chunk-rows', type=int, default=10000, help='rows scored per chunk')
+    score.add_argument('--top-k', type=int, help='append the top-k fertilizers and their probabilities')
+    score.add_argument('--dataset', default=DATASET_PATH, help='dataset used for the exact/closest-match fallbacks')
+
+    recommend = commands.add_parser('recommend', help='recommend a fertilizer for one sample with the Keras model')
+    recommend.add_argument('--nitrogen', type=float, required=True)
+    recommend.add_argument('--phosphorus', type=float, required=True)
+    recommend.add_argument('--potassium', type=float, required=True)
+    recommend.add_argument('--moisture', type=float, required=True)
+    recommend.add_argument('--temperature', type=float, required=True)
+    recommend.add_argument('--humidity', type=float, required=True)
+    recommend.add_argument('--soil-type', required=True, help='e.g. Sandy, Loamy, Black')
+    recommend.add_argument('--crop-type', required=True, help='e.g. Rice, Wheat, Maize')
+
+    args = parser.parse_args()
+
+    if args.command == 'train':
+        # === 1. Load your dataset ===
+        if not os.path.exists(args.csv):
+            print("❌ Dataset file not found.")
+            sys.exit(1)
+
+        if args.pipeline == 'tfdata':
+            try:
+                model, report = train_streaming_model(
+                    args.csv, batch_size=args.batch_size, epochs=args.epochs,
+                    learning_rate=args.learning_rate, chunk_rows=args.chunk_rows)
+            except ValueError as e:
+                print(f"❌ Error loading dataset: {e}")
+                sys.exit(1)
+        else:
+            X, y_cat, input_dim, output_dim, preprocessor, fert_encoder, y_encoded, X_original = load_and_prepare_data(args.csv)
+
+            if X is None:  # Proceed only if data loaded successfully
+                sys.exit(1)
+
+            # Split dataset
+            X_train, X_test, y_train, y_test = train_test_split(
+                X, y_cat, test_size=0.2, random_state=42, stratify=y_encoded
+            )
+
+            # Train high-capacity hybrid model
+            model, report = train_hybrid_model(X_train, y_train, input_dim, output_dim)
+            X_test_reshaped = X_test.reshape((X_test.shape[0], 1, X_test.shape[1]))
+            report['holdout_accuracy'] = float(model.evaluate(X_test_reshaped, y_test, verbose=0)[1])
+
+        print(f"⏱️ {report['epochs']} epochs, {report['mean_epoch_seconds']}s per epoch, "
+              f"{report['total_seconds']}s total; holdout accuracy {report['holdout_accuracy']:.4f}")
+        if args.report:
+            with open(args.report, 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f"📝 Training report written to {args.report}")
+
+    elif args.command == 'search':
+        if not os.path.exists(args.csv):
+            print("❌ Dataset file not found.")
+            sys.exit(1)
+
+        summary = hyperparameter_search(args.csv, trials=args.trials, folds=args.folds, workers=args.workers,
+                                        threads_per_worker=args.threads_per_worker, epochs=args.epochs,
+                                        seed=args.seed, log_path=args.log)
+        print(f"\n🏆 {'mean acc':>9} {'std':>7}  configuration")
+        for result in summary:
+            print(f"   {result['mean_accuracy']:>9.4f} {result['std_accuracy']:>7.4f}  {json.dumps(result['config'])}")
+        if summary and not args.no_export:
+            export_best_config(args.csv, summary[0])
+
+    elif args.command == 'distill':
+        if not os.path.exists(args.csv):
+            print("❌ Dataset file not found.")
+            sys.exit(1)
+        try:
+            report = distill_student(args.csv, args.out, max_depth=args.max_depth,
+                                     min_samples_leaf=args.min_samples_leaf, synthetic=args.synthetic,
+                                     seed=args.seed)
+        except FileNotFoundError as e:
+            print(f"❌ Cannot distill: {e}")
+            sys.exit(1)
+
+        latency = report['latency']
+        print(f"✅ Student saved to {args.out}: {report['leaves']} leaves, "
+              f"{report['agreement']:.2%} agreement with the model on {report['test_rows']} held-out rows")
+        print(f"⏱️ Single-row latency: student {latency['student']['mean_us']} µs "
+              f"(p99 {latency['student']['p99_us']}), model {latency['teacher']['mean_us']} µs "
+              f"(p99 {latency['teacher']['p99_us']})")
+        print(f"   {'min confidence':>14} {'student share':>13} {'tiered agreement':>16}")
+        for threshold, result in report['thresholds'].items():
+            print(f"   {threshold:>13}% {result['student_share']:>13.2%} {result['tiered_agreement']:>16.2%}")
+        if args.report:
+            with open(args.report, 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f"📝 Distillation report written to {args.report}")
+
+    elif args.command == 'score':
+        if not os.path.exists(args.input):
+            print("❌ Input CSV not found.", file=sys.stderr)
+            sys.exit(1)
+        output = args.output or os.path.splitext(args.input)[0] + '_scored.csv'
+        try:
+            if not score_csv_file(args.input, output, args.dataset, args.chunk_rows, args.top_k):
+                sys.exit(1)
+        except ValueError as e:
+            print(f"❌ Invalid input CSV: {e}", file=sys.stderr)
+            sys.exit(1)
+
+    elif args.command == 'recommend':
+        # === 2. Recommend from command-line parameters ===
+        user_input = {
+            'Nitrogen': args.nitrogen,
+            'Phosphorus': args.phosphorus,
+            'Potassium': args.potassium,
+            'Moisture': args.moisture,
+            'Temperature': args.temperature,
+            'Humidity': args.humidity,
+            'Soil Type': args.soil_type,
+            'Crop Type': args.crop_type,
+        }
+        try:
+            preprocessor = joblib.load("preprocessor.pkl")
+            fert_encoder = joblib.load("fertilizer_encoder.pkl")
+            recommend_fertilizer(user_input, preprocessor, fert_encoder)
+        except Exception as e:
+            print(f"❌ Unexpected error: {e}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
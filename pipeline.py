@@ -0,0 +1,249 @@
+"""Vectorized recommendation pipeline for many input rows at once.
+
+Mirrors the single-row path in app.predict: the ML model answers every row when
+it is available, otherwise rows go through the exact-match index and then the
+closest-match engine. Each stage runs once over all of its rows.
+stream_scored_csv() applies the same pipeline to a CSV of any size, one chunk
+at a time.
+"""
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+from matching import NUMERIC_COLS
+
+logger = logging.getLogger(__name__)
+
+CATEGORICAL_COLS = ['Soil Type', 'Crop Type']
+# Rows read, scored and written per step of stream_scored_csv
+CSV_CHUNK_ROWS = 10000
+# Columns appended to every row of a scored CSV
+OUTPUT_COLS = ['Recommendation', 'Confidence', 'Method', 'Error']
+# Appended when top_k is requested: the ranked "name:probability" pairs
+TOP_K_COL = 'Top K'
+# Appended as well when the footprint is requested; 'area' and 'fertilizer_amount'
+# input columns are used when present
+FOOTPRINT_COLS = ['Footprint kg CO2e', 'Lowest Emission', 'Lowest Emission kg CO2e']
+
+
+def top_k_classes(probabilities, class_names, k=1):
+    """The k most probable classes of every row, most probable first.
+
+    The post-processing shared by the single-row, batch and CSV paths. Takes
+    (rows, classes) model output and the class-index-to-name array. Returns
+    (names, probabilities) arrays of shape (rows, k). With k under half the class
+    count, np.argpartition selects the k columns without sorting the rest. With a
+    handful of classes one stable sort per row is faster, so that is used instead.
+    Ties rank the lower class index first, so the first column matches np.argmax.
+    """
+    probabilities = np.asarray(probabilities)
+    n_classes = probabilities.shape[1]
+    k = max(1, min(int(k), n_classes))
+    if k == 1:
+        indices = np.argmax(probabilities, axis=1)[:, np.newaxis]
+    else:
+        if k < n_classes // 2:
+            # Class order inside the partition, so the stable sort below ranks ties by index
+            indices = np.sort(np.argpartition(-probabilities, k - 1, axis=1)[:, :k], axis=1)
+            selected = np.take_along_axis(probabilities, indices, axis=1)
+            order = np.argsort(-selected, axis=1, kind='stable')
+            indices = np.take_along_axis(indices, order, axis=1)
+        else:
+            indices = np.argsort(-probabilities, axis=1, kind='stable')[:, :k]
+    return class_names[indices], np.take_along_axis(probabilities, indices, axis=1)
+
+
+def predict_batch_with_ml_model(frame, model, encoder, class_names, k=1):
+    """Return the top-k (names, probabilities) for every row using the ML model"""
+    features = np.asarray(encoder.transform(frame), dtype=np.float32)
+    probabilities = model.predict(features.reshape((len(frame), 1, features.shape[1])), verbose=0)
+    return top_k_classes(probabilities, class_names, k)
+
+
+def score_batch(frame, model=None, encoder=None, class_names=None, exact_index=None, matcher=None,
+                top_k=None):
+    """Return recommendation, confidence and method arrays for every row of frame.
+
+    Rows no stage could answer keep a None recommendation. With top_k a fourth
+    item, the (names, probabilities) ranking of top_k_classes, is returned too.
+    Rows the model did not answer list only their recommendation, with a NaN
+    probability.
+    """
+    n_rows = len(frame)
+    recommendations = np.full(n_rows, None, dtype=object)
+    confidences = np.full(n_rows, np.nan)
+    methods = np.full(n_rows, None, dtype=object)
+    pending = np.ones(n_rows, dtype=bool)
+    k = max(1, min(top_k or 1, len(class_names) if class_names is not None else 1))
+    ranked_names = np.full((n_rows, k), None, dtype=object)
+    ranked_probabilities = np.full((n_rows, k), np.nan)
+
+    if n_rows and model is not None and encoder is not None and class_names is not None:
+        try:
+            names, probabilities = predict_batch_with_ml_model(frame, model, encoder, class_names, k)
+            ranked_names[:], ranked_probabilities[:] = names, probabilities
+            recommendations[:] = names[:, 0]
+            confidences[:] = probabilities[:, 0] * 100
+            methods[:] = 'ML Model'
+            pending[:] = False
+        except Exception as e:
+            logger.warning(f"Batch ML prediction failed: {str(e)}")
+
+    if pending.any() and exact_index is not None:
+        rows = np.flatnonzero(pending)
+        positions = exact_index.lookup_batch(frame.iloc[rows])
+        hits = positions >= 0
+        recommendations[rows[hits]] = exact_index.labels[positions[hits]]
+        confidences[rows[hits]] = 100.0
+        methods[rows[hits]] = 'Exact Match'
+        pending[rows[hits]] = False
+
+    if pending.any() and matcher is not None and len(matcher):
+        rows = np.flatnonzero(pending)
+        subset = frame.iloc[rows]
+        positions, scores = matcher.closest_batch(
+            subset[NUMERIC_COLS].to_numpy(dtype=np.float64),
+            subset['Soil Type'].tolist(), subset['Crop Type'].tolist())
+        recommendations[rows] = matcher.labels[positions]
+        # Cap confidence for fuzzy matches
+        confidences[rows] = np.minimum(scores * 100, 95.0)
+        methods[rows] = 'Closest Match'
+
+    if top_k:
+        # Dataset matches have no probabilities and rank their recommendation alone
+        matched = methods != 'ML Model'
+        ranked_names[matched, 0] = recommendations[matched]
+        return recommendations, confidences, methods, (ranked_names, ranked_probabilities)
+    return recommendations, confidences, methods
+
+
+def score_chunk(chunk, top_k=None, carbon_engine=None, **stages):
+    """Validate and score one CSV chunk, appending the OUTPUT_COLS columns in place.
+
+    With top_k the TOP_K_COL is appended, and with a carbon_engine the
+    FOOTPRINT_COLS as well.
+    """
+    frame = pd.DataFrame(index=chunk.index)
+    for col in NUMERIC_COLS:
+        frame[col] = pd.to_numeric(chunk[col], errors='coerce')
+    for col in CATEGORICAL_COLS:
+        frame[col] = chunk[col]
+
+    # Same requirements as app.parse_input_row, reported per row
+    errors = np.full(len(chunk), None, dtype=object)
+    bad_categorical = frame[CATEGORICAL_COLS].isna().any(axis=1).to_numpy()
+    bad_numeric = frame[NUMERIC_COLS].isna().any(axis=1).to_numpy()
+    errors[bad_categorical] = 'Missing soil or crop type'
+    errors[bad_numeric] = 'Invalid numeric value'
+    valid = np.flatnonzero(pd.isna(errors))
+
+    recommendations = np.full(len(chunk), None, dtype=object)
+    confidences = np.full(len(chunk), np.nan)
+    methods = np.full(len(chunk), None, dtype=object)
+    ranking = None
+    if len(valid):
+        subset = frame.iloc[valid]
+        subset = subset.astype({col: str for col in CATEGORICAL_COLS})
+        scored = score_batch(subset, top_k=top_k, **stages)
+        recommendations[valid], confidences[valid], methods[valid] = scored[:3]
+        ranking = scored[3] if top_k else None
+        unanswered = valid[pd.isna(recommendations[valid])]
+        errors[unanswered] = 'No suitable fertilizer recommendation found'
+
+    chunk['Recommendation'] = recommendations
+    chunk['Confidence'] = confidences
+    chunk['Method'] = methods
+    chunk['Error'] = errors
+    if top_k:
+        answered = pd.notna(recommendations[valid])
+        rows = valid[answered]
+        ranking = (ranking[0][answered], ranking[1][answered]) if ranking is not None else None
+        ranked = np.full(len(chunk), None, dtype=object)
+        if len(rows):
+            ranked[rows] = ranking_text(*ranking)
+        chunk[TOP_K_COL] = ranked
+        if carbon_engine is not None:
+            add_footprint_columns(chunk, rows, ranking, carbon_engine)
+    return chunk
+
+
+def ranking_text(names, probabilities):
+    """The TOP_K_COL value of every row: "name:probability" pairs joined by ';'"""
+    return [';'.join(f"{name}:{probability:.4g}" if probability == probability else name
+                     for name, probability in zip(row_names, row_probabilities) if name is not None)
+            for row_names, row_probabilities in zip(names.tolist(), probabilities.tolist())]
+
+
+def ranking_entries(names, probabilities):
+    """JSON-ready ranking of every row: lists of {'fertilizer', 'probability'}"""
+    return [[{'fertilizer': name, 'probability': probability if probability == probability else None}
+             for name, probability in zip(row_names, row_probabilities) if name is not None]
+            for row_names, row_probabilities in zip(names.tolist(), probabilities.tolist())]
+
+
+def add_footprint_columns(chunk, rows, ranking, carbon_engine):
+    """Append the FOOTPRINT_COLS for the answered rows of a scored chunk"""
+    footprints = np.full(len(chunk), np.nan)
+    lowest_names = np.full(len(chunk), None, dtype=object)
+    lowest_footprints = np.full(len(chunk), np.nan)
+    if len(rows):
+        comparison = carbon_engine.compare(
+            ranking[0], ranking[1],
+            area=footprint_input(chunk, 'area', rows, 1.0),
+            rate=footprint_input(chunk, 'fertilizer_amount', rows, np.nan))
+        footprints[rows] = comparison['kg_co2e'][:, 0]
+        positions = np.arange(len(rows))
+        has_lowest = comparison['lowest'] >= 0
+        lowest = np.maximum(comparison['lowest'], 0)
+        lowest_names[rows[has_lowest]] = comparison['names'][positions, lowest][has_lowest]
+        lowest_footprints[rows] = np.where(has_lowest, comparison['kg_co2e'][positions, lowest], np.nan)
+    chunk[FOOTPRINT_COLS[0]] = footprints
+    chunk[FOOTPRINT_COLS[1]] = lowest_names
+    chunk[FOOTPRINT_COLS[2]] = lowest_footprints
+
+
+def footprint_input(chunk, column, rows, default):
+    """Optional numeric input column for the footprint, default where absent or invalid"""
+    if column not in chunk.columns:
+        return np.full(len(rows), default)
+    values = pd.to_numeric(chunk[column].iloc[rows], errors='coerce').to_numpy(dtype=np.float64, copy=True)
+    values[~(values >= 0) | np.isinf(values)] = default
+    return values
+
+
+def check_columns(columns):
+    """Raise ValueError when a CSV header lacks a column the pipeline needs"""
+    missing = [col for col in NUMERIC_COLS + CATEGORICAL_COLS if col not in columns]
+    if missing:
+        raise ValueError(f"Missing required column(s): {', '.join(missing)}")
+
+
+def stream_scored_csv(source, chunk_rows=CSV_CHUNK_ROWS, progress=None, top_k=None, carbon_engine=None, **stages):
+    """Score a CSV file or stream chunk by chunk, yielding the scored CSV as text.
+
+    Only one chunk is held in memory at a time, so memory use does not grow with
+    the file. Input columns are passed through and OUTPUT_COLS appended, plus
+    TOP_K_COL with top_k and the FOOTPRINT_COLS with a carbon_engine. stages
+    are the score_batch keyword arguments; progress(rows, seconds) is called
+    after every chunk. Raises ValueError before yielding anything when a required
+    column is missing or the CSV has no header row. A CSV with a header and no data
+    rows yields the output header alone.
+    """
+    reader = pd.read_csv(source, chunksize=chunk_rows, dtype={col: str for col in CATEGORICAL_COLS})
+    start = time.perf_counter()
+    rows = 0
+    header = True
+    for chunk in reader:
+        if header:
+            check_columns(chunk.columns)
+        scored = score_chunk(chunk, top_k=top_k, carbon_engine=carbon_engine, **stages)
+        rows += len(scored)
+        yield scored.to_csv(index=False, header=header)
+        header = False
+        if progress is not None:
+            progress(rows, time.perf_counter() - start)
+    if header:
+        # A header-only CSV still comes through as one empty chunk
+        raise ValueError("The CSV has no header row")
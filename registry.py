@@ -0,0 +1,323 @@
+"""Versioned artifact registry with background reload and atomic swap.
+
+The registry serves one ArtifactSet at a time: the model, encoders and dataset
+indexes loaded from one version of the artifact files. A reload builds a complete
+new set on background threads, warms it up and publishes it with a single
+reference assignment. Requests pin the set they started on, so in-flight requests
+finish on the old version, and the old set is cleaned up when the last of them
+releases it.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime
+
+from inference import file_digest
+
+logger = logging.getLogger(__name__)
+
+
+def fingerprint(paths):
+    """(size, mtime_ns) of each file, None for files that do not exist"""
+    result = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            result[path] = (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            result[path] = None
+    return result
+
+
+def content_version(paths):
+    """Short digest of the names and contents of the files that exist"""
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        if os.path.exists(path):
+            digest.update(f"{os.path.basename(path)}:{file_digest(path)}\n".encode())
+    return digest.hexdigest()[:12]
+
+
+class ArtifactSet:
+    """One immutable version of the serving artifacts.
+
+    Components returned by the loaders are read as attributes (artifacts.model,
+    artifacts.df, ...); components no loader provided are None. A partial set is
+    published while the very first load is still running and owns nothing, so it
+    is never cleaned up.
+    """
+
+    def __init__(self, version, components, status=None, fingerprints=None, partial=False):
+        self.version = version
+        self.status = dict(status or {})
+        self.fingerprints = fingerprints or {}
+        self.partial = partial
+        self.loaded_at = time.time()
+
+        self._components = dict(components)
+        self._lock = threading.Lock()
+        self._users = 0
+        self._retired = False
+        self._closed = False
+        self._cleanup = None
+
+    def __getattr__(self, name):
+        components = self.__dict__.get('_components', {})
+        if name in components:
+            return components[name]
+        raise AttributeError(name)
+
+    def derive(self, partial=True, **overrides):
+        """Copy of this set with some components replaced (e.g. model=None).
+
+        The copy is partial unless partial=False, for a copy that replaces this set
+        as the served version and is cleaned up when retired.
+        """
+        return ArtifactSet(self.version, dict(self._components, **overrides), self.status,
+                           self.fingerprints, partial=partial)
+
+    @property
+    def ml_ready(self):
+        return bool(self.model and self.preprocessor and self.fertilizer_encoder)
+
+    def pin(self):
+        """Register a request using this set; False once it has been cleaned up"""
+        with self._lock:
+            if self._closed:
+                return False
+            self._users += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._users -= 1
+            close = self._retired and self._users == 0 and not self._closed
+            if close:
+                self._closed = True
+        if close:
+            self._close()
+
+    def retire(self, cleanup=None):
+        """Mark the set replaced; cleanup runs once no request is using it"""
+        with self._lock:
+            self._retired = True
+            self._cleanup = None if self.partial else cleanup
+            close = self._users == 0 and not self._closed
+            if close:
+                self._closed = True
+        if close:
+            self._close()
+
+    def _close(self):
+        if self._cleanup is not None:
+            try:
+                self._cleanup(self)
+            except Exception as e:
+                logger.warning(f"Cleanup of artifact version {self.version} failed: {str(e)}")
+
+
+class ArtifactRegistry:
+    """Loads, versions and hot-swaps the artifact set.
+
+    loaders maps an artifact name to a callable returning a dict of components,
+    or None when the artifact is missing. warmup(artifact_set) runs before a set
+    takes traffic and raises to reject it; cleanup(artifact_set) frees a retired
+    set; on_swap(artifact_set) runs after each new version is published.
+    """
+
+    def __init__(self, loaders, watch_paths, components, warmup=None, cleanup=None, on_swap=None):
+        self.loaders = loaders
+        self.watch_paths = list(watch_paths)
+        self.components = tuple(components)
+        self.warmup = warmup
+        self.cleanup = cleanup
+        self.on_swap = on_swap
+
+        self.current = ArtifactSet(None, dict.fromkeys(self.components), partial=True)
+        self.ready = threading.Event()
+
+        # State of the latest load, for the readiness probe
+        self.status = {}
+        self.loading = False
+        self.load_started_at = None
+        self.load_finished_at = None
+        # Seconds each loader took in the latest load
+        self.loader_seconds = {}
+
+        self.reloads = 0
+        self.failed_reloads = 0
+        self.last_error = None
+
+        self._reload_lock = threading.Lock()
+        self._attempted = None
+        self._watcher = None
+        self._stop = threading.Event()
+
+    @contextmanager
+    def acquire(self):
+        """Pin the current set for the duration of a request"""
+        while True:
+            artifact_set = self.current
+            if artifact_set.pin():
+                break
+        try:
+            yield artifact_set
+        finally:
+            artifact_set.release()
+
+    def load(self, background=False, force=False):
+        """Load a new artifact set and swap it in.
+
+        Returns 'swapped', 'unchanged' (same file contents as the current set),
+        'rejected' (a loader or the warm-up failed; the current set keeps serving)
+        or 'busy' when another load is running. With background=True it returns
+        'started' at once.
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            return 'busy'
+        if background:
+            threading.Thread(target=self._load_and_unlock, args=(force,),
+                             name='artifact-reload', daemon=True).start()
+            return 'started'
+        return self._load_and_unlock(force)
+
+    def _load_and_unlock(self, force):
+        try:
+            return self._load(force)
+        except Exception as e:
+            self.failed_reloads += 1
+            self.last_error = str(e)
+            logger.error(f"Artifact reload failed: {str(e)}")
+            return 'rejected'
+        finally:
+            if self.loading:
+                self.loading = False
+                self.load_finished_at = time.time()
+            # Even a failed first load leaves the app serving whatever it has
+            self.ready.set()
+            self._reload_lock.release()
+
+    def _load(self, force):
+        initial = self.current.version is None
+        fingerprints = fingerprint(self.watch_paths)
+        self._attempted = fingerprints
+        version = content_version(self.watch_paths)
+        if not force and version == self.current.version:
+            logger.info(f"Artifacts unchanged at version {version}, nothing to reload")
+            return 'unchanged'
+
+        self.loading = True
+        self.load_started_at = time.time()
+        self.load_finished_at = None
+        status = {name: 'pending' for name in self.loaders}
+        self.status = status
+        components = dict.fromkeys(self.components)
+
+        with ThreadPoolExecutor(max_workers=len(self.loaders), thread_name_prefix='artifact-loader') as executor:
+            futures = {executor.submit(self._run_loader, name, loader, status): name
+                       for name, loader in self.loaders.items()}
+            for future in as_completed(futures):
+                loaded = future.result()
+                if loaded:
+                    components.update(loaded)
+                if initial:
+                    # Serve whatever has loaded so far (e.g. the dataset fallbacks
+                    # while the model is still loading) until the first version is ready
+                    self._publish(ArtifactSet(None, components, status, partial=True))
+
+        new_set = ArtifactSet(version, components, status, fingerprints)
+        failed = [name for name, state in status.items() if state == 'failed']
+        try:
+            if failed and not initial:
+                raise RuntimeError(f"could not load {', '.join(failed)}")
+            if self.warmup is not None:
+                self.warmup(new_set)
+        except Exception as e:
+            if not initial:
+                self.failed_reloads += 1
+                self.last_error = str(e)
+                logger.error(f"Rejected artifact version {version}, keeping {self.current.version}: {str(e)}")
+                new_set.retire(self.cleanup)
+                return 'rejected'
+            # Nothing older to fall back to; serve what loaded
+            logger.warning(f"Artifact warm-up failed: {str(e)}")
+
+        previous = self._publish(new_set)
+        if not initial:
+            self.reloads += 1
+        self.last_error = None
+        if self.on_swap is not None:
+            self.on_swap(new_set)
+        logger.info(f"Serving artifact version {version} (was {previous.version}), "
+                    f"loaded in {time.time() - self.load_started_at:.2f}s: {status}")
+        return 'swapped'
+
+    def _run_loader(self, name, loader, status):
+        status[name] = 'loading'
+        start = time.perf_counter()
+        try:
+            loaded = loader()
+            status[name] = 'loaded' if loaded else 'missing'
+            return loaded
+        except Exception as e:
+            status[name] = 'failed'
+            logger.error(f"Error loading {name}: {str(e)}")
+            return None
+        finally:
+            self.loader_seconds[name] = time.perf_counter() - start
+
+    def _publish(self, artifact_set):
+        previous, self.current = self.current, artifact_set
+        previous.retire(self.cleanup)
+        return previous
+
+    def changed_files(self):
+        """Fingerprints of the artifact files if they differ from the served and the
+        last attempted version, otherwise None"""
+        seen = fingerprint(self.watch_paths)
+        if seen == self.current.fingerprints or seen == self._attempted:
+            return None
+        return seen
+
+    def watch(self, interval):
+        """Poll the artifact files and reload once a change has settled"""
+        if self._watcher is not None:
+            return
+
+        def run():
+            pending = None
+            while not self._stop.wait(interval):
+                seen = self.changed_files()
+                if seen is None:
+                    pending = None
+                    continue
+                if seen != pending:
+                    # Wait one more interval in case the files are still being written
+                    pending = seen
+                    continue
+                pending = None
+                logger.info("Artifact files changed, reloading")
+                self.load()
+
+        self._watcher = threading.Thread(target=run, name='artifact-watcher', daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        """Version and reload counters for /api/stats"""
+        current = self.current
+        return {
+            'version': current.version,
+            'loaded_at': datetime.fromtimestamp(current.loaded_at).isoformat() if current.version else None,
+            'reloading': self.loading and current.version is not None,
+            'reloads': self.reloads,
+            'failed_reloads': self.failed_reloads,
+            'last_error': self.last_error,
+            'watching': self._watcher is not None,
+        }
@@ -0,0 +1,331 @@
+"""Pre-forking production server for AgroSmart.
+
+The master process imports app.py and loads every artifact once, then forks the
+workers. The dataset cache and the recommendation grid are memory-mapped, and the
+model weights, encoders and match indexes are NumPy arrays, so the workers share
+them copy-on-write with the master. The master's heap is frozen out of the garbage
+collector before forking, so collections in the workers do not write to (and copy)
+the shared pages. Each worker serves the shared listening socket with a threaded
+WSGI server, and the BLAS/OpenMP/TensorFlow thread pools are capped at CPUs /
+workers so the processes do not oversubscribe the cores.
+
+Signals to the master:
+    TERM, INT  graceful shutdown: workers stop accepting and finish their requests
+    HUP        reload changed artifacts in the master, then replace every worker
+A worker that has served --max-requests requests is replaced the same way.
+
+Artifact reloads always go through the master, so all workers serve one version
+and keep sharing it: POST /api/admin/reload in a worker sends the master a HUP
+(its force and wait options do not apply), workers run no file watcher, and with
+AGROSMART_WATCH_INTERVAL set the master polls the files itself and reloads once a
+change has settled.
+
+Usage:
+    python serve.py [--workers N] [--bind 0.0.0.0:5000] [--max-requests 10000] [--graceful-timeout 30]
+"""
+import argparse
+import gc
+import logging
+import os
+import random
+import signal
+import socket
+import sys
+import threading
+import time
+
+logger = logging.getLogger('serve')
+
+# Thread-pool sizes the math libraries read when NumPy is first imported
+BLAS_THREAD_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                    'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS')
+# Seconds between the master's checks on its workers
+MONITOR_INTERVAL = 0.2
+# Workers dying sooner than this after their start are respawned after a pause,
+# so a broken deployment does not fork in a tight loop
+MIN_WORKER_SECONDS = 1.0
+RESPAWN_PAUSE_SECONDS = 1.0
+
+
+def available_cpus():
+    """CPUs this process may run on"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def limit_threads(threads):
+    """Cap the math libraries' thread pools; must run before NumPy is imported.
+
+    Variables already set in the environment are left alone.
+    """
+    for name in BLAS_THREAD_VARS:
+        os.environ.setdefault(name, str(threads))
+    os.environ.setdefault('TF_NUM_INTRAOP_THREADS', str(threads))
+    os.environ.setdefault('TF_NUM_INTEROP_THREADS', '1')
+
+
+def parse_bind(value):
+    """'host:port' (or ':port') as a (host, port) tuple"""
+    host, _, port = value.rpartition(':')
+    return host.strip('[]') or '0.0.0.0', int(port)
+
+
+def create_listener(host, port, backlog=2048):
+    """Listening socket the workers inherit across fork()"""
+    listener = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(backlog)
+    return listener
+
+
+def freeze_heap():
+    """Move every object allocated so far out of the garbage collector's reach"""
+    gc.collect()
+    gc.freeze()
+
+
+class Worker:
+    """One forked process serving the app on the shared listening socket.
+
+    Counts requests (including streamed bodies until they are closed), so that a
+    stop waits for the in-flight ones before the worker's threads are shut down.
+    """
+
+    def __init__(self, agrosmart, listener, max_requests=0, graceful_timeout=30.0):
+        self.agrosmart = agrosmart
+        self.listener = listener
+        self.max_requests = max_requests
+        self.graceful_timeout = graceful_timeout
+        self.server = None
+        self.served = 0
+        self.active = 0
+
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._stopping = False
+
+    def __call__(self, environ, start_response):
+        from werkzeug.wsgi import ClosingIterator
+
+        with self._lock:
+            self.active += 1
+            self.served += 1
+            recycle = self.max_requests and self.served == self.max_requests
+        if recycle:
+            self.stop(f"served {self.served} requests")
+        try:
+            body = self.agrosmart.app(environ, start_response)
+        except BaseException:
+            self._finished()
+            raise
+        return ClosingIterator(body, self._finished)
+
+    def _finished(self):
+        with self._idle:
+            self.active -= 1
+            if self.active == 0:
+                self._idle.notify_all()
+
+    def stop(self, reason):
+        """Stop accepting connections; run() then drains the requests and returns"""
+        with self._lock:
+            if self._stopping:
+                return
+            self._stopping = True
+        logger.info(f"Worker stopping ({reason})")
+        if self.server is not None:
+            # shutdown() waits for serve_forever() to return, so it cannot run on its thread
+            threading.Thread(target=self.server.shutdown, name='worker-shutdown', daemon=True).start()
+
+    def run(self):
+        from werkzeug.serving import make_server
+
+        # The master handles Ctrl-C and HUP for the whole process group; a TERM
+        # before the server is up needs no draining
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        self.agrosmart.init_worker()
+        host, port = self.listener.getsockname()[:2]
+        self.server = make_server(host, port, self, threaded=True, fd=self.listener.fileno())
+        self.listener.close()
+        signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(
+            target=self.stop, args=('terminated',), daemon=True).start())
+        if not self._stopping:
+            self.server.serve_forever()
+
+        with self._idle:
+            drained = self._idle.wait_for(lambda: self.active == 0, self.graceful_timeout)
+        if not drained:
+            logger.warning(f"Worker exiting with {self.active} requests still running")
+        self.agrosmart.close_worker()
+        logger.info(f"Worker exited after {self.served} requests")
+
+
+class Master:
+    """Forks the workers, replaces those that exit, and relays reloads and shutdowns"""
+
+    def __init__(self, agrosmart, listener, workers, max_requests=0, max_requests_jitter=0,
+                 graceful_timeout=30.0):
+        self.agrosmart = agrosmart
+        self.listener = listener
+        self.size = workers
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+
+        self.workers = {}
+        self.retiring = set()
+        self._signals = []
+        self._respawn_at = 0.0
+        self._next_watch = time.monotonic() + agrosmart.WATCH_INTERVAL
+        self._pending_change = None
+
+    def run(self):
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(signum, lambda signum, frame: self._signals.append(signum))
+        if threading.active_count() > 1:
+            logger.warning(f"Forking with threads running in the master: "
+                           f"{[thread.name for thread in threading.enumerate()]}")
+        if 'tensorflow' in sys.modules:
+            logger.warning("TensorFlow was imported before forking and is not fork-safe; "
+                           "serve the NumPy weights (.npz) instead")
+        freeze_heap()
+
+        while True:
+            self.reap()
+            while self._signals:
+                signum = self._signals.pop(0)
+                if signum == signal.SIGHUP:
+                    self.reload()
+                else:
+                    self.shutdown()
+                    return
+            if self.agrosmart.WATCH_INTERVAL > 0 and time.monotonic() >= self._next_watch:
+                self._next_watch = time.monotonic() + self.agrosmart.WATCH_INTERVAL
+                self.watch()
+            if time.monotonic() >= self._respawn_at:
+                while len(self.workers) - len(self.retiring) < self.size:
+                    self.spawn()
+            time.sleep(MONITOR_INTERVAL)
+
+    def spawn(self):
+        # Jitter is drawn here: a child's random state would be a copy of the master's
+        max_requests = self.max_requests
+        if max_requests and self.max_requests_jitter:
+            max_requests += random.randint(0, self.max_requests_jitter)
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                Worker(self.agrosmart, self.listener, max_requests, self.graceful_timeout).run()
+            except BaseException:
+                logger.exception("Worker failed")
+                status = 1
+            finally:
+                logging.shutdown()
+                os._exit(status)
+        self.workers[pid] = time.monotonic()
+        logger.info(f"Started worker {pid}")
+
+    def reap(self):
+        """Collect exited workers"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            started = self.workers.pop(pid, None)
+            code = os.waitstatus_to_exitcode(status)
+            if pid in self.retiring:
+                self.retiring.discard(pid)
+            elif code != 0:
+                logger.warning(f"Worker {pid} died with exit code {code}")
+                if started is not None and time.monotonic() - started < MIN_WORKER_SECONDS:
+                    self._respawn_at = time.monotonic() + RESPAWN_PAUSE_SECONDS
+
+    def retire(self, pid):
+        self.retiring.add(pid)
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    def watch(self):
+        """Reload once the artifact files have changed and stayed the same for one interval"""
+        seen = self.agrosmart.registry.changed_files()
+        if seen is None or seen != self._pending_change:
+            self._pending_change = seen
+            return
+        self._pending_change = None
+        logger.info("Artifact files changed, reloading")
+        self.reload(replace_unchanged=False)
+
+    def reload(self, replace_unchanged=True):
+        """Load changed artifacts here, then replace the workers one at a time"""
+        gc.unfreeze()
+        result = self.agrosmart.registry.load()
+        freeze_heap()
+        logger.info(f"Artifact reload: {result}, serving version {self.agrosmart.registry.current.version}")
+        if result != 'swapped' and not replace_unchanged:
+            return
+        for pid in [pid for pid in self.workers if pid not in self.retiring]:
+            # The replacement is up before the old worker stops accepting
+            self.spawn()
+            self.retire(pid)
+
+    def shutdown(self):
+        logger.info(f"Shutting down {len(self.workers)} workers")
+        for pid in list(self.workers):
+            self.retire(pid)
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(MONITOR_INTERVAL)
+        for pid in self.workers:
+            logger.warning(f"Killing worker {pid}, it did not stop in time")
+            os.kill(pid, signal.SIGKILL)
+        self.listener.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve AgroSmart with pre-forked worker processes")
+    parser.add_argument('--workers', type=int, default=available_cpus(), help='worker processes (default: one per CPU)')
+    parser.add_argument('--bind', default='0.0.0.0:5000', help='host:port to listen on')
+    parser.add_argument('--threads-per-worker', type=int,
+                        help='BLAS/OpenMP/TensorFlow threads per worker (default: CPUs / workers)')
+    parser.add_argument('--max-requests', type=int, default=0,
+                        help='replace a worker after this many requests (0: never)')
+    parser.add_argument('--max-requests-jitter', type=int, default=0,
+                        help='add up to this many requests per worker, so they are not replaced at once')
+    parser.add_argument('--graceful-timeout', type=float, default=30.0,
+                        help='seconds a stopping worker waits for its running requests')
+    parser.add_argument('--log-level', default='info', choices=['debug', 'info', 'warning', 'error'])
+    parser.add_argument('--no-access-log', action='store_true', help='do not log every request')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level.upper(), format='%(asctime)s [%(process)d] %(levelname)s %(name)s: %(message)s')
+    if args.no_access_log:
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    threads = args.threads_per_worker or max(1, available_cpus() // args.workers)
+    limit_threads(threads)
+    os.environ['AGROSMART_PREFORK'] = '1'
+
+    # Bound before the artifacts load, so a port already in use fails at once
+    listener = create_listener(*parse_bind(args.bind))
+    start = time.perf_counter()
+    import app as agrosmart
+    logger.info(f"Loaded artifact version {agrosmart.registry.current.version} in "
+                f"{time.perf_counter() - start:.1f}s; serving {args.bind} with "
+                f"{args.workers} workers x {threads} threads")
+    Master(agrosmart, listener, args.workers, args.max_requests, args.max_requests_jitter,
+           args.graceful_timeout).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -173,7 +173,7 @@ class AgroSmart {
     async handleFertilizerRecommendation(event) {
         event.preventDefault();
         
-        const formData = this.getFormData(event.target);
+        const { compareFootprint, ...formData } = this.getFormData(event.target);
         const resultBox = document.getElementById('result');
         const submitBtn = event.target.querySelector('.submit-btn');
 
@@ -187,10 +187,12 @@ class AgroSmart {
         this.showResult(resultBox, 'Analyzing soil parameters and generating recommendation...', 'loading');
 
         try {
+            // Asked for, the footprint of the recommendation and its alternatives comes back
+            // in the same call; plain requests stay eligible for the cache and the grid
             const response = await fetch('/predict', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify(formData)
+                body: JSON.stringify(compareFootprint ? { ...formData, footprint: true } : formData)
             });
 
             const result = await response.json();
@@ -205,7 +207,8 @@ class AgroSmart {
                     timestamp: new Date().toISOString(),
                     inputs: formData,
                     fertilizer: result.recommendation,
-                    confidence: result.confidence || 100
+                    confidence: result.confidence || 100,
+                    footprint: result.footprint
                 };
 
                 this.saveRecommendation(recommendation);
@@ -232,9 +235,17 @@ class AgroSmart {
         this.showResult(resultBox, 'Calculating carbon footprint...', 'loading');
 
         try {
-            // Calculate carbon footprint based on fertilizer usage
-            const carbonData = this.calculateCarbonFootprint(formData);
-            this.displayCarbonFootprint(resultBox, carbonData);
+            // The server applies the per-fertilizer emission factors
+            const response = await fetch('/api/carbon-footprint', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ ...formData, details: false })
+            });
+            const result = await response.json();
+            if (!response.ok) {
+                throw new Error(result.error || 'Could not calculate the carbon footprint');
+            }
+            this.displayCarbonFootprint(resultBox, result.summary);
         } catch (error) {
             this.showError(resultBox, error.message);
         } finally {
@@ -249,6 +260,8 @@ class AgroSmart {
         inputs.forEach(input => {
             if (input.type === 'number') {
                 formData[input.id] = parseFloat(input.value) || 0;
+            } else if (input.type === 'checkbox') {
+                formData[input.id] = input.checked;
             } else {
                 formData[input.id] = input.value;
             }
@@ -274,7 +287,12 @@ class AgroSmart {
     }
 
     displayRecommendation(container, recommendation) {
-        const { fertilizer, confidence, inputs } = recommendation;
+        const { fertilizer, confidence, inputs, footprint } = recommendation;
+        const lowest = footprint && footprint.lowest_emission;
+        const footprintHtml = footprint && footprint.recommended.kg_co2e !== null ? `
+                        <p><small>Footprint: ${footprint.recommended.kg_co2e.toFixed(1)} kg CO₂e per hectare</small></p>
+                        ${lowest && lowest.fertilizer !== fertilizer ? `<p><small>Lower-emission alternative: <strong>${lowest.fertilizer}</strong>
+                            (${lowest.kg_co2e.toFixed(1)} kg CO₂e/ha, ${(lowest.probability * 100).toFixed(1)}% model probability)</small></p>` : ''}` : '';
         
         container.innerHTML = `
             <div class="result-content">
@@ -288,7 +306,7 @@ class AgroSmart {
                     </div>
                     <div class="recommendation-details mt-2">
                         <p><small>Based on: ${inputs['Soil Type']} soil, ${inputs['Crop Type']} crop</small></p>
-                        <p><small>NPK: ${inputs.Nitrogen}:${inputs.Phosphorus}:${inputs.Potassium}</small></p>
+                        <p><small>NPK: ${inputs.Nitrogen}:${inputs.Phosphorus}:${inputs.Potassium}</small></p>${footprintHtml}
                     </div>
                 </div>
             </div>
@@ -298,40 +316,25 @@ class AgroSmart {
         container.className = 'result success';
     }
 
-    calculateCarbonFootprint(data) {
-        // Simplified carbon footprint calculation
-        // Real implementation would use complex agricultural models
-        const baseEmission = 2.5; // kg CO2 per kg fertilizer
-        const fertilizerAmount = (data.area || 1) * 0.1; // Estimated fertilizer per hectare
-        
-        const totalEmission = fertilizerAmount * baseEmission;
-        const treesToOffset = Math.ceil(totalEmission / 22); // 22kg CO2 per tree per year
-        
-        return {
-            totalEmission: totalEmission.toFixed(2),
-            fertilizerAmount: fertilizerAmount.toFixed(2),
-            treesToOffset,
-            recommendations: [
-                'Consider organic fertilizers to reduce emissions',
-                'Implement precision agriculture techniques',
-                'Use cover crops to improve soil health'
-            ]
-        };
-    }
-
     displayCarbonFootprint(container, data) {
         container.innerHTML = `
             <div class="result-content">
                 <div class="fertilizer-icon">🌍</div>
                 <div class="result-text">
                     <h3>Carbon Footprint Analysis</h3>
-                    <p><strong>Estimated CO₂ Emission:</strong> ${data.totalEmission} kg</p>
-                    <p><strong>Fertilizer Usage:</strong> ${data.fertilizerAmount} kg</p>
-                    <p><strong>Trees to Offset:</strong> ${data.treesToOffset} trees/year</p>
+                    <p><strong>Estimated CO₂ Emission:</strong> ${data.total_kg_co2e.toFixed(2)} kg CO₂e</p>
+                    <p><small>Fertilizer production ${data.production_kg_co2e.toFixed(1)} kg,
+                        field N₂O/CO₂ ${data.field_kg_co2e.toFixed(1)} kg,
+                        machinery ${data.machinery_kg_co2e.toFixed(1)} kg,
+                        transport ${data.transport_kg_co2e.toFixed(1)} kg</small></p>
+                    <p><strong>Fertilizer Usage:</strong> ${data.fertilizer_kg.toFixed(2)} kg</p>
+                    <p><strong>Trees to Offset:</strong> ${data.trees_to_offset} trees/year</p>
                     <div class="mt-2">
                         <h4>Recommendations:</h4>
                         <ul>
-                            ${data.recommendations.map(rec => `<li>${rec}</li>`).join('')}
+                            <li>Consider organic fertilizers to reduce emissions</li>
+                            <li>Implement precision agriculture techniques</li>
+                            <li>Use cover crops to improve soil health</li>
                         </ul>
                     </div>
                 </div>
@@ -350,11 +353,24 @@ class AgroSmart {
         localStorage.setItem('agrosmartHistory', JSON.stringify(this.recommendations));
     }
 
-    loadHistory() {
+    async loadHistory(cursor = null) {
         const historyContainer = document.getElementById('historyContainer');
-        if (historyContainer) {
-            this.updateHistory();
+        if (!historyContainer) return;
+
+        // Server-side history follows the user across devices; localStorage is the offline fallback
+        try {
+            const params = new URLSearchParams({ limit: 10 });
+            if (cursor) params.set('cursor', cursor);
+            const response = await fetch(`/api/history?${params}`);
+            if (!response.ok) throw new Error('History unavailable');
+
+            const page = await response.json();
+            this.recommendations = cursor ? this.recommendations.concat(page.items) : page.items;
+            this.nextCursor = page.next_cursor;
+        } catch (error) {
+            this.nextCursor = null;
         }
+        this.updateHistory();
     }
 
     updateHistory() {
@@ -366,7 +382,8 @@ class AgroSmart {
             return;
         }
 
-        const historyHTML = this.recommendations.slice(0, 10).map(rec => {
+        const shown = this.nextCursor === undefined ? this.recommendations.slice(0, 10) : this.recommendations;
+        const historyHTML = shown.map(rec => {
             const date = new Date(rec.timestamp).toLocaleDateString();
             const time = new Date(rec.timestamp).toLocaleTimeString([], {hour: '2-digit', minute:'2-digit'});
             
@@ -385,12 +402,22 @@ class AgroSmart {
         }).join('');
 
         historyContainer.innerHTML = historyHTML;
+
+        if (this.nextCursor) {
+            const moreBtn = document.createElement('button');
+            moreBtn.className = 'submit-btn';
+            moreBtn.textContent = 'Load more';
+            moreBtn.addEventListener('click', () => this.loadHistory(this.nextCursor));
+            historyContainer.appendChild(moreBtn);
+        }
     }
 
     clearHistory() {
         if (confirm('Are you sure you want to clear all recommendation history?')) {
             this.recommendations = [];
+            this.nextCursor = null;
             localStorage.removeItem('agrosmartHistory');
+            fetch('/api/history', { method: 'DELETE' }).catch(() => {});
             this.updateHistory();
             this.showToast('History cleared successfully', 'success');
         }